@@ -4,7 +4,7 @@ from types import ModuleType
 
 from openadapt.config import config
 
-from . import prompt, replicate, som, ultralytics
+from . import local_segmentation, prompt, replicate, som, ultralytics
 
 
 # TODO: remove
@@ -28,7 +28,16 @@ def get_default_segmentation_adapter() -> ModuleType:
         "som": som,
         "replicate": replicate,
         "ultralytics": ultralytics,
+        "local": local_segmentation,
     }[config.DEFAULT_SEGMENTATION_ADAPTER]
 
 
-__all__ = ["anthropic", "openai", "replicate", "som", "ultralytics", "google"]
+__all__ = [
+    "anthropic",
+    "openai",
+    "replicate",
+    "som",
+    "ultralytics",
+    "google",
+    "local_segmentation",
+]
@@ -0,0 +1,505 @@
+"""Segmentation adapter using a local FastSAM service.
+
+Loading a segmentation model takes longer than running it, so instead of loading a
+model per call, a service process keeps the models it has loaded warm on the CPU and
+segments batches of images sent over a local socket. Images are downscaled so that
+their longest side is at most config.LOCAL_SEGMENTATION_MAX_SIDE before inference,
+and the masks are upscaled back to the size of each image.
+
+The service is started on first use if it is not already running, and reports the
+latency of each request. Model names may also be the paths of models exported with
+ultralytics, e.g. to ONNX.
+
+Usage:
+
+    $ python -m openadapt.adapters.local_segmentation serve
+    $ python -m openadapt.adapters.local_segmentation segment <image_path>
+"""
+
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Any
+import json
+import subprocess
+import sys
+import threading
+import time
+
+from PIL import Image
+import numpy as np
+
+from openadapt.build_utils import redirect_stdout_stderr
+from openadapt.custom_logger import logger
+
+with redirect_stdout_stderr():
+    import fire
+
+from openadapt.config import config
+
+HOST = "127.0.0.1"
+# the size of the blank image used to warm up newly loaded models
+WARMUP_IMAGE_SIZE = (64, 64)
+# models expect image sides to be multiples of their stride
+MODEL_STRIDE = 32
+# labels are multiplied by this odd number modulo 2**24 to get distinct colors that
+# are far apart for consecutive labels
+LABEL_COLOR_MULTIPLIER = 0x9E3779
+START_TIMEOUT_SECONDS = 120
+START_POLL_INTERVAL_SECONDS = 0.5
+
+
+def _send(conn: Connection, header: dict, images: list[Image.Image]) -> None:
+    """Send a JSON header followed by the raw RGB data of each image."""
+    header = dict(header, sizes=[image.size for image in images])
+    conn.send_bytes(json.dumps(header).encode())
+    for image in images:
+        conn.send_bytes(image.convert("RGB").tobytes())
+
+
+def _recv(conn: Connection) -> tuple[dict, list[Image.Image]]:
+    """Receive a header and images sent with _send."""
+    header = json.loads(conn.recv_bytes())
+    images = [
+        Image.frombytes("RGB", tuple(size), conn.recv_bytes())
+        for size in header["sizes"]
+    ]
+    return header, images
+
+
+def get_inference_size(size: tuple[int, int], max_side: int) -> tuple[int, int]:
+    """Get the size at which to segment an image.
+
+    Args:
+        size: The width and height of the image.
+        max_side: The maximum length of the longest side, or 0 to not downscale.
+
+    Returns:
+        tuple[int, int]: The width and height of the downscaled image.
+    """
+    if not max_side or max(size) <= max_side:
+        return size
+    scale = max_side / max(size)
+    return tuple(max(1, round(side * scale)) for side in size)
+
+
+def get_segmented_image(masks: np.ndarray, size: tuple[int, int]) -> Image.Image:
+    """Color each mask distinctly, upscaling the result to the given size.
+
+    Larger masks are painted first, so that masks contained in others stay visible.
+
+    Args:
+        masks: The boolean masks, of shape (num_masks, height, width).
+        size: The width and height of the segmented image.
+
+    Returns:
+        Image.Image: The segmented image, with a black background.
+    """
+    num_masks, height, width = masks.shape
+    labels = np.zeros((height, width), dtype=np.uint32)
+    areas = masks.reshape(num_masks, -1).sum(axis=1)
+    for label, mask_idx in enumerate(np.argsort(-areas, kind="stable"), 1):
+        labels[masks[mask_idx]] = label
+    colors = (labels * LABEL_COLOR_MULTIPLIER) & 0xFFFFFF
+    segmented_array = np.stack(
+        [colors >> 16, (colors >> 8) & 0xFF, colors & 0xFF], axis=-1
+    ).astype(np.uint8)
+    segmented_image = Image.fromarray(segmented_array)
+    if segmented_image.size != tuple(size):
+        segmented_image = segmented_image.resize(size, Image.NEAREST)
+    return segmented_image
+
+
+class ModelPool:
+    """Segmentation models kept loaded on a device.
+
+    Attributes:
+        device: The device on which to run the models.
+        models: The loaded models, by name.
+    """
+
+    def __init__(self, device: str = "cpu") -> None:
+        """Initialize an empty pool.
+
+        Args:
+            device: The device on which to run the models.
+        """
+        self.device = device
+        self.models = {}
+
+    def get_model(self, model_name: str) -> Any:
+        """Get a model, loading and warming it up if it is not in the pool.
+
+        Args:
+            model_name: The name or path of the FastSAM model.
+
+        Returns:
+            ultralytics.FastSAM: The model.
+        """
+        if model_name not in self.models:
+            from ultralytics import FastSAM
+
+            start_time = time.perf_counter()
+            model = FastSAM(model_name)
+            model(
+                Image.new("RGB", WARMUP_IMAGE_SIZE),
+                device=self.device,
+                imgsz=MODEL_STRIDE * 2,
+                verbose=False,
+            )
+            self.models[model_name] = model
+            duration = time.perf_counter() - start_time
+            logger.info(f"loaded {model_name=} {self.device=} {duration=:.2f}")
+        return self.models[model_name]
+
+    def predict(
+        self,
+        images: list[Image.Image],
+        model_name: str,
+        min_confidence_threshold: float = 0.4,
+        max_iou_threshold: float = 0.9,
+        max_det: int = 1000,
+    ) -> list[np.ndarray]:
+        """Predict the masks of a batch of images.
+
+        Args:
+            images: The images to segment.
+            model_name: The name or path of the FastSAM model.
+            min_confidence_threshold: The minimum confidence of a mask.
+            max_iou_threshold: The IoU above which overlapping masks are suppressed.
+            max_det: The maximum number of masks per image.
+
+        Returns:
+            list[np.ndarray]: The boolean masks of each image, of shape
+                (num_masks, height, width).
+        """
+        model = self.get_model(model_name)
+        max_side = max(max(image.size) for image in images)
+        results = model(
+            images,
+            device=self.device,
+            retina_masks=True,
+            imgsz=-(-max_side // MODEL_STRIDE) * MODEL_STRIDE,
+            conf=min_confidence_threshold,
+            iou=max_iou_threshold,
+            max_det=max_det,
+            verbose=False,
+        )
+        assert len(results) == len(images), (len(results), len(images))
+        masks = []
+        for image, result in zip(images, results):
+            width, height = image.size
+            if result.masks is None:
+                masks.append(np.zeros((0, height, width), dtype=bool))
+                continue
+            image_masks = result.masks.data.cpu().numpy() > 0.5
+            assert image_masks.shape[1:] == (height, width), image_masks.shape
+            masks.append(image_masks)
+        return masks
+
+
+class SegmentationServer:
+    """Serve segmentation requests from a model pool over a local socket.
+
+    Each connection is handled in its own thread, and inference is serialized, since
+    a single inference already uses all CPU cores.
+
+    Attributes:
+        pool: The pool of models used to segment images.
+        listener: The listener accepting connections.
+    """
+
+    def __init__(self, pool: ModelPool | None = None, port: int | None = None) -> None:
+        """Initialize the server, listening on localhost.
+
+        Args:
+            pool: The pool of models used to segment images. Defaults to a new
+                ModelPool on the CPU.
+            port: The port to listen on, or 0 for any free port. Defaults to
+                config.LOCAL_SEGMENTATION_PORT.
+        """
+        self.pool = pool or ModelPool()
+        port = config.LOCAL_SEGMENTATION_PORT if port is None else port
+        self.listener = Listener((HOST, port))
+        self._inference_lock = threading.Lock()
+
+    @property
+    def address(self) -> tuple[str, int]:
+        """Return the host and port the server is listening on."""
+        return self.listener.address
+
+    def segment(
+        self,
+        images: list[Image.Image],
+        model_name: str,
+        max_side: int,
+        **kwargs: Any,
+    ) -> tuple[list[Image.Image], dict[str, float]]:
+        """Segment a batch of images with downscaled inference.
+
+        Args:
+            images: The images to segment.
+            model_name: The name or path of the FastSAM model.
+            max_side: The maximum length of the longest side of the images during
+                inference, or 0 to not downscale.
+            **kwargs: Passed to ModelPool.predict.
+
+        Returns:
+            tuple[list[Image.Image], dict[str, float]]: The segmented image of each
+                image, at its original size, and the duration of each step.
+        """
+        start_time = time.perf_counter()
+        inference_images = [
+            image.resize(get_inference_size(image.size, max_side), Image.BILINEAR)
+            for image in images
+        ]
+        resize_time = time.perf_counter()
+        with self._inference_lock:
+            lock_time = time.perf_counter()
+            masks = self.pool.predict(inference_images, model_name, **kwargs)
+        inference_time = time.perf_counter()
+        segmented_images = [
+            get_segmented_image(image_masks, image.size)
+            for image_masks, image in zip(masks, images)
+        ]
+        end_time = time.perf_counter()
+        latency = {
+            "resize_seconds": resize_time - start_time,
+            "queue_seconds": lock_time - resize_time,
+            "inference_seconds": inference_time - lock_time,
+            "upscale_seconds": end_time - inference_time,
+            "num_masks": sum(len(image_masks) for image_masks in masks),
+        }
+        return segmented_images, latency
+
+    def handle(self, conn: Connection) -> None:
+        """Handle the requests of a connection until it is closed.
+
+        Args:
+            conn: The connection to a client.
+        """
+        with conn:
+            while True:
+                try:
+                    request, images = _recv(conn)
+                except (EOFError, OSError):
+                    return
+                start_time = time.perf_counter()
+                try:
+                    segmented_images, latency = self.segment(
+                        images,
+                        request["model_name"],
+                        request["max_side"],
+                        **request["kwargs"],
+                    )
+                except Exception as exc:
+                    logger.exception(exc)
+                    _send(conn, {"error": repr(exc)}, [])
+                    continue
+                latency["server_seconds"] = time.perf_counter() - start_time
+                logger.info(f"num_images={len(images)} {latency=}")
+                _send(conn, {"latency": latency}, segmented_images)
+
+    def serve_forever(self) -> None:
+        """Accept connections until the listener is closed."""
+        logger.info(f"listening on {self.address}")
+        while True:
+            try:
+                conn = self.listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+    def close(self) -> None:
+        """Stop listening for connections."""
+        self.listener.close()
+
+
+class SegmentationClient:
+    """A client of the segmentation service, starting it if it is not running.
+
+    Attributes:
+        port: The port of the service.
+        start_server: Whether to start the service if it is not running.
+        last_latency: The latency of the last request, as reported by the service,
+            along with its round trip time.
+    """
+
+    def __init__(self, port: int | None = None, start_server: bool = True) -> None:
+        """Initialize the client, without connecting.
+
+        Args:
+            port: The port of the service. Defaults to config.LOCAL_SEGMENTATION_PORT.
+            start_server: Whether to start the service if it is not running.
+        """
+        self.port = config.LOCAL_SEGMENTATION_PORT if port is None else port
+        self.start_server = start_server
+        self.last_latency = None
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _start_server(self) -> Connection:
+        """Start the service in a new process and connect to it once ready."""
+        logger.info(f"starting segmentation service on port {self.port}")
+        process = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                __name__,
+                "serve",
+                f"--port={self.port}",
+                f"--model_name={config.LOCAL_SEGMENTATION_MODEL_NAME}",
+            ],
+            start_new_session=True,
+        )
+        start_time = time.perf_counter()
+        while time.perf_counter() - start_time < START_TIMEOUT_SECONDS:
+            assert process.poll() is None, f"service exited with {process.returncode=}"
+            try:
+                return Client((HOST, self.port))
+            except ConnectionRefusedError:
+                time.sleep(START_POLL_INTERVAL_SECONDS)
+        raise TimeoutError(f"service not ready after {START_TIMEOUT_SECONDS=}")
+
+    def _connect(self) -> Connection:
+        if self._conn is None:
+            try:
+                self._conn = Client((HOST, self.port))
+            except ConnectionRefusedError:
+                if not self.start_server:
+                    raise
+                self._conn = self._start_server()
+        return self._conn
+
+    def _request(
+        self, request: dict, images: list[Image.Image]
+    ) -> tuple[dict, list[Image.Image]]:
+        try:
+            conn = self._connect()
+            _send(conn, request, images)
+            return _recv(conn)
+        except (EOFError, OSError) as exc:
+            # the service was restarted since the last request
+            logger.warning(f"reconnecting after {exc=}")
+            self.close()
+            conn = self._connect()
+            _send(conn, request, images)
+            return _recv(conn)
+
+    def segment(
+        self,
+        images: list[Image.Image],
+        model_name: str | None = None,
+        max_side: int | None = None,
+        **kwargs: Any,
+    ) -> list[Image.Image]:
+        """Segment a batch of images.
+
+        Args:
+            images: The images to segment.
+            model_name: The name or path of the FastSAM model. Defaults to
+                config.LOCAL_SEGMENTATION_MODEL_NAME.
+            max_side: The maximum length of the longest side of the images during
+                inference, or 0 to not downscale. Defaults to
+                config.LOCAL_SEGMENTATION_MAX_SIDE.
+            **kwargs: Passed to ModelPool.predict.
+
+        Returns:
+            list[Image.Image]: The segmented image of each image.
+        """
+        request = {
+            "model_name": model_name or config.LOCAL_SEGMENTATION_MODEL_NAME,
+            "max_side": (
+                config.LOCAL_SEGMENTATION_MAX_SIDE if max_side is None else max_side
+            ),
+            "kwargs": kwargs,
+        }
+        start_time = time.perf_counter()
+        with self._lock:
+            response, segmented_images = self._request(request, images)
+        if "error" in response:
+            raise RuntimeError(f"segmentation service error: {response['error']}")
+        latency = dict(
+            response["latency"], round_trip_seconds=time.perf_counter() - start_time
+        )
+        logger.info(f"num_images={len(images)} {latency=}")
+        self.last_latency = latency
+        assert len(segmented_images) == len(images), len(segmented_images)
+        return segmented_images
+
+    def close(self) -> None:
+        """Close the connection to the service, leaving the service running."""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+_client = None
+
+
+def get_client() -> SegmentationClient:
+    """Get the shared client of the segmentation service."""
+    global _client
+    if _client is None:
+        _client = SegmentationClient()
+    return _client
+
+
+def fetch_segmented_image(image: Image.Image, **kwargs: Any) -> Image.Image:
+    """Segment a PIL.Image using the local segmentation service.
+
+    Args:
+        image: The input image to be segmented.
+        kwargs: Passed to SegmentationClient.segment.
+
+    Returns:
+        The segmented image as a PIL Image.
+    """
+    (segmented_image,) = get_client().segment([image], **kwargs)
+    return segmented_image
+
+
+def fetch_segmented_images(
+    images: list[Image.Image], **kwargs: Any
+) -> list[Image.Image]:
+    """Segment a batch of PIL.Images using the local segmentation service.
+
+    Args:
+        images: The input images to be segmented.
+        kwargs: Passed to SegmentationClient.segment.
+
+    Returns:
+        The segmented images as PIL Images.
+    """
+    return get_client().segment(images, **kwargs)
+
+
+def serve(port: int | None = None, model_name: str | None = None) -> None:
+    """Run the segmentation service, loading a model before accepting requests.
+
+    Args:
+        port: The port to listen on. Defaults to config.LOCAL_SEGMENTATION_PORT.
+        model_name: The model to load. Defaults to
+            config.LOCAL_SEGMENTATION_MODEL_NAME.
+    """
+    pool = ModelPool()
+    pool.get_model(model_name or config.LOCAL_SEGMENTATION_MODEL_NAME)
+    server = SegmentationServer(pool, port)
+    try:
+        server.serve_forever()
+    finally:
+        server.close()
+
+
+def segment(image_path: str, **kwargs: Any) -> None:
+    """Segment an image with the service and display the result.
+
+    Args:
+        image_path: The path of the image to segment.
+        kwargs: Passed to SegmentationClient.segment.
+    """
+    with Image.open(image_path) as image:
+        segmented_image = fetch_segmented_image(image, **kwargs)
+    segmented_image.show()
+
+
+if __name__ == "__main__":
+    fire.Fire({"serve": serve, "segment": segment})
@@ -1,6 +1,6 @@
 'use client';
 
-import { Button, Checkbox, Flex, Grid, TextInput } from '@mantine/core';
+import { Button, Checkbox, Flex, Grid, NumberInput, Select, TextInput } from '@mantine/core';
 import { useForm } from '@mantine/form';
 import React, { useEffect } from 'react'
 import { saveSettings, validateRecordAndReplaySettings } from '../utils';
@@ -43,12 +43,39 @@ export const Form = ({
                 <Grid.Col span={6}>
                     <Checkbox label="Record images" {...form.getInputProps('RECORD_IMAGES')} checked={form.values.RECORD_IMAGES} />
                 </Grid.Col>
+                <Grid.Col span={6}>
+                    <Checkbox label="Record thumbnails" {...form.getInputProps('RECORD_THUMBNAILS')} checked={form.values.RECORD_THUMBNAILS} />
+                </Grid.Col>
                 <Grid.Col span={6}>
                     <Checkbox label="Record browser (Chrome) events (see <insert link to relevant README section> to install extension)" {...form.getInputProps('RECORD_BROWSER_EVENTS')} checked={form.values.RECORD_BROWSER_EVENTS} />
                 </Grid.Col>
                 <Grid.Col span={6}>
                     <TextInput label="Video pixel format" placeholder="Video pixel format" {...form.getInputProps('VIDEO_PIXEL_FORMAT')} />
                 </Grid.Col>
+                <Grid.Col span={6}>
+                    <Select label="Video encode profile" data={['lossless_fast', 'visually_lossless', 'archival']} {...form.getInputProps('VIDEO_ENCODE_PROFILE')} />
+                </Grid.Col>
+                <Grid.Col span={6}>
+                    <NumberInput label="Video encoder threads (0 for automatic)" min={0} {...form.getInputProps('VIDEO_ENCODE_THREADS')} />
+                </Grid.Col>
+                <Grid.Col span={6}>
+                    <NumberInput label="Video segment duration in seconds (0 for a single file)" min={0} {...form.getInputProps('VIDEO_SEGMENT_DURATION_SECONDS')} />
+                </Grid.Col>
+                <Grid.Col span={6}>
+                    <Checkbox label="Reuse window segmentations across replays" {...form.getInputProps('SEGMENTATION_STORE_ENABLED')} checked={form.values.SEGMENTATION_STORE_ENABLED} />
+                </Grid.Col>
+                <Grid.Col span={6}>
+                    <NumberInput label="Maximum segmentation store size in bytes" min={0} {...form.getInputProps('SEGMENTATION_STORE_MAX_BYTES')} />
+                </Grid.Col>
+                <Grid.Col span={6}>
+                    <TextInput label="Local segmentation model" {...form.getInputProps('LOCAL_SEGMENTATION_MODEL_NAME')} />
+                </Grid.Col>
+                <Grid.Col span={6}>
+                    <NumberInput label="Local segmentation service port" min={1} max={65535} {...form.getInputProps('LOCAL_SEGMENTATION_PORT')} />
+                </Grid.Col>
+                <Grid.Col span={6}>
+                    <NumberInput label="Local segmentation maximum image side (0 to not downscale)" min={0} {...form.getInputProps('LOCAL_SEGMENTATION_MAX_SIDE')} />
+                </Grid.Col>
             </Grid>
             <Flex mt={40} columnGap={20}>
                 <Button disabled={!form.isDirty()} type="submit">
@@ -11,6 +11,13 @@ Python Example Usage:
         # Function body
         pass
 
+    # For functions of images and arrays, keyed by content hashes and stored as
+    # memory-mapped arrays (see array_cache):
+    @array_cache()
+    def my_array_function(image: Image.Image) -> np.ndarray:
+        # Function body
+        pass
+
 Command Line Example Usage:
     # To clear the cache but keep data from the last 14 days and perform a dry run:
     python -m openadapt.cache clear --keep_days 14 --dry_run True
@@ -20,15 +27,28 @@ from datetime import datetime, timedelta
 from functools import wraps
 from pathlib import Path
 from typing import Any, Callable
+import hashlib
+import inspect
+import json
 import os
 import time
 
 from joblib import Memory
+from PIL import Image
 import fire
+import numpy as np
 
 from openadapt.config import config
 from openadapt.custom_logger import logger
 
+ARRAY_CACHE_DIR_NAME = "arrays"
+# offsets of arrays within a cached result are aligned to this many bytes
+ARRAY_ALIGNMENT = 64
+# types whose instances can be returned by functions decorated with array_cache
+ARRAY_TYPES: dict[str, type] = {}
+# function name -> hits, misses and seconds spent hashing, loading and computing
+ARRAY_CACHE_STATS: dict[str, dict[str, float]] = {}
+
 
 def default(val: Any, default: Any) -> Any:
     """Set a default value if the given value is None.
@@ -108,6 +128,315 @@ def cache(
     return decorator
 
 
+def get_hash(*parts: bytes | str) -> str:
+    """Hash the given parts.
+
+    Args:
+        *parts: The bytes or strings to hash.
+
+    Returns:
+        str: The hex digest.
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        hasher.update(part.encode() if isinstance(part, str) else part)
+        hasher.update(b"\0")
+    return hasher.hexdigest()
+
+
+def register_array_type(cls: type) -> type:
+    """Allow instances of a class to be arguments and results of array_cache.
+
+    The class must have a settable content_hash attribute, a to_arrays method
+    returning a dict of arrays and a dict of JSON serializable metadata, and a
+    from_arrays classmethod accepting them.
+
+    Args:
+        cls (type): The class to register.
+
+    Returns:
+        type: The class.
+    """
+    ARRAY_TYPES[cls.__name__] = cls
+    return cls
+
+
+def get_content_hash(obj: Any) -> str:
+    """Get a hash of the content of an object.
+
+    The hash of an image is computed once and carried alongside it, so images must
+    not be modified in place once hashed. Registered array types carry their own.
+
+    Args:
+        obj (Any): The object to hash.
+
+    Returns:
+        str: The hex digest.
+    """
+    if type(obj).__name__ in ARRAY_TYPES:
+        return obj.content_hash
+    if isinstance(obj, Image.Image):
+        content_hash = getattr(obj, "_content_hash", None)
+        if content_hash is None:
+            content_hash = get_hash(obj.tobytes(), obj.mode, str(obj.size))
+            obj._content_hash = content_hash
+        return content_hash
+    if isinstance(obj, np.ndarray):
+        return get_hash(np.ascontiguousarray(obj).data, obj.dtype.str, str(obj.shape))
+    if isinstance(obj, (list, tuple)):
+        return get_hash(type(obj).__name__, *[get_content_hash(item) for item in obj])
+    if isinstance(obj, dict):
+        return get_hash(
+            "dict",
+            *[f"{key!r}={get_content_hash(value)}" for key, value in obj.items()],
+        )
+    return get_hash(type(obj).__name__, repr(obj))
+
+
+def set_result_content_hashes(obj: Any, content_hash: str) -> None:
+    """Set content hashes derived from a call's key on the objects in its result.
+
+    Images and registered array types carry the hashes, so that passing them to
+    other cached functions needs no hashing. A function's result is determined by
+    its key, so the derived hashes identify the content as well as hashes of the
+    content itself.
+
+    Args:
+        obj (Any): The result.
+        content_hash (str): The key of the call which returned the result.
+    """
+    if type(obj).__name__ in ARRAY_TYPES:
+        obj.content_hash = content_hash
+    elif isinstance(obj, Image.Image):
+        obj._content_hash = content_hash
+    elif isinstance(obj, (list, tuple)):
+        for idx, item in enumerate(obj):
+            set_result_content_hashes(item, get_hash(content_hash, str(idx)))
+    elif isinstance(obj, dict):
+        for dict_key, value in obj.items():
+            set_result_content_hashes(value, get_hash(content_hash, dict_key))
+
+
+class _ResultEncoder:
+    """Encode a result as JSON serializable metadata and one contiguous buffer."""
+
+    def __init__(self) -> None:
+        self.arrays = []
+        self.num_bytes = 0
+
+    def add_array(self, array: np.ndarray) -> dict[str, Any]:
+        array = np.ascontiguousarray(array)
+        assert array.dtype != object, array.dtype
+        offset = -(-self.num_bytes // ARRAY_ALIGNMENT) * ARRAY_ALIGNMENT
+        self.arrays.append((offset, array))
+        self.num_bytes = offset + array.nbytes
+        return {"offset": offset, "shape": array.shape, "dtype": array.dtype.str}
+
+    def encode(self, obj: Any) -> dict[str, Any]:
+        name = type(obj).__name__
+        if name in ARRAY_TYPES:
+            arrays, metadata = obj.to_arrays()
+            return {
+                "type": name,
+                "arrays": {key: self.add_array(value) for key, value in arrays.items()},
+                "metadata": metadata,
+            }
+        if isinstance(obj, np.ndarray):
+            return {"type": "array", "array": self.add_array(obj)}
+        if isinstance(obj, Image.Image):
+            return {
+                "type": "image",
+                "mode": obj.mode,
+                "array": self.add_array(np.asarray(obj)),
+            }
+        if isinstance(obj, (list, tuple)):
+            return {"type": name, "items": [self.encode(item) for item in obj]}
+        if isinstance(obj, dict):
+            assert all(isinstance(key, str) for key in obj), obj.keys()
+            return {
+                "type": "dict",
+                "items": {key: self.encode(value) for key, value in obj.items()},
+            }
+        if isinstance(obj, np.generic):
+            obj = obj.item()
+        assert obj is None or isinstance(obj, (bool, int, float, str)), type(obj)
+        return {"type": "value", "value": obj}
+
+    def get_buffer(self) -> np.ndarray:
+        buffer = np.zeros(self.num_bytes, dtype=np.uint8)
+        for offset, array in self.arrays:
+            buffer[offset : offset + array.nbytes] = array.reshape(-1).view(np.uint8)
+        return buffer
+
+
+def _decode_result(spec: dict[str, Any], buffer: np.ndarray | None) -> Any:
+    """Decode a result encoded by _ResultEncoder, viewing arrays into the buffer."""
+
+    def get_array(array_spec: dict[str, Any]) -> np.ndarray:
+        dtype = np.dtype(array_spec["dtype"])
+        shape = tuple(array_spec["shape"])
+        if not np.prod(shape):
+            return np.zeros(shape, dtype=dtype)
+        offset = array_spec["offset"]
+        num_bytes = int(np.prod(shape)) * dtype.itemsize
+        return buffer[offset : offset + num_bytes].view(dtype).reshape(shape)
+
+    spec_type = spec["type"]
+    if spec_type in ARRAY_TYPES:
+        arrays = {key: get_array(value) for key, value in spec["arrays"].items()}
+        return ARRAY_TYPES[spec_type].from_arrays(arrays, spec["metadata"])
+    if spec_type == "array":
+        return get_array(spec["array"])
+    if spec_type == "image":
+        image = Image.fromarray(np.array(get_array(spec["array"])))
+        return image if image.mode == spec["mode"] else image.convert(spec["mode"])
+    if spec_type in ("list", "tuple"):
+        items = [_decode_result(item, buffer) for item in spec["items"]]
+        return items if spec_type == "list" else tuple(items)
+    if spec_type == "dict":
+        return {
+            key: _decode_result(value, buffer) for key, value in spec["items"].items()
+        }
+    return spec["value"]
+
+
+def _replace_file(file_path: str, save: Callable[[Any], None]) -> None:
+    tmp_file_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(tmp_file_path, "wb") as file:
+        save(file)
+    os.replace(tmp_file_path, file_path)
+
+
+def array_cache(
+    dir_path: str | None = None,
+    enabled: bool | None = None,
+) -> Callable[[Callable], Callable]:
+    """Cache decorator for functions of images and arrays.
+
+    Unlike cache, arguments are keyed by content hashes which are computed once per
+    image or array type instance and carried alongside it (see get_content_hash),
+    rather than by pickling every argument on every call. Results are stored as one
+    contiguous .npy buffer with a JSON description of its structure, and loaded
+    memory-mapped. Hits, misses and time spent hashing, loading and computing are
+    accumulated per function in ARRAY_CACHE_STATS, also available as the wrapper's
+    stats attribute.
+
+    Results may contain arrays, images, registered array types (see
+    register_array_type), lists, tuples, dicts with string keys and scalars. Arrays
+    in loaded results are read-only.
+
+    Args:
+        dir_path (str | None): The path to the cache directory.
+        enabled (bool | None): Whether caching is enabled.
+
+    Returns:
+        The decorator function.
+    """
+    cache_dir_path = default(dir_path, config.CACHE_DIR_PATH)
+    cache_enabled = default(enabled, config.CACHE_ENABLED)
+
+    def decorator(fn: Callable) -> Callable:
+        name = f"{fn.__module__}.{fn.__qualname__}"
+        fn_dir_path = os.path.join(cache_dir_path, ARRAY_CACHE_DIR_NAME, name)
+        signature = inspect.signature(fn)
+        # invalidate cached results when the function changes
+        try:
+            code_hash = get_hash(inspect.getsource(fn))
+        except (OSError, TypeError):
+            code_hash = get_hash(fn.__code__.co_code)
+        stats = ARRAY_CACHE_STATS.setdefault(
+            name,
+            {
+                "hits": 0,
+                "misses": 0,
+                "hash_time": 0.0,
+                "load_time": 0.0,
+                "compute_time": 0.0,
+            },
+        )
+
+        @wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not cache_enabled:
+                return fn(*args, **kwargs)
+
+            start_time = time.perf_counter()
+            bound_args = signature.bind(*args, **kwargs)
+            bound_args.apply_defaults()
+            key = get_hash(
+                code_hash,
+                *[
+                    f"{arg_name}={get_content_hash(value)}"
+                    for arg_name, value in bound_args.arguments.items()
+                ],
+            )
+            stats["hash_time"] += time.perf_counter() - start_time
+            spec_file_path = os.path.join(fn_dir_path, f"{key}.json")
+            buffer_file_path = os.path.join(fn_dir_path, f"{key}.npy")
+
+            start_time = time.perf_counter()
+            try:
+                with open(spec_file_path) as file:
+                    spec = json.load(file)
+                buffer = (
+                    np.load(buffer_file_path, mmap_mode="r")
+                    if spec["num_bytes"]
+                    else None
+                )
+                rval = _decode_result(spec["result"], buffer)
+            except FileNotFoundError:
+                cache_hit = False
+            else:
+                cache_hit = True
+                stats["hits"] += 1
+                stats["load_time"] += time.perf_counter() - start_time
+            logger.debug(f"{name=} {cache_hit=}")
+            if cache_hit:
+                set_result_content_hashes(rval, key)
+                return rval
+
+            start_time = time.perf_counter()
+            rval = fn(*args, **kwargs)
+            stats["misses"] += 1
+            stats["compute_time"] += time.perf_counter() - start_time
+
+            encoder = _ResultEncoder()
+            spec = {"result": encoder.encode(rval), "num_bytes": encoder.num_bytes}
+            os.makedirs(fn_dir_path, exist_ok=True)
+            if encoder.num_bytes:
+                _replace_file(
+                    buffer_file_path,
+                    lambda file: np.save(file, encoder.get_buffer()),
+                )
+            # written last, so that a result is only loaded once complete
+            _replace_file(
+                spec_file_path, lambda file: file.write(json.dumps(spec).encode())
+            )
+            set_result_content_hashes(rval, key)
+            return rval
+
+        wrapper.stats = stats
+        return wrapper
+
+    return decorator
+
+
+def get_array_cache_stats() -> dict[str, dict[str, float]]:
+    """Get the stats of functions decorated with array_cache.
+
+    Returns:
+        dict: Function name -> hits, misses, hit rate, and seconds spent hashing
+            arguments, loading results and computing results.
+    """
+    return {
+        name: {
+            **stats,
+            "hit_rate": stats["hits"] / max(stats["hits"] + stats["misses"], 1),
+        }
+        for name, stats in ARRAY_CACHE_STATS.items()
+    }
+
+
 def clear(keep_days: int = 0, dry_run: bool = False) -> None:
     """Clears the cache, optionally keeping data for a specified number of days.
 
@@ -121,11 +450,16 @@ def clear(keep_days: int = 0, dry_run: bool = False) -> None:
         f"Attempting to clear cache with {'dry run' if dry_run else 'actual deletion'},"
         " keeping last {keep_days} days."
     )
-    cache_dir_path = Path(config.CACHE_DIR_PATH) / "joblib"
+    cache_dir_paths = [
+        Path(config.CACHE_DIR_PATH) / dir_name
+        for dir_name in ("joblib", ARRAY_CACHE_DIR_NAME)
+    ]
     cutoff_date = datetime.now() - timedelta(days=keep_days)
     total_cleared = 0
 
-    for path in cache_dir_path.rglob("*"):
+    for path in (
+        path for cache_dir_path in cache_dir_paths for path in cache_dir_path.rglob("*")
+    ):
         if path.is_file() and os.path.getmtime(path) < cutoff_date.timestamp():
             file_size = path.stat().st_size
             if not dry_run:
@@ -25,6 +25,8 @@ DATA_DIR_PATH = (ROOT_DIR_PATH / "data").absolute()
 CONFIG_FILE_PATH = (DATA_DIR_PATH / "config.json").absolute()
 RECORDING_DIR_PATH = (DATA_DIR_PATH / "recordings").absolute()
 PERFORMANCE_PLOTS_DIR_PATH = (DATA_DIR_PATH / "performance").absolute()
+BENCHMARK_DIR_PATH = (DATA_DIR_PATH / "benchmarks").absolute()
+SEGMENTATION_DIR_PATH = (DATA_DIR_PATH / "segmentations").absolute()
 CAPTURE_DIR_PATH = (DATA_DIR_PATH / "captures").absolute()
 VIDEO_DIR_PATH = DATA_DIR_PATH / "videos"
 DATABASE_FILE_PATH = (DATA_DIR_PATH / "openadapt.db").absolute()
@@ -105,8 +107,15 @@ class Config(BaseSettings):
         SOM: str = "som"
         REPLICATE: str = "replicate"
         ULTRALYTICS: str = "ultralytics"
+        LOCAL: str = "local"
 
     DEFAULT_SEGMENTATION_ADAPTER: SegmentationAdapter = SegmentationAdapter.ULTRALYTICS
+    # FastSAM model kept warm by the local segmentation service, which listens on
+    # LOCAL_SEGMENTATION_PORT (see adapters.local_segmentation)
+    LOCAL_SEGMENTATION_MODEL_NAME: str = "FastSAM-s.pt"
+    LOCAL_SEGMENTATION_PORT: int = 8767
+    # longest image side during local segmentation, or 0 to not downscale
+    LOCAL_SEGMENTATION_MAX_SIDE: int = 1024
 
     # Completions
     OPENAI_API_KEY: str = "<OPENAI_API_KEY>"
@@ -143,12 +152,37 @@ class Config(BaseSettings):
     # if false, only write video events corresponding to screenshots
     RECORD_FULL_VIDEO: bool
     RECORD_IMAGES: bool
+    # if true, store downscaled copies of each screenshot (see Screenshot.image_at);
+    # otherwise they are generated from the screenshot on first access, which keeps
+    # the encoding off the recording writer
+    RECORD_THUMBNAILS: bool = False
+    # if true, tag click and typing groups while recording (see OnlineEventGrouper)
+    RECORD_GROUP_EVENTS: bool = False
     # useful for debugging but expensive computationally
     LOG_MEMORY: bool
     REPLAY_STRIP_ELEMENT_STATE: bool = True
     VIDEO_ENCODING: str = "libx264"
     VIDEO_PIXEL_FORMAT: str = "yuv444p"
+    # see video.ENCODE_PROFILES
+    VIDEO_ENCODE_PROFILE: str = "lossless_fast"
+    # number of encoder threads, or 0 to choose automatically
+    VIDEO_ENCODE_THREADS: int = 0
     VIDEO_DIR_PATH: str = str(VIDEO_DIR_PATH)
+    # start a new video segment file every this many seconds, or 0 to write a single
+    # file (see video.SegmentedVideoWriter)
+    VIDEO_SEGMENT_DURATION_SECONDS: float = 300
+    # maximum memory used by decoded video frames (see models.FrameCache)
+    FRAME_CACHE_MAX_BYTES: int = 2**30  # 1GB
+    # number of following screenshots to decode along with an uncached screenshot
+    FRAME_CACHE_NUM_PREFETCH: int = 8
+    # number of frames to decode ahead of sequential consumers (see FramePrefetcher)
+    FRAME_PREFETCH_WINDOW: int = 32
+    # maximum memory used by images encoded for UIs and LLMs (see utils.image2utf8)
+    IMAGE_ENCODE_CACHE_MAX_BYTES: int = 2**28  # 256MB
+    # reuse window segmentations across replays (see segmentation_store)
+    SEGMENTATION_STORE_ENABLED: bool = True
+    # maximum disk space used by stored segmentations
+    SEGMENTATION_STORE_MAX_BYTES: int = 2**30  # 1GB
     # sequences that when typed, will stop the recording of ActionEvents in record.py
     STOP_SEQUENCES: list[list[str]] = [
         list(stop_str) for stop_str in STOP_STRS
@@ -293,8 +327,18 @@ class Config(BaseSettings):
             "RECORD_READ_ACTIVE_ELEMENT_STATE",
             "RECORD_VIDEO",
             "RECORD_IMAGES",
+            "RECORD_THUMBNAILS",
             "RECORD_BROWSER_EVENTS",
+            "RECORD_GROUP_EVENTS",
             "VIDEO_PIXEL_FORMAT",
+            "VIDEO_ENCODE_PROFILE",
+            "VIDEO_ENCODE_THREADS",
+            "VIDEO_SEGMENT_DURATION_SECONDS",
+            "SEGMENTATION_STORE_ENABLED",
+            "SEGMENTATION_STORE_MAX_BYTES",
+            "LOCAL_SEGMENTATION_MODEL_NAME",
+            "LOCAL_SEGMENTATION_PORT",
+            "LOCAL_SEGMENTATION_MAX_SIDE",
         ],
         "general": [
             "UNIQUE_USER_ID",
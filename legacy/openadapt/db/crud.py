@@ -527,6 +527,10 @@ def save_screenshot_diff(
 ) -> list[Screenshot]:
     """Save screenshot diff data to the database.
 
+    For each screenshot, the mask of the pixels changed since the previous one is
+    saved bit-packed, along with the bounding boxes of the changed regions. Diffs are
+    computed in parallel (see Screenshot.get_diff_datas).
+
     Args:
         session (sa.orm.Session): The database session.
         screenshots (list[Screenshot]): A list of screenshots.
@@ -534,22 +538,19 @@ def save_screenshot_diff(
     Returns:
         list[Screenshot]: A list of screenshots with diff data saved to the db.
     """
-    data_updated = False
     logger.info("verifying diffs for screenshots...")
 
-    for screenshot in screenshots:
-        if not screenshot.prev:
-            continue
-        if not screenshot.png_diff_data:
-            screenshot.png_diff_data = screenshot.convert_png_to_binary(screenshot.diff)
-            data_updated = True
-        if not screenshot.png_diff_mask_data:
-            screenshot.png_diff_mask_data = screenshot.convert_png_to_binary(
-                screenshot.diff_mask
-            )
-            data_updated = True
-
-    if data_updated:
+    pending_screenshots = [
+        screenshot
+        for screenshot in screenshots
+        if screenshot.prev and not screenshot.packed_diff_mask_data
+    ]
+    diff_datas = Screenshot.get_diff_datas(pending_screenshots)
+    for screenshot, diff_data in zip(pending_screenshots, diff_datas):
+        for name, value in diff_data.items():
+            setattr(screenshot, name, value)
+
+    if pending_screenshots:
         logger.info("saving screenshot diff data to db...")
         session.bulk_save_objects(screenshots)
         session.commit()
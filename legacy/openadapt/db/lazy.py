@@ -0,0 +1,321 @@
+"""Lazily materialized action event trees.
+
+crud.get_action_events eagerly loads every action event together with its
+recording, screenshot, browser event and window event. Consumers which only display
+top-level events (e.g. event lists in the dashboard) pay for all of that up front.
+
+LazyEventTree instead loads only the top-level events of a recording. Children
+(recursively), screenshots, window events (with their action events) and browser
+events are loaded on first access, for a whole batch of neighbouring events at once,
+and the number of rows and bytes actually loaded is counted.
+
+The events are the stored ones, i.e. the raw recorded events, or for a copied
+recording (see Recording.original_recording_id) the events processed when it was
+copied. They are not passed through events.get_events, which merges and discards
+events and so requires loading all of them; use that instead where processed events
+are needed.
+
+Usage:
+
+    session = crud.get_new_session(read_only=True)
+    tree = LazyEventTree(session, recording)
+    for event in tree.events:
+        print(event.name, len(event.children))
+    logger.info(f"{tree.stats=}")
+"""
+
+from typing import Any
+import json
+
+from sqlalchemy.orm import Session as SaSession
+from sqlalchemy.orm.attributes import set_committed_value
+import sqlalchemy as sa
+
+from openadapt.custom_logger import logger
+from openadapt.db import db
+from openadapt.models import (
+    ActionEvent,
+    BrowserEvent,
+    Recording,
+    Screenshot,
+    WindowEvent,
+)
+
+# number of neighbouring top-level events whose relationships are loaded together
+BATCH_SIZE = 50
+
+# relationship name -> (model, foreign key attribute on ActionEvent)
+RELATED_MODELS = {
+    "screenshot": (Screenshot, "screenshot_id"),
+    "window_event": (WindowEvent, "window_event_id"),
+    "browser_event": (BrowserEvent, "browser_event_id"),
+}
+
+
+def get_row_num_bytes(row: db.Base) -> int:
+    """Estimate the number of bytes loaded for a row.
+
+    Only attributes which have already been loaded are counted, so that counting
+    does not itself trigger any loading.
+
+    Args:
+        row (db.Base): The row.
+
+    Returns:
+        int: The estimated size of the row's loaded column values.
+    """
+    num_bytes = 0
+    for attr in sa.inspect(row).mapper.column_attrs:
+        val = row.__dict__.get(attr.key)
+        if val is None:
+            continue
+        if isinstance(val, (bytes, str)):
+            num_bytes += len(val)
+        elif isinstance(val, (dict, list)):
+            num_bytes += len(json.dumps(val, default=str))
+        else:
+            num_bytes += 8
+    return num_bytes
+
+
+class LazyActionEvent:
+    """A top-level action event whose relationships are loaded on first access.
+
+    All other attributes are read from the underlying ActionEvent.
+    """
+
+    def __init__(self, tree: "LazyEventTree", idx: int, event: ActionEvent) -> None:
+        """Initialize.
+
+        Args:
+            tree (LazyEventTree): The tree this event belongs to.
+            idx (int): The index of the event in tree.events.
+            event (ActionEvent): The underlying action event.
+        """
+        self._tree = tree
+        self._idx = idx
+        self._event = event
+
+    def __getattr__(self, name: str) -> Any:
+        """Delegate attribute access to the underlying action event."""
+        return getattr(self._event, name)
+
+    def __repr__(self) -> str:
+        """Return a string representation of the underlying action event."""
+        return f"{self.__class__.__name__}({self._event!r})"
+
+    @property
+    def action_event(self) -> ActionEvent:
+        """Get the underlying action event (relationships may be unloaded)."""
+        return self._event
+
+    @property
+    def children(self) -> list[ActionEvent]:
+        """Get the children of the event, loading them if necessary."""
+        self._tree.load("children", self._idx)
+        return self._event.children
+
+    @property
+    def screenshot(self) -> Screenshot | None:
+        """Get the screenshot of the event, loading it if necessary."""
+        self._tree.load("screenshot", self._idx)
+        return self._event.screenshot
+
+    @property
+    def window_event(self) -> WindowEvent | None:
+        """Get the window event of the event, loading it if necessary.
+
+        The action events of the window event are loaded with it.
+        """
+        self._tree.load("window_event", self._idx)
+        return self._event.window_event
+
+    @property
+    def browser_event(self) -> BrowserEvent | None:
+        """Get the browser event of the event, loading it if necessary."""
+        self._tree.load("browser_event", self._idx)
+        return self._event.browser_event
+
+
+class LazyEventTree:
+    """The stored top-level action events of a recording, loaded lazily.
+
+    The events are not processed (see events.get_events).
+
+    Attributes:
+        events (list[LazyActionEvent]): The top-level action events, ordered by
+            timestamp.
+        stats (dict): The number of queries issued, and the number of rows and bytes
+            loaded per table.
+    """
+
+    def __init__(
+        self,
+        session: SaSession,
+        recording: Recording,
+        batch_size: int = BATCH_SIZE,
+    ) -> None:
+        """Load the top-level action events of the recording.
+
+        Args:
+            session (sa.orm.Session): The database session.
+            recording (Recording): The recording object.
+            batch_size (int): The number of neighbouring top-level events whose
+                relationships are loaded together.
+        """
+        assert recording, "Invalid recording."
+        self.session = session
+        self.recording = recording
+        self.batch_size = batch_size
+        self.stats = {"num_queries": 0, "num_rows": {}, "num_bytes": {}}
+        self._loaded_batches = {
+            name: set() for name in ["children", *RELATED_MODELS.keys()]
+        }
+
+        action_events = self._query(
+            session.query(ActionEvent)
+            .filter(
+                ActionEvent.recording_id == recording.id,
+                ActionEvent.parent_id == None,  # noqa: E711
+            )
+            .order_by(ActionEvent.timestamp)
+        )
+        action_events = [event for event in action_events if not event.disabled]
+        self.events = [
+            LazyActionEvent(self, idx, event) for idx, event in enumerate(action_events)
+        ]
+
+    def __len__(self) -> int:
+        """Return the number of top-level events."""
+        return len(self.events)
+
+    def __getitem__(self, idx: int) -> LazyActionEvent:
+        """Return the top-level event at the given index."""
+        return self.events[idx]
+
+    def __iter__(self) -> Any:
+        """Iterate over the top-level events."""
+        return iter(self.events)
+
+    def _query(self, query: sa.orm.Query) -> list[db.Base]:
+        """Run a query and update the load statistics.
+
+        Args:
+            query (sa.orm.Query): The query to run.
+
+        Returns:
+            list[db.Base]: The loaded rows.
+        """
+        rows = query.all()
+        self.stats["num_queries"] += 1
+        for row in rows:
+            table_name = row.__tablename__
+            num_rows = self.stats["num_rows"]
+            num_bytes = self.stats["num_bytes"]
+            num_rows[table_name] = num_rows.get(table_name, 0) + 1
+            num_bytes[table_name] = num_bytes.get(table_name, 0) + get_row_num_bytes(
+                row
+            )
+        return rows
+
+    def load(self, name: str, idx: int) -> None:
+        """Load a relationship for the batch of top-level events containing idx.
+
+        Args:
+            name (str): The relationship name ("children", "screenshot",
+                "window_event" or "browser_event").
+            idx (int): The index of the event whose relationship is being accessed.
+        """
+        batch_idx = idx // self.batch_size
+        loaded_batches = self._loaded_batches[name]
+        if batch_idx in loaded_batches:
+            return
+        loaded_batches.add(batch_idx)
+        start_idx = batch_idx * self.batch_size
+        events = [
+            lazy_event.action_event
+            for lazy_event in self.events[start_idx : start_idx + self.batch_size]
+        ]
+        logger.debug(f"{name=} {batch_idx=} {len(events)=}")
+        if name == "children":
+            self._load_children(events)
+        else:
+            self._load_related(name, events)
+
+    def _load_children(self, events: list[ActionEvent]) -> None:
+        """Load the descendants of the given events, one query per tree level.
+
+        Args:
+            events (list[ActionEvent]): The events whose children to load.
+        """
+        while events:
+            children = self._query(
+                self.session.query(ActionEvent)
+                .filter(ActionEvent.parent_id.in_([event.id for event in events]))
+                .order_by(ActionEvent.timestamp)
+            )
+            children_by_parent_id = {event.id: [] for event in events}
+            for child in children:
+                children_by_parent_id[child.parent_id].append(child)
+            for event in events:
+                set_committed_value(event, "children", children_by_parent_id[event.id])
+            events = children
+
+    def _load_related(self, name: str, events: list[ActionEvent]) -> None:
+        """Load a many-to-one relationship of the given events.
+
+        Args:
+            name (str): The relationship name.
+            events (list[ActionEvent]): The events whose relationship to load.
+        """
+        model, foreign_key = RELATED_MODELS[name]
+        ids = {getattr(event, foreign_key) for event in events} - {None}
+        rows = (
+            self._query(self.session.query(model).filter(model.id.in_(ids)))
+            if ids
+            else []
+        )
+        row_by_id = {row.id: row for row in rows}
+        for event in events:
+            set_committed_value(event, name, row_by_id.get(getattr(event, foreign_key)))
+        if name == "window_event":
+            self._load_window_action_events(rows)
+
+    def _load_window_action_events(self, window_events: list[WindowEvent]) -> None:
+        """Load the action events of the given window events.
+
+        Action events which were already loaded (e.g. the top-level events) are
+        reused from the session.
+
+        Args:
+            window_events (list[WindowEvent]): The window events.
+        """
+        window_events = [
+            window_event
+            for window_event in window_events
+            if "action_events" not in window_event.__dict__
+        ]
+        if not window_events:
+            return
+        action_events = self._query(
+            self.session.query(ActionEvent)
+            .filter(
+                ActionEvent.window_event_id.in_(
+                    [window_event.id for window_event in window_events]
+                )
+            )
+            .order_by(ActionEvent.timestamp)
+        )
+        action_events_by_window_event_id = {
+            window_event.id: [] for window_event in window_events
+        }
+        for action_event in action_events:
+            action_events_by_window_event_id[action_event.window_event_id].append(
+                action_event
+            )
+        for window_event in window_events:
+            set_committed_value(
+                window_event,
+                "action_events",
+                action_events_by_window_event_id[window_event.id],
+            )
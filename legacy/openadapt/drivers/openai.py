@@ -30,6 +30,8 @@ MODEL_NAME = [
 MAX_TOKENS = 4096
 # TODO XXX undocumented
 MAX_IMAGES = 90
+# images sent with detail="low" are processed at this resolution
+LOW_DETAIL_MAX_SIDE = 512
 
 # Track total tokens and cost
 total_tokens_used = 0
@@ -77,7 +79,8 @@ def create_payload(
 
     images = images or []
     for image in images:
-        base64_image = utils.image2utf8(image)
+        max_side = LOW_DETAIL_MAX_SIDE if detail == "low" else None
+        base64_image = utils.image2utf8(image, max_side=max_side)
         messages[0]["content"].append(
             {
                 "type": "image_url",
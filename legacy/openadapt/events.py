@@ -1,15 +1,23 @@
 """This module provides functionality for aggregating events."""
 
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pprint import pformat
 from typing import Any, Callable, Optional
+import multiprocessing
 import time
 
 from scipy.spatial import distance
 import numpy as np
+import sqlalchemy as sa
 
 from openadapt import browser, common, models, utils
+from openadapt.build_utils import redirect_stdout_stderr
 from openadapt.custom_logger import logger
 from openadapt.db import crud
+from openadapt.db.db import get_read_only_session_maker
+
+with redirect_stdout_stderr():
+    from tqdm import tqdm
 
 MAX_PROCESS_ITERS = 1
 MOUSE_MOVE_EVENT_MERGE_CLICK_DISTANCE_THRESHOLD = 5
@@ -59,8 +67,11 @@ def get_events(
         )
         return [event for event in action_events if event.parent_id is None]
 
-    raw_action_event_dicts = utils.rows2dicts(action_events)
-    logger.debug(f"raw_action_event_dicts=\n{pformat(raw_action_event_dicts)}")
+    # only converted to dicts if a handler would emit the message
+    logger.opt(lazy=True).debug(
+        "raw_action_event_dicts=\n{}",
+        lambda: pformat(utils.rows2dicts(action_events)),
+    )
 
     num_action_events = len(action_events)
     assert num_action_events > 0, "No action events found."
@@ -74,6 +85,8 @@ def get_events(
     num_browser_events_raw = num_browser_events
     duration_raw = action_events[-1].timestamp - action_events[0].timestamp
 
+    # whether click and typing groups were assigned while recording
+    is_grouped = any(event.group_timestamp is not None for event in action_events)
     num_process_iters = 0
     if process:
         while True:
@@ -95,6 +108,7 @@ def get_events(
                 window_events,
                 screenshots,
                 browser_events,
+                is_grouped,
             )
             if (
                 len(action_events) == num_action_events
@@ -111,6 +125,12 @@ def get_events(
             if num_process_iters == MAX_PROCESS_ITERS:
                 break
 
+        if is_grouped:
+            group_stats = verify_event_groups(action_events)
+            logger.info(f"{group_stats=}")
+            if meta is not None:
+                meta["group_stats"] = group_stats
+
     if meta is not None:
         format_num = lambda num, raw_num: (  # noqa: E731
             f"{num} of {raw_num} ({(num / raw_num):.2%})" if raw_num else "0"
@@ -148,6 +168,151 @@ def get_events(
     return action_events  # , window_events, screenshots, browser_events
 
 
+def summarize_event_dicts(action_events: list[models.ActionEvent]) -> list[dict]:
+    """Convert processed action events into plain (picklable) dictionaries.
+
+    Default summary function for get_events_batch.
+
+    Args:
+        action_events (list[models.ActionEvent]): The processed action events.
+
+    Returns:
+        list[dict]: One dictionary per top-level event, with children nested.
+    """
+
+    def convert_keys(event_dict: dict) -> dict:
+        for key in ("key", "canonical_key"):
+            if key in event_dict:
+                event_dict[key] = str(event_dict[key])
+        if "reducer_names" in event_dict:
+            event_dict["reducer_names"] = sorted(event_dict["reducer_names"])
+        for child_dict in event_dict.get("children", []):
+            convert_keys(child_dict)
+        return event_dict
+
+    event_dicts = utils.rows2dicts(action_events, drop_constant=False)
+    return [convert_keys(event_dict) for event_dict in event_dicts]
+
+
+def _get_events_worker(
+    recording_id: int,
+    process: bool,
+    summarize_fn: Callable[[list[models.ActionEvent]], Any],
+    db_url: str | None = None,
+) -> dict[str, Any]:
+    """Load, process and summarize the events of a single recording.
+
+    Runs in a worker process of get_events_batch, so it opens (and closes) its own
+    read-only session and only returns picklable data.
+
+    Args:
+        recording_id (int): The id of the recording.
+        process (bool): Whether to process the events.
+        summarize_fn (Callable): Converts the processed events into the result.
+        db_url (str, optional): The URL of the database. Defaults to config.DB_URL.
+
+    Returns:
+        dict: The recording id, summarized events, processing metadata and duration.
+    """
+    start_time = time.time()
+    if db_url is None:
+        session = crud.get_new_session(read_only=True)
+    else:
+        session = get_read_only_session_maker(sa.create_engine(db_url))()
+    try:
+        recording = crud.get_recording_by_id(session, recording_id)
+        assert recording, f"No recording found with {recording_id=}"
+        meta = {}
+        action_events = get_events(session, recording, process=process, meta=meta)
+        result = summarize_fn(action_events)
+    finally:
+        session.close()
+    return {
+        "recording_id": recording_id,
+        "result": result,
+        "meta": meta,
+        "duration": time.time() - start_time,
+    }
+
+
+def get_events_batch(
+    recording_ids: list[int],
+    process: bool = True,
+    summarize_fn: Callable[[list[models.ActionEvent]], Any] = summarize_event_dicts,
+    max_workers: int | None = None,
+    db_url: str | None = None,
+) -> tuple[dict[int, dict[str, Any]], dict[int, str]]:
+    """Retrieve and process events for many recordings in parallel.
+
+    Each recording is handled by a worker process with its own read-only session.
+    Workers return compact summaries (by default, plain dictionaries) rather than
+    ORM objects, which cannot be shared across processes.
+
+    Args:
+        recording_ids (list[int]): The ids of the recordings to process.
+        process (bool): Whether to process the events. Default is True.
+        summarize_fn (Callable): Module-level (i.e. picklable) function which
+          converts a recording's processed action events into the value stored in
+          the results. Default is summarize_event_dicts.
+        max_workers (int, optional): The number of worker processes. Defaults to
+          the number of CPUs.
+        db_url (str, optional): The URL of the database, e.g. of an exported
+          recording. Defaults to config.DB_URL.
+
+    Returns:
+        tuple: A tuple containing:
+          - dict mapping recording id to a dict with keys "result", "meta" and
+            "duration".
+          - dict mapping recording id to the error message of failed recordings.
+    """
+    results = {}
+    failures = {}
+    if not recording_ids:
+        return results, failures
+
+    max_workers = min(max_workers or multiprocessing.cpu_count(), len(recording_ids))
+    logger.info(f"{len(recording_ids)=} {max_workers=}")
+    start_time = time.time()
+
+    # spawn (rather than fork) so that workers don't inherit the parent's
+    # database connections
+    mp_context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context) as pool:
+        future_to_recording_id = {
+            pool.submit(
+                _get_events_worker, recording_id, process, summarize_fn, db_url
+            ): recording_id
+            for recording_id in recording_ids
+        }
+        with redirect_stdout_stderr():
+            with tqdm(
+                total=len(recording_ids),
+                desc="Processing recordings",
+                unit="recording",
+                colour="green",
+                dynamic_ncols=True,
+            ) as progress:
+                for future in as_completed(future_to_recording_id):
+                    recording_id = future_to_recording_id[future]
+                    try:
+                        worker_result = future.result()
+                    except Exception as exc:
+                        logger.warning(f"{recording_id=} failed: {exc=}")
+                        failures[recording_id] = repr(exc)
+                    else:
+                        results[recording_id] = {
+                            key: val
+                            for key, val in worker_result.items()
+                            if key != "recording_id"
+                        }
+                    progress.set_postfix(failed=len(failures))
+                    progress.update()
+
+    duration = time.time() - start_time
+    logger.info(f"{len(results)=} {len(failures)=} {duration=}")
+    return results, failures
+
+
 def make_parent_event(
     child: models.ActionEvent, extra: dict[str, Any] = None
 ) -> models.ActionEvent:
@@ -881,6 +1046,7 @@ def merge_events(
     window_events: list[models.WindowEvent],
     screenshots: list[models.Screenshot],
     browser_events: list[models.BrowserEvent],
+    is_grouped: bool = False,
 ) -> tuple[
     list[models.ActionEvent],
     list[models.WindowEvent],
@@ -892,6 +1058,9 @@ def merge_events(
         action_events (list): The list of action events.
         window_events (list): The list of window events.
         screenshots (list): The list of screenshots.
+        is_grouped (bool): Whether click and typing groups were assigned while
+          recording, in which case they are built by group_action_events rather
+          than found by merging.
 
     Returns:
         tuple: A tuple containing the processed action events, window events,
@@ -910,17 +1079,27 @@ def merge_events(
         f" {num_screenshots=} {num_browser_events=} "
         f"{num_total=}"
     )
-    process_fns = [
-        remove_invalid_keyboard_events,
-        remove_redundant_mouse_move_events,
-        merge_consecutive_keyboard_events,
-        merge_consecutive_mouse_move_events,
-        merge_consecutive_mouse_scroll_events,
-        merge_consecutive_mouse_click_events,
-        # this causes clicks to fail to be registered in NaiveReplayStrategy
-        # TODO: remove
-        # remove_move_before_click,
-    ]
+    if is_grouped:
+        # click and typing groups were assigned while recording
+        process_fns = [
+            remove_invalid_keyboard_events,
+            remove_redundant_mouse_move_events,
+            group_action_events,
+            merge_consecutive_mouse_move_events,
+            merge_consecutive_mouse_scroll_events,
+        ]
+    else:
+        process_fns = [
+            remove_invalid_keyboard_events,
+            remove_redundant_mouse_move_events,
+            merge_consecutive_keyboard_events,
+            merge_consecutive_mouse_move_events,
+            merge_consecutive_mouse_scroll_events,
+            merge_consecutive_mouse_click_events,
+            # this causes clicks to fail to be registered in NaiveReplayStrategy
+            # TODO: remove
+            # remove_move_before_click,
+        ]
     for process_fn in process_fns:
         action_events = process_fn(action_events)
         # TODO: keep events in which window_event_timestamp is updated
@@ -980,3 +1159,251 @@ def merge_events(
         f" {pct_browser_events=} {pct_total=}"
     )
     return action_events, window_events, screenshots, browser_events
+
+
+class OnlineEventGrouper:
+    """Assign click and typing groups to action events as they are recorded.
+
+    Groups follow the same rules as merge_consecutive_mouse_click_events and
+    merge_consecutive_keyboard_events, using only the events seen so far: each
+    left click or key event is assigned the timestamp of the first event in its group,
+    so that consumers can group events without a post-processing pass (see
+    group_action_events). Mouse moves to the position of the previous mouse event do
+    not interrupt a group, since remove_redundant_mouse_move_events discards them.
+    """
+
+    def __init__(
+        self,
+        double_click_interval_seconds: float,
+        double_click_distance_pixels: float,
+        group_named_keys: bool = KEYBOARD_EVENTS_MERGE_GROUP_NAMED_KEYS,
+    ) -> None:
+        """Initialize.
+
+        Args:
+            double_click_interval_seconds (float): The double click interval.
+            double_click_distance_pixels (float): The double click distance.
+            group_named_keys (bool): Whether to split typing groups on named keys,
+                as in merge_consecutive_keyboard_events.
+        """
+        self.double_click_interval_seconds = double_click_interval_seconds
+        self.double_click_distance_pixels = double_click_distance_pixels
+        self.group_named_keys = group_named_keys
+        self.prev_mouse_position = None
+        self._reset_click_group()
+        self._reset_key_group()
+
+    def _reset_click_group(self) -> None:
+        self.click_group_timestamp = None
+        self.click_group_size = 0
+        self.prev_press_data = None
+        self.prev_press_timestamp = None
+
+    def _reset_key_group(self) -> None:
+        self.key_group_timestamp = None
+        self.key_group_size = 0
+        self.key_group_closed = False
+        self.pressed_key_names = set()
+
+    def add(self, timestamp: float, event_data: dict[str, Any]) -> float | None:
+        """Assign an action event to a group.
+
+        Args:
+            timestamp (float): The timestamp of the action event.
+            event_data (dict): The action event data, as written by record.py.
+
+        Returns:
+            float | None: The timestamp of the first event in the group, or None if
+                the event does not belong to a group.
+        """
+        name = event_data["name"]
+        position = (event_data.get("mouse_x"), event_data.get("mouse_y"))
+        if name == "move" and position == self.prev_mouse_position:
+            return None
+        self.prev_mouse_position = position if name in ("move", "click") else None
+
+        is_click = name == "click" and event_data.get("mouse_button_name") == "left"
+        is_key = name in ("press", "release") and any(
+            event_data.get(f"key_{attr_name}") is not None
+            for attr_name in ("name", "char", "vk")
+        )
+        if not is_click:
+            self._reset_click_group()
+        if not is_key:
+            self._reset_key_group()
+        if is_click:
+            return self._add_click(timestamp, event_data)
+        if is_key:
+            return self._add_key(timestamp, event_data)
+        return None
+
+    def _add_click(self, timestamp: float, event_data: dict[str, Any]) -> float | None:
+        if event_data["mouse_pressed"]:
+            prev_data = self.prev_press_data
+            is_double_click = (
+                self.click_group_size == 2
+                and timestamp - self.prev_press_timestamp
+                <= self.double_click_interval_seconds
+                and abs(event_data["mouse_x"] - prev_data["mouse_x"])
+                <= self.double_click_distance_pixels
+                and abs(event_data["mouse_y"] - prev_data["mouse_y"])
+                <= self.double_click_distance_pixels
+            )
+            if not is_double_click:
+                self.click_group_timestamp = timestamp
+                self.click_group_size = 0
+            self.prev_press_data = event_data
+            self.prev_press_timestamp = timestamp
+        elif self.click_group_timestamp is None or self.click_group_size % 2 == 0:
+            # release without a press
+            return None
+        group_timestamp = self.click_group_timestamp
+        self.click_group_size += 1
+        if self.click_group_size == 4:
+            # doubleclick is complete
+            self._reset_click_group()
+        return group_timestamp
+
+    def _add_key(self, timestamp: float, event_data: dict[str, Any]) -> float:
+        was_pressed = bool(self.pressed_key_names)
+        key_name = event_data.get("key_name")
+        if self.group_named_keys and key_name:
+            if event_data["name"] == "press":
+                self.pressed_key_names.add(key_name)
+            else:
+                self.pressed_key_names.discard(key_name)
+        is_pressed = bool(self.pressed_key_names)
+        group_start = is_pressed and not was_pressed
+        group_end = was_pressed and not is_pressed
+        if (
+            self.key_group_timestamp is None
+            or self.key_group_closed
+            or (group_start and self.key_group_size)
+        ):
+            self.key_group_timestamp = timestamp
+            self.key_group_size = 0
+            self.key_group_closed = False
+        self.key_group_size += 1
+        self.key_group_closed = group_end
+        return self.key_group_timestamp
+
+
+def group_action_events(
+    action_events: list[models.ActionEvent],
+) -> list[models.ActionEvent]:
+    """Group raw action events by the groups assigned while recording.
+
+    Used by merge_events in place of merge_consecutive_keyboard_events and
+    merge_consecutive_mouse_click_events for recordings whose events were grouped
+    online (see OnlineEventGrouper). As in those, each parent event takes the
+    timestamp of its first child, and the time spanned by each group is removed from
+    the timestamps of subsequent events.
+
+    Args:
+        action_events (list[models.ActionEvent]): The raw action events, ordered by
+            timestamp.
+
+    Returns:
+        list[models.ActionEvent]: The action events, with the events of each group
+            of more than one event replaced by a singleclick, doubleclick or type
+            parent event at the position of the group's first event.
+    """
+    children_by_group_timestamp = {}
+    last_child_by_group_timestamp = {}
+    for event in action_events:
+        group_timestamp = event.group_timestamp
+        if group_timestamp is not None:
+            children_by_group_timestamp.setdefault(group_timestamp, []).append(event)
+            last_child_by_group_timestamp[group_timestamp] = event
+
+    rval = []
+    dt = 0
+    # the original timestamp of the last event added to rval, and of the first
+    # event of each group
+    prev_timestamp = None
+    first_timestamp_by_group_timestamp = {}
+    for event in action_events:
+        group_timestamp = event.group_timestamp
+        timestamp = event.timestamp
+        if group_timestamp is None:
+            event.timestamp -= dt
+            rval.append(event)
+            prev_timestamp = timestamp
+            continue
+        children = children_by_group_timestamp[group_timestamp]
+        reducer_name = "mouse_click" if children[0].name == "click" else "keyboard"
+        if event is children[0]:
+            first_timestamp_by_group_timestamp[group_timestamp] = timestamp
+            if len(children) == 1:
+                parent = event
+            elif event.name == "click":
+                parent = make_parent_event(
+                    event,
+                    {
+                        "name": "doubleclick" if len(children) == 4 else "singleclick",
+                        "mouse_x": event.mouse_x,
+                        "mouse_y": event.mouse_y,
+                        "mouse_button_name": event.mouse_button_name,
+                        "children": children,
+                    },
+                )
+            else:
+                parent = make_parent_event(
+                    event, {"children": children, "name": "type"}
+                )
+            parent.timestamp = timestamp - dt
+            parent.reducer_names.add(reducer_name)
+            rval.append(parent)
+            prev_timestamp = timestamp
+        if event is last_child_by_group_timestamp[group_timestamp]:
+            # events between the first and last child keep their order
+            first_timestamp = first_timestamp_by_group_timestamp[group_timestamp]
+            dt += timestamp - max(first_timestamp, prev_timestamp)
+            prev_timestamp = timestamp
+    return rval
+
+
+def verify_event_groups(action_events: list[models.ActionEvent]) -> dict[str, int]:
+    """Compare the groups assigned while recording with those of processed events.
+
+    For recordings grouped while recording, the processed groups are built from the
+    assigned groups (see group_action_events), so this checks that they survived the
+    remaining processing.
+
+    Args:
+        action_events (list[models.ActionEvent]): The processed action events.
+
+    Returns:
+        dict[str, int]: The number of processed groups whose children match an
+            online group exactly, the number which do not, and the number of online
+            groups (of more than one event) without a matching processed group.
+    """
+    group_sizes = {}
+
+    def count_group_sizes(events: list[models.ActionEvent]) -> None:
+        for event in events:
+            if event.children:
+                count_group_sizes(event.children)
+            elif event.group_timestamp is not None:
+                group_timestamp = event.group_timestamp
+                group_sizes[group_timestamp] = group_sizes.get(group_timestamp, 0) + 1
+
+    count_group_sizes(action_events)
+    num_matched = 0
+    num_mismatched = 0
+    for event in action_events:
+        if event.name not in ("singleclick", "doubleclick", "type"):
+            continue
+        group_timestamps = {child.group_timestamp for child in event.children}
+        group_timestamp = group_timestamps.pop() if len(group_timestamps) == 1 else None
+        if group_sizes.get(group_timestamp) == len(event.children):
+            num_matched += 1
+        else:
+            logger.debug(f"{event=} {group_timestamps=}")
+            num_mismatched += 1
+    num_online_groups = len([size for size in group_sizes.values() if size > 1])
+    return {
+        "num_matched": num_matched,
+        "num_mismatched": num_mismatched,
+        "num_unmatched_online": num_online_groups - num_matched,
+    }
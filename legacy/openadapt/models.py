@@ -1,17 +1,21 @@
 """This module defines the models used in the OpenAdapt system."""
 
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from itertools import zip_longest
 from typing import Any, Type, Union
+import bisect
 import copy
 import io
 import sys
 import textwrap
+import threading
+import time
 
 from bs4 import BeautifulSoup
 from pynput import keyboard
-from PIL import Image, ImageChops
+from PIL import Image
 import numpy as np
 import sqlalchemy as sa
 
@@ -102,6 +106,22 @@ class Recording(db.Base):
     )
 
     _processed_action_events = None
+    _screenshot_timestamps = None
+
+    @property
+    def screenshot_timestamps(self) -> list[float]:
+        """Get the sorted timestamps of the screenshots of the recording.
+
+        The list is built once, and only rebuilt if screenshots were added since.
+        """
+        screenshots = self.screenshots
+        if self._screenshot_timestamps is None or len(
+            self._screenshot_timestamps
+        ) != len(screenshots):
+            self._screenshot_timestamps = [
+                screenshot.timestamp for screenshot in screenshots
+            ]
+        return self._screenshot_timestamps
 
     @property
     def processed_action_events(self) -> list:
@@ -145,6 +165,8 @@ class ActionEvent(db.Base):
     window_event_id = sa.Column(sa.ForeignKey("window_event.id"))
     browser_event_timestamp = sa.Column(ForceFloat)
     browser_event_id = sa.Column(sa.ForeignKey("browser_event.id"))
+    # timestamp of the first event in the click/typing group assigned while recording
+    group_timestamp = sa.Column(ForceFloat)
     mouse_x = sa.Column(sa.Numeric(asdecimal=False))
     mouse_y = sa.Column(sa.Numeric(asdecimal=False))
     mouse_dx = sa.Column(sa.Numeric(asdecimal=False))
@@ -831,90 +853,348 @@ class BrowserEvent(db.Base):
 
 
 class FrameCache:
-    """Provide a caching mechanism for video frames to minimize IO operations.
+    """Provide a least recently used cache of decoded video frames, bounded in bytes.
 
-    This class maintains a nested dictionary to store video frames by video
-    filename and their respective timestamps. It offers functionalities to get
-    frames from the cache or load them if they are not available in the cache.
+    Frames are stored as NumPy arrays keyed by video file path, timestamp and the
+    maximum side length they were downscaled to (if any), so that reduced resolution
+    tiers of a frame can be cached alongside the full resolution frame. Whenever the
+    total size of the cached arrays exceeds max_bytes, the least recently used frames
+    are evicted.
 
     Attributes:
-        capacity (int): The maximum number of frames that can be stored per video.
-            If set to 0, the capacity is considered infinite.
-        frames (dict): A nested dictionary to store frames by video filename and
-            timestamp.
+        max_bytes (int): The maximum total size of the cached frames in bytes.
+        num_prefetch (int): The number of following frames to load along with a frame
+            which is not cached.
+        frames (OrderedDict): (video file path, timestamp, max side) -> frame array,
+            from least to most recently used.
+        num_bytes (int): The total size of the cached frames in bytes.
+        stats (dict): The number of cache hits and misses in get_frame, and of
+            decoded and evicted frames.
     """
 
     ENABLED = True
 
-    def __init__(self, capacity: int = 0) -> None:
-        """Initialize a new FrameCache instance with specified capacity.
+    def __init__(
+        self,
+        max_bytes: int | None = None,
+        num_prefetch: int | None = None,
+    ) -> None:
+        """Initialize a new FrameCache instance.
 
         Args:
-            capacity (int): The maximum number of frames to cache per video file.
+            max_bytes (int, optional): The maximum total size of the cached frames in
+                bytes. Defaults to config.FRAME_CACHE_MAX_BYTES.
+            num_prefetch (int, optional): The number of following frames to load along
+                with a frame which is not cached. Defaults to
+                config.FRAME_CACHE_NUM_PREFETCH.
         """
-        self.capacity = capacity
-        # Nested dictionary to store frames by video filename and timestamp
-        self.frames = {}
+        self.max_bytes = (
+            config.FRAME_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        )
+        self.num_prefetch = (
+            config.FRAME_CACHE_NUM_PREFETCH if num_prefetch is None else num_prefetch
+        )
+        self.frames = OrderedDict()
+        self.num_bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "decoded": 0, "evictions": 0}
+        self.lock = threading.RLock()
 
-    def get_frame(self, video_file_path: str, timestamp: float) -> Image.Image:
+    def get_frame(
+        self,
+        video_file_path: str,
+        timestamp: float,
+        max_side: int | None = None,
+        next_timestamps: list[float] | None = None,
+    ) -> Image.Image:
         """Retrieve a frame by video file path and timestamp from the cache.
 
-        If the frame is not available in the cache, it logs a warning and loads
-        the frame into the cache before returning it.
+        If the frame is not cached, it is loaded along with the first num_prefetch
+        of next_timestamps, so that consumers iterating over frames in timeline order
+        decode them in batches.
 
         Args:
             video_file_path (str): The path to the video file.
             timestamp (float): The timestamp of the frame in the video.
+            max_side (int, optional): If provided, the frame is downscaled such that
+                neither side exceeds this many pixels.
+            next_timestamps (list[float], optional): The timestamps of the frames
+                which are likely to be requested next, in order.
 
         Returns:
             Image.Image: The requested video frame.
         """
-        # Check if the frame is cached
-        if not (
-            video_file_path in self.frames and timestamp in self.frames[video_file_path]
-        ):
-            # Issue a warning if the frame needs to be loaded without prior caching
-            logger.warning(
-                f"Frame at timestamp {timestamp} from {video_file_path} was not "
-                "pre-cached. Loading it now, but consider using cache_frames to load "
-                "batches."
-            )
-            # Load the frame since it wasn't cached
-            self.cache_frames(video_file_path, [timestamp])
-        return self.frames[video_file_path][timestamp]
-
-    def cache_frames(self, video_file_path: str, timestamps: list[float]) -> None:
+        key = (video_file_path, timestamp, max_side)
+        with self.lock:
+            array = self.frames.get(key)
+            if array is not None:
+                self.frames.move_to_end(key)
+                self.stats["hits"] += 1
+            else:
+                self.stats["misses"] += 1
+        if array is None:
+            prefetch_timestamps = (next_timestamps or [])[: self.num_prefetch]
+            array = self.cache_frames(
+                video_file_path, [timestamp] + prefetch_timestamps, max_side
+            )[0]
+            logger.debug(f"{self.stats=} {self.num_bytes=} {len(self.frames)=}")
+        return Image.fromarray(array)
+
+    def cache_frames(
+        self,
+        video_file_path: str,
+        timestamps: list[float],
+        max_side: int | None = None,
+    ) -> list[np.ndarray]:
         """Cache multiple frames from a video file at specified timestamps.
 
-        This method checks which frames are not already cached and loads them.
-        It respects the capacity limit of the cache, potentially evicting the oldest
-        cached frame to make room for new ones if the capacity is exceeded.
+        Only frames which are not already cached are decoded. Reduced resolution
+        frames are downscaled from the cached full resolution frame if there is one.
 
         Args:
             video_file_path (str): The path to the video file.
             timestamps (list[float]): A list of timestamps of frames to cache.
+            max_side (int, optional): If provided, the frames are downscaled such that
+                neither side exceeds this many pixels.
 
         Returns:
-            None
+            list[np.ndarray]: The frames, in the order of timestamps.
         """
         # avoid circular import
         from openadapt import video
 
-        # Ensure the dictionary for this video file is initialized
-        if video_file_path not in self.frames:
-            self.frames[video_file_path] = OrderedDict()
+        array_by_timestamp = {}
+        with self.lock:
+            for timestamp in timestamps:
+                array = self.frames.get((video_file_path, timestamp, max_side))
+                if array is None and max_side:
+                    array = self.frames.get((video_file_path, timestamp, None))
+                    if array is not None:
+                        array = self._put(
+                            (video_file_path, timestamp, max_side),
+                            self._downscale(Image.fromarray(array), max_side),
+                        )
+                if array is not None:
+                    array_by_timestamp[timestamp] = array
+
+        uncached_timestamps = list(
+            dict.fromkeys(
+                timestamp
+                for timestamp in timestamps
+                if timestamp not in array_by_timestamp
+            )
+        )
+        if uncached_timestamps:
+            images = video.extract_frames(video_file_path, uncached_timestamps)
+            with self.lock:
+                for timestamp, image in zip(uncached_timestamps, images):
+                    if max_side:
+                        image = self._downscale(image, max_side)
+                    array_by_timestamp[timestamp] = self._put(
+                        (video_file_path, timestamp, max_side), image
+                    )
+                self.stats["decoded"] += len(uncached_timestamps)
+        return [array_by_timestamp[timestamp] for timestamp in timestamps]
+
+    def clear(self) -> None:
+        """Remove all frames from the cache."""
+        with self.lock:
+            self.frames.clear()
+            self.num_bytes = 0
+
+    def _downscale(self, image: Image.Image, max_side: int) -> Image.Image:
+        image = image.copy()
+        image.thumbnail((max_side, max_side))
+        return image
+
+    def _put(self, key: tuple, image: Image.Image) -> np.ndarray:
+        array = np.asarray(image)
+        array.flags.writeable = False
+        if key in self.frames:
+            self.num_bytes -= self.frames.pop(key).nbytes
+        self.frames[key] = array
+        self.num_bytes += array.nbytes
+        while self.num_bytes > self.max_bytes and self.frames:
+            _, evicted_array = self.frames.popitem(last=False)
+            self.num_bytes -= evicted_array.nbytes
+            self.stats["evictions"] += 1
+        return array
+
+
+class FramePrefetcher:
+    """Decode video frames into the frame cache ahead of a sequential consumer.
+
+    Given the timestamps of the frames a consumer will request, in order, a
+    background thread decodes up to window frames ahead of the consumer's position.
+    Decoding mostly releases the GIL, so it overlaps with the consumer's own work.
+    The time the consumer spends waiting for frames is recorded in stats, to help
+    size the window.
+
+    Usage:
+
+        with FramePrefetcher(video_file_path, timestamps) as prefetcher:
+            for timestamp in timestamps:
+                image = prefetcher.get_frame(timestamp)
+        logger.info(f"{prefetcher.stats=}")
 
-        # Load only the frames that have not been loaded yet
-        uncached_timestamps = [
-            t for t in timestamps if t not in self.frames[video_file_path]
-        ]
-        frames = video.extract_frames(video_file_path, uncached_timestamps)
-        # Add loaded frames to cache, respecting capacity if not infinite
-        for timestamp, frame in zip(uncached_timestamps, frames):
-            if self.capacity > 0 and len(self.frames[video_file_path]) >= self.capacity:
-                # Remove oldest frame if capacity is exceeded
-                self.frames[video_file_path].popitem(last=False)
-            self.frames[video_file_path][timestamp] = frame
+    Attributes:
+        video_file_path (str): The path to the video file.
+        timestamps (list[float]): The timestamps of the frames, in the order in which
+            they will be requested.
+        window (int): The maximum number of frames to decode ahead of the consumer.
+        frame_cache (FrameCache): The cache into which frames are decoded.
+        stats (dict): The number of frames requested, the number of times and the
+            total and maximum seconds the consumer waited for frames, and the total
+            seconds spent decoding.
+    """
+
+    BATCH_SIZE = 4
+
+    def __init__(
+        self,
+        video_file_path: str,
+        timestamps: list[float],
+        window: int | None = None,
+        cache: FrameCache | None = None,
+    ) -> None:
+        """Initialize the prefetcher.
+
+        Args:
+            video_file_path (str): The path to the video file.
+            timestamps (list[float]): The timestamps of the frames, in the order in
+                which they will be requested.
+            window (int, optional): The maximum number of frames to decode ahead of
+                the consumer. Defaults to config.FRAME_PREFETCH_WINDOW.
+            cache (FrameCache, optional): The cache into which frames are decoded.
+                Defaults to the cache used by Screenshot.image.
+        """
+        self.video_file_path = video_file_path
+        self.timestamps = list(dict.fromkeys(timestamps))
+        self.window = config.FRAME_PREFETCH_WINDOW if window is None else window
+        self.frame_cache = frame_cache if cache is None else cache
+        self.stats = {
+            "num_frames": 0,
+            "num_stalls": 0,
+            "stall_seconds": 0.0,
+            "max_stall_seconds": 0.0,
+            "decode_seconds": 0.0,
+        }
+        self._idx_by_timestamp = {
+            timestamp: idx for idx, timestamp in enumerate(self.timestamps)
+        }
+        self._condition = threading.Condition()
+        # index of the next frame the consumer will request
+        self._consumer_idx = 0
+        # frames before this index have been decoded or skipped
+        self._num_decoded = 0
+        self._stopped = False
+        self._done = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> "FramePrefetcher":
+        """Start decoding frames in the background.
+
+        Returns:
+            FramePrefetcher: The prefetcher.
+        """
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop decoding frames and wait for the background thread to finish."""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def __enter__(self) -> "FramePrefetcher":
+        """Start decoding frames in the background."""
+        return self.start()
+
+    def __exit__(self, *args: tuple) -> None:
+        """Stop decoding frames."""
+        self.stop()
+
+    def wait(self, timestamp: float) -> None:
+        """Wait until the frame at a timestamp has been decoded.
+
+        Frames before it are no longer prefetched.
+
+        Args:
+            timestamp (float): The timestamp of the frame.
+        """
+        idx = self._idx_by_timestamp[timestamp]
+        with self._condition:
+            self._consumer_idx = max(self._consumer_idx, idx)
+            self._condition.notify_all()
+            if self._num_decoded > idx or self._done or not self._thread.is_alive():
+                return
+            start_time = time.perf_counter()
+            self._condition.wait_for(lambda: self._num_decoded > idx or self._done)
+        self._add_stall(time.perf_counter() - start_time)
+
+    def get_frame(self, timestamp: float) -> Image.Image:
+        """Get the frame at a timestamp, waiting for it to be decoded if necessary.
+
+        Args:
+            timestamp (float): The timestamp of the frame.
+
+        Returns:
+            Image.Image: The frame.
+        """
+        self.stats["num_frames"] += 1
+        self.wait(timestamp)
+        num_misses = self.frame_cache.stats["misses"]
+        start_time = time.perf_counter()
+        image = self.frame_cache.get_frame(self.video_file_path, timestamp)
+        if self.frame_cache.stats["misses"] > num_misses:
+            # the frame was evicted (or never prefetched) and decoded here
+            self._add_stall(time.perf_counter() - start_time)
+        return image
+
+    def _add_stall(self, duration: float) -> None:
+        self.stats["num_stalls"] += 1
+        self.stats["stall_seconds"] += duration
+        self.stats["max_stall_seconds"] = max(self.stats["max_stall_seconds"], duration)
+
+    def _run(self) -> None:
+        try:
+            self._prefetch()
+        except Exception as exc:
+            # the consumer decodes the remaining frames itself
+            logger.exception(exc)
+        finally:
+            with self._condition:
+                self._done = True
+                self._condition.notify_all()
+
+    def _prefetch(self) -> None:
+        num_timestamps = len(self.timestamps)
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._stopped
+                    or self._num_decoded
+                    < min(self._consumer_idx + self.window, num_timestamps)
+                )
+                if self._stopped:
+                    return
+                start_idx = max(self._num_decoded, self._consumer_idx)
+                end_idx = min(
+                    self._consumer_idx + self.window,
+                    num_timestamps,
+                    start_idx + self.BATCH_SIZE,
+                )
+            start_time = time.perf_counter()
+            self.frame_cache.cache_frames(
+                self.video_file_path, self.timestamps[start_idx:end_idx]
+            )
+            with self._condition:
+                self.stats["decode_seconds"] += time.perf_counter() - start_time
+                self._num_decoded = end_idx
+                self._condition.notify_all()
+            if end_idx == num_timestamps:
+                return
 
 
 # for use in Screenshot.image
@@ -925,6 +1205,9 @@ class Screenshot(db.Base):
     """Class representing a screenshot in the database."""
 
     __tablename__ = "screenshot"
+    # downscaling factors of the levels of the thumbnail pyramid (see image_at), each
+    # stored in a png_thumbnail_<scale>_data column
+    THUMBNAIL_SCALES = (2, 4, 8)
 
     id = sa.Column(sa.Integer, primary_key=True)
     recording_timestamp = sa.Column(ForceFloat)
@@ -933,6 +1216,13 @@ class Screenshot(db.Base):
     png_data = sa.Column(sa.LargeBinary)
     png_diff_data = sa.Column(sa.LargeBinary, nullable=True)
     png_diff_mask_data = sa.Column(sa.LargeBinary, nullable=True)
+    png_thumbnail_2_data = sa.Column(sa.LargeBinary, nullable=True)
+    png_thumbnail_4_data = sa.Column(sa.LargeBinary, nullable=True)
+    png_thumbnail_8_data = sa.Column(sa.LargeBinary, nullable=True)
+    # the pixels changed since the previous screenshot (see utils.pack_mask), and the
+    # bounding boxes of the changed regions (see utils.get_mask_bboxes)
+    packed_diff_mask_data = sa.Column(sa.LargeBinary, nullable=True)
+    diff_bboxes_data = sa.Column(sa.JSON, nullable=True)
     # cropped_png_data = sa.Column(sa.LargeBinary, nullable=True)
 
     recording = sa.orm.relationship("Recording", back_populates="screenshots")
@@ -962,6 +1252,20 @@ class Screenshot(db.Base):
             save_scrubbed_image(self.diff, "png_diff_data")
         if self.png_diff_mask_data:
             save_scrubbed_image(self.diff_mask, "png_diff_mask_data")
+        # the mask can reveal the shapes of scrubbed text, so it is recomputed from
+        # the scrubbed images when needed
+        self.packed_diff_mask_data = None
+        self._diff = None
+        self._diff_mask = None
+        if any(
+            getattr(self, f"png_thumbnail_{scale}_data")
+            for scale in self.THUMBNAIL_SCALES
+        ):
+            # downscale the scrubbed image rather than scrubbing each thumbnail
+            scrubbed_image = self.convert_binary_to_png(self.png_data)
+            for name, png_data in self.get_thumbnail_data(scrubbed_image).items():
+                setattr(self, name, png_data)
+        self._thumbnails = {}
 
     @sa.orm.reconstructor
     def initialize_instance_attributes(self) -> None:
@@ -973,7 +1277,10 @@ class Screenshot(db.Base):
         self._cropped_image = None
         self._diff = None
         self._diff_mask = None
+        self._diff_bboxes = None
         self._base64 = None
+        # scale -> thumbnail
+        self._thumbnails = {}
 
     @property
     def image(self) -> Image.Image:
@@ -987,15 +1294,23 @@ class Screenshot(db.Base):
 
                 video_file_path = video.get_video_file_path(self.recording_timestamp)
                 if FrameCache.ENABLED:
-                    if video_file_path not in frame_cache.frames:
-                        screenshot_timestamps = [
-                            screenshot.timestamp - self.recording.video_start_time
-                            for screenshot in self.recording.screenshots
+                    # the frame is not kept on the screenshot, so that the memory
+                    # used by frames is bounded by the frame cache
+                    video_start_time = self.recording.video_start_time
+                    screenshot_timestamps = self.recording.screenshot_timestamps
+                    next_idx = bisect.bisect_right(
+                        screenshot_timestamps, self.timestamp
+                    )
+                    next_timestamps = [
+                        screenshot_timestamp - video_start_time
+                        for screenshot_timestamp in screenshot_timestamps[
+                            next_idx : next_idx + frame_cache.num_prefetch
                         ]
-                        frame_cache.cache_frames(video_file_path, screenshot_timestamps)
-                    self._image = frame_cache.get_frame(
+                    ]
+                    return frame_cache.get_frame(
                         video_file_path,
-                        self.timestamp - self.recording.video_start_time,
+                        self.timestamp - video_start_time,
+                        next_timestamps=next_timestamps,
                     )
                 else:
                     self._image = video.extract_frames(
@@ -1004,6 +1319,96 @@ class Screenshot(db.Base):
                     )[0]
         return self._image
 
+    @classmethod
+    def get_thumbnails(
+        cls: type["Screenshot"], image: Image.Image
+    ) -> dict[int, Image.Image]:
+        """Downscale an image to each level of the thumbnail pyramid.
+
+        Each level is downscaled from the previous one.
+
+        Args:
+            image (Image.Image): The full resolution image.
+
+        Returns:
+            dict[int, Image.Image]: Scale -> thumbnail.
+        """
+        thumbnails = {}
+        prev_scale = 1
+        for scale in cls.THUMBNAIL_SCALES:
+            image = image.reduce(scale // prev_scale)
+            thumbnails[scale] = image
+            prev_scale = scale
+        return thumbnails
+
+    @classmethod
+    def get_thumbnail_data(
+        cls: type["Screenshot"], image: Image.Image
+    ) -> dict[str, bytes]:
+        """Get the column values storing the thumbnail pyramid of an image.
+
+        Args:
+            image (Image.Image): The full resolution image.
+
+        Returns:
+            dict[str, bytes]: Column name -> PNG data.
+        """
+        thumbnail_data = {}
+        for scale, thumbnail in cls.get_thumbnails(image).items():
+            with io.BytesIO() as output:
+                thumbnail.save(output, format="PNG")
+                thumbnail_data[f"png_thumbnail_{scale}_data"] = output.getvalue()
+        return thumbnail_data
+
+    def get_thumbnail(self, scale: int) -> Image.Image:
+        """Get a level of the thumbnail pyramid.
+
+        Thumbnails stored with the screenshot are loaded, and otherwise the whole
+        pyramid is generated from the image once.
+
+        Args:
+            scale (int): The downscaling factor of the level (see THUMBNAIL_SCALES).
+
+        Returns:
+            Image.Image: The thumbnail.
+        """
+        assert scale in self.THUMBNAIL_SCALES, (scale, self.THUMBNAIL_SCALES)
+        if scale not in self._thumbnails:
+            png_data = getattr(self, f"png_thumbnail_{scale}_data")
+            if png_data:
+                self._thumbnails[scale] = self.convert_binary_to_png(png_data)
+            else:
+                self._thumbnails = self.get_thumbnails(self.image)
+        return self._thumbnails[scale]
+
+    def image_at(self, max_side: int | None = None) -> Image.Image:
+        """Get the image downscaled such that neither side exceeds max_side.
+
+        The image is downscaled from the smallest level of the thumbnail pyramid
+        whose longest side is at least max_side, so the full resolution image is only
+        loaded if no level is large enough (or thumbnails were not stored, see
+        config.RECORD_THUMBNAILS).
+
+        Args:
+            max_side (int, optional): The maximum width and height in pixels. If None,
+                the full resolution image is returned.
+
+        Returns:
+            Image.Image: The downscaled image.
+        """
+        if max_side is None:
+            return self.image
+        for scale in sorted(self.THUMBNAIL_SCALES, reverse=True):
+            image = self.get_thumbnail(scale)
+            if max(image.size) >= max_side:
+                break
+        else:
+            image = self.image
+        if max(image.size) > max_side:
+            image = image.copy()
+            image.thumbnail((max_side, max_side))
+        return image
+
     @property
     def cropped_image(self) -> Image.Image:
         """Return screenshot image cropped to corresponding action's active window."""
@@ -1030,23 +1435,137 @@ class Screenshot(db.Base):
     @property
     def diff(self) -> Image.Image:
         """Get the difference between the current and previous screenshot."""
-        if self.png_diff_data:
-            return self.convert_binary_to_png(self.png_diff_data)
-
-        assert self.prev, "Attempted to compute diff before setting prev"
-        self._diff = ImageChops.difference(self.image, self.prev.image)
+        if self._diff is None:
+            if self.png_diff_data:
+                self._diff = self.convert_binary_to_png(self.png_diff_data)
+            else:
+                assert self.prev, "Attempted to compute diff before setting prev"
+                self._diff = Image.fromarray(
+                    utils.get_diff(np.asarray(self.image), np.asarray(self.prev.image))
+                )
         return self._diff
 
     @property
     def diff_mask(self) -> Image.Image:
-        """Get the difference mask between the current and previous screenshot."""
-        if self.png_diff_mask_data:
-            return self.convert_binary_to_png(self.png_diff_mask_data)
+        """Get the mask of the pixels changed since the previous screenshot.
 
-        if self.diff:
-            self._diff_mask = self.diff.convert("1")
+        The diff is thresholded as by utils.get_diff_mask.
+        """
+        if self._diff_mask is None:
+            if self.packed_diff_mask_data:
+                mask = utils.unpack_mask(self.packed_diff_mask_data)
+                self._diff_mask = Image.fromarray(mask)
+            elif self.png_diff_mask_data:
+                self._diff_mask = self.convert_binary_to_png(self.png_diff_mask_data)
+            else:
+                self._diff_mask = self.diff.convert("1")
         return self._diff_mask
 
+    @property
+    def diff_bboxes(self) -> list[list[int]]:
+        """Get the bounding boxes of the regions changed since the previous screenshot.
+
+        Returns:
+            list[list[int]]: The left, top, right and bottom (exclusive) of each
+                region (see utils.get_mask_bboxes).
+        """
+        if self._diff_bboxes is None:
+            if self.diff_bboxes_data is not None:
+                self._diff_bboxes = self.diff_bboxes_data
+            else:
+                self._diff_bboxes = utils.get_mask_bboxes(np.asarray(self.diff_mask))
+        return self._diff_bboxes
+
+    @classmethod
+    def get_diff_data(
+        cls: type["Screenshot"], array: np.ndarray, prev_array: np.ndarray
+    ) -> dict[str, Any]:
+        """Get the column values storing the diff between two screenshots.
+
+        Args:
+            array (np.ndarray): The array of the screenshot.
+            prev_array (np.ndarray): The array of the previous screenshot.
+
+        Returns:
+            dict[str, Any]: Column name -> value.
+        """
+        mask = utils.get_diff_mask(array, prev_array)
+        return {
+            "packed_diff_mask_data": utils.pack_mask(mask),
+            "diff_bboxes_data": utils.get_mask_bboxes(mask),
+        }
+
+    @classmethod
+    def get_diff_datas(
+        cls: type["Screenshot"],
+        screenshots: list["Screenshot"],
+        chunk_size: int = 16,
+        num_workers: int | None = None,
+    ) -> list[dict[str, Any]]:
+        """Get the column values storing the diff of each screenshot, in parallel.
+
+        Screenshots are processed in chunks, each in a worker thread, so that each
+        image is decoded about once. Only PNG data and arrays are passed to the worker
+        threads; frames of video-backed screenshots are decoded on the calling thread.
+
+        Args:
+            screenshots (list[Screenshot]): The screenshots, with prev set.
+            chunk_size (int): The number of screenshots processed by each task.
+            num_workers (int, optional): The number of worker threads. Defaults to
+                ThreadPoolExecutor's default.
+
+        Returns:
+            list[dict[str, Any]]: The result of get_diff_data for each screenshot.
+        """
+
+        def get_array(source: bytes | np.ndarray) -> np.ndarray:
+            if isinstance(source, bytes):
+                return np.asarray(Image.open(io.BytesIO(source)))
+            return source
+
+        def get_chunk_diff_datas(
+            chunk: list[tuple[int, bytes | np.ndarray, int, bytes | np.ndarray]],
+        ) -> list[dict[str, Any]]:
+            array_by_id = {}
+            diff_datas = []
+            for screenshot_id, source, prev_id, prev_source in chunk:
+                arrays = []
+                for _id, _source in ((screenshot_id, source), (prev_id, prev_source)):
+                    if _id not in array_by_id:
+                        array_by_id[_id] = get_array(_source)
+                    arrays.append(array_by_id[_id])
+                diff_datas.append(cls.get_diff_data(*arrays))
+                # only the current screenshot can be the next one's prev
+                array_by_id = {screenshot_id: arrays[0]}
+            return diff_datas
+
+        def get_source(screenshot: Screenshot) -> bytes | np.ndarray:
+            if screenshot.png_data:
+                # decoded in the worker thread
+                return screenshot.png_data
+            # frames of video-backed screenshots are loaded lazily through the
+            # session, which is not thread safe, so they are decoded here
+            return np.asarray(screenshot.image)
+
+        with ThreadPoolExecutor(num_workers) as executor:
+            futures = []
+            source_by_id = {}
+            for start in range(0, len(screenshots), chunk_size):
+                chunk = []
+                for screenshot in screenshots[start : start + chunk_size]:
+                    assert (
+                        screenshot.prev
+                    ), "Attempted to compute diff before setting prev"
+                    item = []
+                    for _screenshot in (screenshot, screenshot.prev):
+                        if id(_screenshot) not in source_by_id:
+                            source_by_id[id(_screenshot)] = get_source(_screenshot)
+                        item += [id(_screenshot), source_by_id[id(_screenshot)]]
+                    chunk.append(tuple(item))
+                    source_by_id = {id(screenshot): item[1]}
+                futures.append(executor.submit(get_chunk_diff_datas, chunk))
+            return [diff_data for future in futures for diff_data in future.result()]
+
     @property
     def array(self) -> np.ndarray:
         """Get the NumPy array representation of the image."""
@@ -1,6 +1,7 @@
 """Plotting utilities."""
 
 from collections import defaultdict
+from functools import lru_cache
 from io import BytesIO
 from itertools import cycle
 import math
@@ -9,14 +10,24 @@ import sys
 import unicodedata
 
 from PIL import Image, ImageDraw, ImageEnhance, ImageFont
+from matplotlib import colors as mcolors
+from matplotlib import font_manager
 import matplotlib.pyplot as plt
 import numpy as np
 
-from openadapt import common, models, utils
+from openadapt import common, models, utils, vision
 from openadapt.config import PERFORMANCE_PLOTS_DIR_PATH, config
 from openadapt.custom_logger import logger
 from openadapt.models import ActionEvent
 
+# Set-of-Mark rendering, matching contrib.som.visualizer as used by get_marked_image
+MARK_MASK_ALPHA = 0.1
+MARK_TEXT_ALPHA = 0.8
+# 18pt at the visualizer's 100 dpi
+MARK_FONT_SIZE = 25
+MARK_TEXT_PADDING = 1
+MARK_COLOR_SEED = 0
+
 
 # TODO: move parameters to config
 def draw_ellipse(
@@ -229,6 +240,7 @@ def display_event(
     darken_outside: float | None = None,
     display_text: bool = True,
     dim_outside_window: bool = True,
+    max_side: int | None = None,
 ) -> Image.Image:
     """Display an action event on the image.
 
@@ -249,6 +261,9 @@ def display_event(
           Defaults to None (no darkening).
         display_text (bool): Whether to display action text. Defaults to True.
         dim_outside_window (bool): Whether to dim outside the WindowEvent area.
+        max_side (int, optional): If provided, the event is displayed on the
+          screenshot downscaled such that neither side exceeds this many pixels
+          (see Screenshot.image_at). Ignored if diff is True.
 
     Returns:
         PIL.Image.Image: The image with the action event displayed on it.
@@ -264,9 +279,11 @@ def display_event(
         return None
     if diff and screenshot.diff:
         image = screenshot.diff.convert("RGBA")
+        width_ratio, height_ratio = utils.get_scale_ratios(action_event)
     else:
-        image = screenshot.image.convert("RGBA")
-    width_ratio, height_ratio = utils.get_scale_ratios(action_event)
+        image = screenshot.image_at(max_side).convert("RGBA")
+        width_ratio = image.width / recording.monitor_width
+        height_ratio = image.height / recording.monitor_height
 
     # dim area outside window event
     if dim_outside_window:
@@ -817,18 +834,155 @@ def plot_segments(
     plt.show()
 
 
+@lru_cache(maxsize=None)
+def get_mark_font(font_size: int = MARK_FONT_SIZE) -> ImageFont.FreeTypeFont:
+    """Get the font of Set-of-Mark labels, loading it once per size.
+
+    Args:
+        font_size (int): The font size in pixels.
+
+    Returns:
+        PIL.ImageFont.FreeTypeFont: matplotlib's default sans-serif font, as used by
+            the SoM visualizer, or Pillow's default font if it cannot be loaded.
+    """
+    try:
+        return ImageFont.truetype(font_manager.findfont("sans-serif"), font_size)
+    except (OSError, ValueError) as exc:
+        logger.debug(f"Unable to load sans-serif font, {exc=}")
+        return ImageFont.load_default(font_size)
+
+
+@lru_cache(maxsize=None)
+def get_mark_colors() -> np.ndarray:
+    """Get the colors of Set-of-Mark masks.
+
+    Returns:
+        np.ndarray: The CSS4 colors the SoM visualizer chooses from, as a uint8 array
+            of shape (num_colors, 3), in a fixed random order so that consecutive
+            labels get different colors.
+    """
+    colors = np.array([mcolors.to_rgb(color) for color in mcolors.CSS4_COLORS.values()])
+    rng = np.random.default_rng(MARK_COLOR_SEED)
+    return np.round(rng.permutation(colors) * 255).astype(np.uint8)
+
+
 def get_marked_image(
     original_image: Image.Image,
     masks: list[np.ndarray],
     include_masks: bool = True,
     include_marks: bool = True,
+    centroids: list[tuple[float, float]] | None = None,
+    use_som_visualizer: bool = False,
+) -> Image.Image:
+    """Get a Set-of-Mark image.
+
+    The masks are painted into a single map of labels, which is blended with the
+    image and outlined in one pass, and each label number is drawn at its centroid.
+    The output matches the original SoM visualizer, except that mask colors are
+    assigned deterministically rather than at random.
+
+    Args:
+        original_image (Image.Image): The original PIL image.
+        masks (list[np.ndarray]): A list of masks representing segments in the
+            original image, or vision.CroppedMask objects, or a vision.LabelMap.
+            Later masks are drawn over earlier ones.
+        include_masks (bool, optional): If True, masks will be included in the
+            output visualizations. Defaults to True.
+        include_marks (bool, optional): If True, marks will be included in the
+            output visualizations. Defaults to True.
+        centroids (list[tuple[float, float]], optional): The (x, y) at which to
+            draw the number of each mask, as returned by
+            vision.calculate_bounding_boxes. Computed if not provided.
+        use_som_visualizer (bool, optional): If True, draw with the original SoM
+            visualizer instead, which is much slower. Defaults to False.
+
+    Returns:
+        Image.Image: The marked image, where marks and/or masks are applied based on
+        the include flags.
+    """
+    if use_som_visualizer:
+        return get_som_marked_image(original_image, masks, include_masks, include_marks)
+
+    image_arr = np.array(original_image.convert("RGB"))
+    cropped_masks = vision.to_cropped_masks(masks)
+    if include_masks:
+        labels = np.zeros(image_arr.shape[:2], dtype=np.int32)
+        for label, mask in enumerate(cropped_masks, 1):
+            top, left, bottom, right = mask.bbox
+            labels[top:bottom, left:right][mask.data.astype(bool)] = label
+
+        mark_colors = get_mark_colors()
+        label_colors = mark_colors[np.arange(len(cropped_masks) + 1) % len(mark_colors)]
+        is_masked = labels > 0
+        # blend in fixed point, with alpha out of 256
+        alpha = round(MARK_MASK_ALPHA * 256)
+        image_arr[is_masked] = (
+            image_arr[is_masked].astype(np.uint16) * (256 - alpha)
+            + label_colors[labels[is_masked]].astype(np.uint16) * alpha
+            + 128
+        ) >> 8
+
+        # outline each mask where it borders another label
+        is_edge = np.zeros_like(is_masked)
+        is_row_edge = labels[1:] != labels[:-1]
+        is_edge[1:] |= is_row_edge
+        is_edge[:-1] |= is_row_edge
+        is_col_edge = labels[:, 1:] != labels[:, :-1]
+        is_edge[:, 1:] |= is_col_edge
+        is_edge[:, :-1] |= is_col_edge
+        is_edge &= is_masked
+        image_arr[is_edge] = label_colors[labels[is_edge]]
+
+    marked_image = Image.fromarray(image_arr)
+    if not include_marks:
+        return marked_image
+
+    if centroids is None:
+        _, centroids = vision.calculate_bounding_boxes(cropped_masks)
+    font = get_mark_font()
+    draw = ImageDraw.Draw(marked_image)
+    text_boxes = []
+    for label, (x, y) in enumerate(centroids, 1):
+        if math.isnan(x):
+            continue
+        left, top, right, bottom = draw.textbbox((x, y), str(label), font, "mm")
+        text_boxes.append(
+            (
+                str(label),
+                (x, y),
+                [
+                    max(int(left) - MARK_TEXT_PADDING, 0),
+                    max(int(top) - MARK_TEXT_PADDING, 0),
+                    int(math.ceil(right)) + MARK_TEXT_PADDING,
+                    int(math.ceil(bottom)) + MARK_TEXT_PADDING,
+                ],
+            )
+        )
+
+    # darken the text backgrounds, then draw the text over them
+    image_arr = np.asarray(marked_image).copy()
+    for _, _, (left, top, right, bottom) in text_boxes:
+        background = image_arr[top:bottom, left:right]
+        background[:] = np.round(background * (1 - MARK_TEXT_ALPHA)).astype(np.uint8)
+    marked_image = Image.fromarray(image_arr)
+    draw = ImageDraw.Draw(marked_image)
+    for text, position, _ in text_boxes:
+        draw.text(position, text, fill="white", font=font, anchor="mm")
+    return marked_image
+
+
+def get_som_marked_image(
+    original_image: Image.Image,
+    masks: list[np.ndarray],
+    include_masks: bool = True,
+    include_marks: bool = True,
 ) -> Image.Image:
     """Get a Set-of-Mark image using the original SoM visualizer.
 
     Args:
         original_image (Image.Image): The original PIL image.
         masks (list[np.ndarray]): A list of masks representing segments in the
-            original image.
+            original image, or vision.CroppedMask objects, or a vision.LabelMap.
         include_masks (bool, optional): If True, masks will be included in the
             output visualizations. Defaults to True.
         include_marks (bool, optional): If True, marks will be included in the
@@ -850,14 +1004,16 @@ def get_marked_image(
     visual = contrib.som.visualizer.Visualizer(image_arr, metadata=metadata)
     mask_map = np.zeros(image_arr.shape, dtype=np.uint8)
     label_mode = "1"
-    alpha = 0.1
+    alpha = MARK_MASK_ALPHA
     anno_mode = []
     if include_masks:
         anno_mode.append("Mask")
     if include_marks:
         anno_mode.append("Mark")
-    for i, mask in enumerate(masks):
+    for i, mask in enumerate(vision.to_cropped_masks(masks)):
         label = i + 1
+        # support masks cropped to their bounding boxes (e.g. vision.CroppedMask)
+        mask = np.asarray(mask)
         demo = visual.draw_binary_mask_with_number(
             mask,
             text=str(label),
@@ -1,6 +1,8 @@
 """This module generates an HTML page.
 
 The page has information about the productivity of the user in the latest recording.
+calculate_productivity_batch computes the same metrics for many recordings at once,
+in parallel.
 
 Usage:
 
@@ -9,7 +11,7 @@ Usage:
 
 from pprint import pformat
 from threading import Timer
-from typing import Optional, Tuple
+from typing import Any, Optional, Tuple
 import os
 import string
 
@@ -19,7 +21,7 @@ from bokeh.models.widgets import Div
 
 from openadapt.custom_logger import logger
 from openadapt.db import crud
-from openadapt.events import get_events
+from openadapt.events import get_events, get_events_batch
 from openadapt.models import ActionEvent, WindowEvent
 from openadapt.plotting import display_event
 from openadapt.utils import configure_logging, image2utf8, row2dict, rows2dicts
@@ -425,38 +427,29 @@ def find_num_window_tab_changes(window_events: list[WindowEvent]) -> int:
     return num_window_tab_changes - 1
 
 
-def calculate_productivity() -> None:
-    """A function to calculate productivity metrics.
-
-    Calculate any relevant information
-    about the productivity of a user in the latest recording.
-    Display this information in an HTML page and open the page.
+def get_productivity_info(
+    action_events: list[ActionEvent],
+    window_events: list[WindowEvent] | None = None,
+) -> tuple[dict[str, Any], list[ActionEvent], list[ActionEvent]]:
+    """Compute the productivity metrics of a recording.
 
     Args:
-        None
+        action_events (list[ActionEvent]): The action events of the recording.
+        window_events (list[WindowEvent], optional): The window events of the
+            recording. If None, window/tab switches are not counted.
 
     Returns:
-        None
+        tuple: A tuple containing:
+          - dict mapping the name of each metric to its value.
+          - the identified repetitive task.
+          - the last occurrence of the identified task.
     """
-    configure_logging(logger, LOG_LEVEL)
-
-    session = crud.get_new_session(read_only=True)
-
-    recording = crud.get_latest_recording(session)
-    logger.debug(f"{recording=}")
-
-    action_events = get_events(session, recording, process=PROCESS_EVENTS)
-    event_dicts = rows2dicts(action_events)
-    logger.info(f"event_dicts=\n{pformat(event_dicts)}")
-    window_events = crud.get_window_events(session, recording)
     filtered_action_events = filter_move_release(action_events)
 
-    # overall info first
     gaps, time_in_gaps = find_gaps(action_events)
     num_clicks = find_clicks(action_events)
     num_key_presses = find_key_presses(action_events)
     duration = action_events[-1].timestamp - action_events[0].timestamp
-    tab_changes = find_num_window_tab_changes(window_events)
 
     task, start, length = rec_lrs(filtered_action_events)
     final_task, num_tasks, total_task_time = find_num_tasks(
@@ -473,14 +466,112 @@ def calculate_productivity() -> None:
         "Total time spent during pauses": time_in_gaps,
         "Total number of mouse clicks": num_clicks,
         "Total number of key presses": num_key_presses,
-        "Number of window/tab switches": tab_changes,
-        "Recording length": duration,
-        f"Number of repetitive tasks longer than {MIN_TASK_LENGTH} actions": num_tasks,
-        "Number of key presses and mouse clicks in identified task": len(final_task),
-        "Total time spent on repetitive tasks": total_task_time,
-        "Average time spent per repetitive task": ave_task_time,
-        # "Number of errors": errors
     }
+    if window_events is not None:
+        prod_info["Number of window/tab switches"] = find_num_window_tab_changes(
+            window_events
+        )
+    prod_info.update(
+        {
+            "Recording length": duration,
+            f"Number of repetitive tasks longer than {MIN_TASK_LENGTH} actions": (
+                num_tasks
+            ),
+            "Number of key presses and mouse clicks in identified task": len(
+                final_task
+            ),
+            "Total time spent on repetitive tasks": total_task_time,
+            "Average time spent per repetitive task": ave_task_time,
+            # "Number of errors": errors
+        }
+    )
+    return prod_info, task, final_task
+
+
+def summarize_productivity(action_events: list[ActionEvent]) -> dict[str, Any]:
+    """Compute the productivity metrics of a recording, without window/tab switches.
+
+    Used as the summarize_fn of get_events_batch.
+
+    Args:
+        action_events (list[ActionEvent]): The action events of the recording.
+
+    Returns:
+        dict: The name of each metric -> its value.
+    """
+    prod_info, _, _ = get_productivity_info(action_events)
+    return prod_info
+
+
+def calculate_productivity_batch(
+    recording_ids: list[int] | None = None,
+    max_workers: int | None = None,
+) -> dict[int, dict[str, Any]]:
+    """Compute the productivity metrics of many recordings in parallel.
+
+    Args:
+        recording_ids (list[int], optional): The ids of the recordings. Defaults to
+            all recordings.
+        max_workers (int, optional): The number of worker processes. Defaults to
+            the number of CPUs.
+
+    Returns:
+        dict: Recording id -> the metrics of the recording (see
+            summarize_productivity). Recordings which failed are logged and omitted.
+    """
+    configure_logging(logger, LOG_LEVEL)
+
+    if recording_ids is None:
+        with crud.get_new_session(read_only=True) as session:
+            recording_ids = [
+                recording.id for recording in crud.get_all_recordings(session)
+            ]
+    results, failures = get_events_batch(
+        recording_ids,
+        process=PROCESS_EVENTS,
+        summarize_fn=summarize_productivity,
+        max_workers=max_workers,
+    )
+    for recording_id, error in failures.items():
+        logger.warning(f"{recording_id=} {error=}")
+    prod_info_by_recording_id = {
+        recording_id: results[recording_id]["result"]
+        for recording_id in recording_ids
+        if recording_id in results
+    }
+    logger.info(f"prod_info_by_recording_id=\n{pformat(prod_info_by_recording_id)}")
+    return prod_info_by_recording_id
+
+
+def calculate_productivity() -> None:
+    """A function to calculate productivity metrics.
+
+    Calculate any relevant information
+    about the productivity of a user in the latest recording.
+    Display this information in an HTML page and open the page.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    configure_logging(logger, LOG_LEVEL)
+
+    session = crud.get_new_session(read_only=True)
+
+    recording = crud.get_latest_recording(session)
+    logger.debug(f"{recording=}")
+
+    action_events = get_events(session, recording, process=PROCESS_EVENTS)
+    logger.opt(lazy=True).info(
+        "event_dicts=\n{}", lambda: pformat(rows2dicts(action_events))
+    )
+    window_events = crud.get_window_events(session, recording)
+    prod_info, task, final_task = get_productivity_info(action_events, window_events)
+    num_tasks = prod_info[
+        f"Number of repetitive tasks longer than {MIN_TASK_LENGTH} actions"
+    ]
 
     rows = [
         row(
@@ -22,7 +22,6 @@ import tracemalloc
 
 from pynput import keyboard, mouse
 from pympler import tracker
-import av
 
 from openadapt.browser import set_browser_mode
 from openadapt.build_utils import redirect_stdout_stderr
@@ -39,11 +38,11 @@ import soundfile
 import websockets.sync.server
 import whisper
 
-from openadapt import plotting, utils, video, window
+from openadapt import events, plotting, utils, video, window
 from openadapt.config import config
 from openadapt.db import crud
 from openadapt.extensions import synchronized_queue as sq
-from openadapt.models import ActionEvent
+from openadapt.models import ActionEvent, Screenshot
 
 Event = namedtuple("Event", ("timestamp", "type", "data"))
 
@@ -175,6 +174,14 @@ def process_events(
     prev_window_event = None
     prev_saved_screen_timestamp = 0
     prev_saved_window_timestamp = 0
+    event_grouper = (
+        events.OnlineEventGrouper(
+            recording.double_click_interval_seconds,
+            recording.double_click_distance_pixels,
+        )
+        if config.RECORD_GROUP_EVENTS
+        else None
+    )
     started = False
     while not terminate_processing.is_set() or not event_q.empty():
         event = event_q.get()
@@ -232,6 +239,11 @@ def process_events(
             else:
                 event.data["window_event_timestamp"] = prev_window_event.timestamp
 
+            if event_grouper:
+                event.data["group_timestamp"] = event_grouper.add(
+                    event.timestamp, event.data
+                )
+
             process_event(
                 event,
                 action_write_q,
@@ -313,14 +325,15 @@ def write_screen_event(
         perf_q: A queue for collecting performance data.
     """
     assert event.type == "screen", event
-    image = event.data
+    event_data = {}
+    if config.RECORD_IMAGES or config.RECORD_THUMBNAILS:
+        image = utils.bgra2image(event.data)
     if config.RECORD_IMAGES:
         with io.BytesIO() as output:
             image.save(output, format="PNG")
-            png_data = output.getvalue()
-        event_data = {"png_data": png_data}
-    else:
-        event_data = {}
+            event_data["png_data"] = output.getvalue()
+    if config.RECORD_THUMBNAILS:
+        event_data.update(Screenshot.get_thumbnail_data(image))
     crud.insert_screenshot(db, recording, event.timestamp, event_data)
     perf_q.put((event.type, event.timestamp, utils.get_timestamp()))
 
@@ -460,16 +473,12 @@ def video_pre_callback(db: crud.SaSession, recording: Recording) -> dict[str, An
         dict[str, Any]: The updated state.
     """
     video_file_path = video.get_video_file_path(recording.timestamp)
-    video_container, video_stream, video_start_timestamp = (
-        video.initialize_video_writer(video_file_path, monitor_width, monitor_height)
+    video_writer = video.SegmentedVideoWriter(
+        video_file_path, monitor_width, monitor_height
     )
-    crud.update_video_start_time(db, recording, video_start_timestamp)
+    crud.update_video_start_time(db, recording, video_writer.video_start_timestamp)
     return {
-        "video_container": video_container,
-        "video_stream": video_stream,
-        "video_start_timestamp": video_start_timestamp,
-        "last_pts": 0,
-        "video_file_path": video_file_path,
+        "video_writer": video_writer,
     }
 
 
@@ -479,15 +488,7 @@ def video_post_callback(state: dict) -> None:
     Args:
         state (dict): The current state.
     """
-    video.finalize_video_writer(
-        state["video_container"],
-        state["video_stream"],
-        state["video_start_timestamp"],
-        state["last_frame"],
-        state["last_frame_timestamp"],
-        state["last_pts"],
-        state["video_file_path"],
-    )
+    state["video_writer"].finalize()
 
 
 def write_video_event(
@@ -495,10 +496,7 @@ def write_video_event(
     recording_timestamp: float,
     event: Event,
     perf_q: sq.SynchronizedQueue,
-    video_container: av.container.OutputContainer,
-    video_stream: av.stream.Stream,
-    video_start_timestamp: float,
-    last_pts: int = 0,
+    video_writer: video.SegmentedVideoWriter,
     num_copies: int = 2,
     **kwargs: dict,
 ) -> dict[str, Any]:
@@ -509,12 +507,7 @@ def write_video_event(
         recording_timestamp: The timestamp of the recording.
         event: A screen event to be written.
         perf_q: A queue for collecting performance data.
-        video_container (av.container.OutputContainer): The output container to which
-            the frame is written.
-        video_stream (av.stream.Stream): The video stream within the container.
-        video_start_timestamp (float): The base timestamp from which the video
-            recording started.
-        last_pts: The last presentation timestamp.
+        video_writer (video.SegmentedVideoWriter): The writer of the video segments.
         num_copies: The number of times to write the frame.
 
     Returns:
@@ -523,31 +516,22 @@ def write_video_event(
     assert event.type == "screen/video"
     screenshot_image = event.data
     screenshot_timestamp = event.timestamp
-    force_key_frame = last_pts == 0
+    force_key_frame = video_writer.num_frames == 0
     # ensure that the first frame is available (otherwise occasionally it is not)
     # TODO: why isn't force_key_frame sufficient?
-    if last_pts != 0:
+    if video_writer.num_frames != 0:
         num_copies = 1
     for _ in range(num_copies):
-        last_pts = video.write_video_frame(
-            video_container,
-            video_stream,
+        video_writer.write_frame(
             screenshot_image,
             screenshot_timestamp,
-            video_start_timestamp,
-            last_pts,
             force_key_frame,
         )
     perf_q.put((event.type, event.timestamp, utils.get_timestamp()))
     return {
         **kwargs,
         **{
-            "video_container": video_container,
-            "video_stream": video_stream,
-            "video_start_timestamp": video_start_timestamp,
-            "last_frame": screenshot_image,
-            "last_frame_timestamp": screenshot_timestamp,
-            "last_pts": last_pts,
+            "video_writer": video_writer,
         },
     }
 
@@ -722,7 +706,9 @@ def read_screen_events(
     logger.info("Starting")
     started = False
     while not terminate_processing.is_set():
-        screenshot = utils.take_screenshot()
+        # converted to an image only if needed (see write_screen_event), and encoded
+        # to video directly (see write_video_event)
+        screenshot = utils.take_screenshot_bgra()
         if screenshot is None:
             logger.warning("Screenshot was None")
             continue
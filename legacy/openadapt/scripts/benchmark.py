@@ -0,0 +1,626 @@
+"""Benchmark performance critical stages on synthetic data.
+
+Results are saved to BENCHMARK_DIR_PATH. Each stage's median duration is compared
+against a previously saved baseline, and stages which became slower than the
+tolerance allows are reported as regressions.
+
+Usage:
+
+    $ python -m openadapt.scripts.benchmark events --save_baseline
+    # ...make changes...
+    $ python -m openadapt.scripts.benchmark events --scale=4 --strict
+    $ python -m openadapt.scripts.benchmark video --duration=3600
+    $ python -m openadapt.scripts.benchmark encode --frame_size="(3840, 2160)"
+    $ python -m openadapt.scripts.benchmark masks --num_segments=800
+    $ python -m openadapt.scripts.benchmark marks --num_segments=200
+"""
+
+from typing import Any, Callable
+import io
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+from PIL import Image
+from scipy.ndimage import binary_fill_holes
+import av
+import numpy as np
+import sqlalchemy as sa
+
+from openadapt.build_utils import redirect_stdout_stderr
+from openadapt.custom_logger import logger
+
+with redirect_stdout_stderr():
+    import fire
+
+from openadapt import browser, events, plotting, synthetic, utils, video, vision
+from openadapt.config import BENCHMARK_DIR_PATH, config
+from openadapt.db import crud, db
+
+NUM_REPEATS = 3
+REGRESSION_TOLERANCE = 0.2
+
+
+def time_stage(
+    fn: Callable[[Any], Any],
+    setup: Callable[[], Any] = lambda: None,
+    teardown: Callable[[Any], None] = lambda state: None,
+    num_repeats: int = NUM_REPEATS,
+) -> dict[str, float]:
+    """Time a stage, excluding its setup and teardown.
+
+    Args:
+        fn (Callable): The stage, called with the return value of setup.
+        setup (Callable): Called before each repeat.
+        teardown (Callable): Called after each repeat with the return value of setup.
+        num_repeats (int): The number of times to run the stage.
+
+    Returns:
+        dict[str, float]: The minimum and median durations in seconds.
+    """
+    durations = []
+    for _ in range(num_repeats):
+        state = setup()
+        start_time = time.perf_counter()
+        fn(state)
+        durations.append(time.perf_counter() - start_time)
+        teardown(state)
+    return {"min": min(durations), "median": statistics.median(durations)}
+
+
+def get_regressions(
+    results: dict[str, dict[str, float]],
+    baseline: dict[str, dict[str, float]],
+    tolerance: float = REGRESSION_TOLERANCE,
+) -> dict[str, float]:
+    """Get the stages whose median duration increased by more than the tolerance.
+
+    Args:
+        results (dict): Stage name -> durations, as returned by time_stage.
+        baseline (dict): Stage name -> baseline durations.
+        tolerance (float): The allowed relative increase in median duration.
+
+    Returns:
+        dict[str, float]: Stage name -> relative increase in median duration.
+    """
+    regressions = {}
+    for stage, durations in results.items():
+        if stage not in baseline:
+            continue
+        ratio = durations["median"] / baseline[stage]["median"]
+        if ratio > 1 + tolerance:
+            regressions[stage] = ratio - 1
+    return regressions
+
+
+def report(
+    name: str,
+    results: dict[str, dict[str, float]],
+    save_baseline: bool = False,
+    strict: bool = False,
+    tolerance: float = REGRESSION_TOLERANCE,
+) -> dict[str, dict[str, float]]:
+    """Save benchmark results and compare them against the saved baseline.
+
+    Args:
+        name (str): The name of the benchmark.
+        results (dict): Stage name -> durations, as returned by time_stage.
+        save_baseline (bool): Whether to save the results as the new baseline.
+        strict (bool): Whether to raise if there are regressions.
+        tolerance (float): The allowed relative increase in median duration.
+
+    Returns:
+        dict: The results.
+    """
+    BENCHMARK_DIR_PATH.mkdir(parents=True, exist_ok=True)
+    results_path = BENCHMARK_DIR_PATH / f"{name}.json"
+    baseline_path = BENCHMARK_DIR_PATH / f"{name}.baseline.json"
+    results_path.write_text(json.dumps(results, indent=2))
+    for stage, durations in results.items():
+        logger.info(
+            f"{name}.{stage}: min={durations['min']:.4f}s"
+            f" median={durations['median']:.4f}s"
+        )
+
+    if save_baseline:
+        baseline_path.write_text(json.dumps(results, indent=2))
+        logger.info(f"saved baseline to {baseline_path}")
+    elif baseline_path.exists():
+        baseline = json.loads(baseline_path.read_text())
+        regressions = get_regressions(results, baseline, tolerance)
+        for stage, increase in regressions.items():
+            logger.warning(f"{name}.{stage} regressed by {increase:.1%}")
+        if strict:
+            assert not regressions, regressions
+    else:
+        logger.info(f"no baseline at {baseline_path}, run with --save_baseline")
+    return results
+
+
+def benchmark_events(
+    scale: float = 1,
+    num_repeats: int = NUM_REPEATS,
+    save_baseline: bool = False,
+    strict: bool = False,
+    tolerance: float = REGRESSION_TOLERANCE,
+    log_level: str = "WARNING",
+    **kwargs: Any,
+) -> dict[str, dict[str, float]]:
+    """Benchmark loading, processing and serializing the events of a recording.
+
+    Args:
+        scale (float): Multiplier for the default event counts of
+            synthetic.generate_recording.
+        num_repeats (int): The number of times to run each stage.
+        save_baseline (bool): Whether to save the results as the new baseline.
+        strict (bool): Whether to raise if there are regressions.
+        tolerance (float): The allowed relative increase in median duration.
+        log_level (str): The log level while benchmarking.
+        **kwargs: Keyword arguments passed to synthetic.generate_recording, which
+            override the scaled counts.
+
+    Returns:
+        dict: Stage name -> minimum and median durations in seconds.
+    """
+    utils.configure_logging(logger, log_level)
+    counts = {
+        "num_moves": 50,
+        "num_clicks": 50,
+        "num_key_bursts": 20,
+        "num_scrolls": 10,
+        "num_window_switches": 5,
+    }
+    counts = {key: int(val * scale) for key, val in counts.items()}
+    counts.update(kwargs)
+
+    with tempfile.TemporaryDirectory() as dir_path:
+        engine = sa.create_engine(f"sqlite:///{dir_path}/benchmark.db")
+        db.Base.metadata.create_all(bind=engine)
+        get_session = sa.orm.sessionmaker(bind=engine)
+
+        results = {}
+        recording_ids = []
+
+        def write(session: crud.SaSession) -> None:
+            recording = synthetic.generate_recording(session, **counts)
+            recording_ids.append(recording.id)
+
+        results["write"] = time_stage(
+            write, get_session, lambda session: session.close(), num_repeats
+        )
+        recording_id = recording_ids[0]
+
+        def get_recording_session() -> tuple[crud.SaSession, Any]:
+            session = get_session()
+            return session, crud.get_recording_by_id(session, recording_id)
+
+        def load(state: tuple) -> tuple:
+            session, recording = state
+            return (
+                crud.get_action_events(session, recording),
+                crud.get_window_events(session, recording),
+                crud.get_screenshots(session, recording),
+                crud.get_browser_events(session, recording),
+            )
+
+        def close(state: tuple) -> None:
+            session, _ = state
+            session.rollback()
+            session.close()
+
+        def load_session() -> tuple:
+            session, recording = get_recording_session()
+            return session, load((session, recording))
+
+        def assign_browser_events(state: tuple) -> None:
+            session, (action_events, _, _, browser_events) = state
+            browser.assign_browser_events(session, action_events, browser_events)
+
+        def merge_events(state: tuple) -> None:
+            session, loaded = state
+            events.merge_events(session, *loaded)
+
+        def get_events(state: tuple) -> None:
+            session, recording = state
+            events.get_events(session, recording)
+
+        def serialize(state: tuple) -> None:
+            session, action_events = state
+            json.dumps(utils.rows2dicts(action_events), default=str)
+
+        def get_events_session() -> tuple:
+            session, recording = get_recording_session()
+            return session, events.get_events(session, recording)
+
+        results["load"] = time_stage(load, get_recording_session, close, num_repeats)
+        results["assign_browser_events"] = time_stage(
+            assign_browser_events, load_session, close, num_repeats
+        )
+        results["merge_events"] = time_stage(
+            merge_events, load_session, close, num_repeats
+        )
+        results["get_events"] = time_stage(
+            get_events, get_recording_session, close, num_repeats
+        )
+        results["serialize"] = time_stage(
+            serialize, get_events_session, close, num_repeats
+        )
+        engine.dispose()
+
+    return report("events", results, save_baseline, strict, tolerance)
+
+
+def benchmark_video(
+    duration: float = 600,
+    fps: int = 24,
+    frame_size: tuple[int, int] = (640, 400),
+    num_frames: int = 50,
+    num_repeats: int = NUM_REPEATS,
+    save_baseline: bool = False,
+    strict: bool = False,
+    tolerance: float = REGRESSION_TOLERANCE,
+    log_level: str = "WARNING",
+) -> dict[str, dict[str, float]]:
+    """Benchmark extracting frames from a long video.
+
+    Frames are extracted sequentially (consecutive frames from the middle of the
+    video), sparsely (evenly spaced frames) and singly (one frame near the end): using
+    the frame index, seeking without the frame index, and without seeking. Building
+    the frame index, and decoding the whole video without converting any frames, are
+    included for reference.
+
+    Args:
+        duration (float): The duration of the synthetic video in seconds.
+        fps (int): The number of frames per second of the synthetic video.
+        frame_size (tuple[int, int]): The width and height of the frames.
+        num_frames (int): The number of frames to extract sequentially and sparsely.
+        num_repeats (int): The number of times to run each stage.
+        save_baseline (bool): Whether to save the results as the new baseline.
+        strict (bool): Whether to raise if there are regressions.
+        tolerance (float): The allowed relative increase in median duration.
+        log_level (str): The log level while benchmarking.
+
+    Returns:
+        dict: Stage name -> minimum and median durations in seconds.
+    """
+    utils.configure_logging(logger, log_level)
+    with tempfile.TemporaryDirectory() as dir_path:
+        video_file_path = os.path.join(dir_path, "benchmark.mp4")
+        timestamps = synthetic.generate_video(
+            video_file_path, duration, fps, frame_size, preset="ultrafast"
+        )
+        unindexed_video_file_path = os.path.join(dir_path, "unindexed.mp4")
+        shutil.copy(video_file_path, unindexed_video_file_path)
+        logger.info(f"{len(timestamps)=} num_bytes={os.path.getsize(video_file_path)}")
+        middle_idx = (len(timestamps) - num_frames) // 2
+        timestamps_by_access = {
+            "sequential": timestamps[middle_idx : middle_idx + num_frames],
+            "sparse": utils.evenly_spaced(timestamps, num_frames),
+            "single_frame": timestamps[-fps:][:1],
+        }
+
+        def decode_all(state: None) -> None:
+            video_container = av.open(video_file_path)
+            for _ in video_container.decode(video_container.streams.video[0]):
+                pass
+            video_container.close()
+
+        def build_index(state: None) -> None:
+            video.FrameIndex.build(video_file_path)
+
+        def get_extract_frames(
+            access_timestamps: list[float],
+            indexed: bool = True,
+            seek_threshold: float = video.SEEK_THRESHOLD_SECONDS,
+        ) -> Callable[[None], None]:
+            def extract_frames(state: None) -> None:
+                video.extract_frames(
+                    video_file_path if indexed else unindexed_video_file_path,
+                    access_timestamps,
+                    seek_threshold=seek_threshold,
+                )
+
+            return extract_frames
+
+        results = {
+            "decode_all": time_stage(decode_all, num_repeats=num_repeats),
+            "build_index": time_stage(build_index, num_repeats=num_repeats),
+        }
+        for access, access_timestamps in timestamps_by_access.items():
+            results[access] = time_stage(
+                get_extract_frames(access_timestamps), num_repeats=num_repeats
+            )
+            results[f"{access}_no_index"] = time_stage(
+                get_extract_frames(access_timestamps, indexed=False),
+                num_repeats=num_repeats,
+            )
+            results[f"{access}_no_seek"] = time_stage(
+                get_extract_frames(
+                    access_timestamps, indexed=False, seek_threshold=float("inf")
+                ),
+                num_repeats=num_repeats,
+            )
+
+    return report("video", results, save_baseline, strict, tolerance)
+
+
+def benchmark_encode(
+    num_frames: int = 100,
+    fps: int = 24,
+    frame_size: tuple[int, int] = (1920, 1080),
+    threads: int = 0,
+    num_repeats: int = NUM_REPEATS,
+    save_baseline: bool = False,
+    strict: bool = False,
+    tolerance: float = REGRESSION_TOLERANCE,
+    log_level: str = "WARNING",
+) -> dict[str, dict[str, float]]:
+    """Benchmark encoding video with each encode profile, and transcoding.
+
+    Frames are encoded from BGRA arrays, as captured by utils.take_screenshot_bgra.
+    In addition to durations, each profile's encoding frame rate and file size are
+    reported. For comparison, the default profile is also timed converting each
+    frame to an image first, as utils.take_screenshot does. Transcoding re-encodes
+    the video captured with the default profile with the archival profile.
+
+    Args:
+        num_frames (int): The number of frames to encode.
+        fps (int): The number of frames per second of the video.
+        frame_size (tuple[int, int]): The width and height of the frames.
+        threads (int): The number of encoder threads, or 0 to choose automatically.
+        num_repeats (int): The number of times to run each stage.
+        save_baseline (bool): Whether to save the results as the new baseline.
+        strict (bool): Whether to raise if there are regressions.
+        tolerance (float): The allowed relative increase in median duration.
+        log_level (str): The log level while benchmarking.
+
+    Returns:
+        dict: Stage name -> minimum and median durations in seconds, and for each
+            profile the encoding frame rate and file size in bytes.
+    """
+    utils.configure_logging(logger, log_level)
+    utils.set_start_time()
+    frame_size = tuple(frame_size)
+    bgras = [
+        np.array(Image.open(io.BytesIO(png_data)).convert("RGBA"))[:, :, [2, 1, 0, 3]]
+        for png_data in synthetic.get_screenshot_png_datas(frame_size)
+    ]
+    width, height = frame_size
+
+    with tempfile.TemporaryDirectory() as dir_path:
+
+        def get_encode(profile: str, from_image: bool = False) -> Callable[[str], None]:
+            def get_frame(frame_idx: int) -> Image.Image | np.ndarray:
+                bgra = bgras[frame_idx % len(bgras)]
+                return utils.bgra2image(bgra) if from_image else bgra
+
+            def encode(video_file_path: str) -> None:
+                video_container, video_stream, _ = video.initialize_video_writer(
+                    video_file_path,
+                    width,
+                    height,
+                    fps=fps,
+                    profile=profile,
+                    threads=threads,
+                )
+                last_pts = -1
+                for frame_idx in range(num_frames):
+                    last_pts = video.write_video_frame(
+                        video_container,
+                        video_stream,
+                        get_frame(frame_idx),
+                        frame_idx / fps,
+                        0,
+                        last_pts,
+                    )
+                video.finalize_video_writer(
+                    video_container,
+                    video_stream,
+                    0,
+                    get_frame(num_frames - 1),
+                    num_frames / fps,
+                    last_pts,
+                    video_file_path,
+                )
+
+            return encode
+
+        def get_video_file_path(profile: str) -> str:
+            return os.path.join(dir_path, f"{profile}.mp4")
+
+        results = {}
+        for profile in video.ENCODE_PROFILES:
+            video_file_path = get_video_file_path(profile)
+            results[profile] = time_stage(
+                get_encode(profile),
+                lambda video_file_path=video_file_path: video_file_path,
+                num_repeats=num_repeats,
+            )
+            results[profile]["fps"] = num_frames / results[profile]["median"]
+            results[profile]["num_bytes"] = os.path.getsize(video_file_path)
+            logger.info(
+                f"{profile=} fps={results[profile]['fps']:.1f}"
+                f" num_bytes={results[profile]['num_bytes']}"
+            )
+
+        results[f"{config.VIDEO_ENCODE_PROFILE}_from_image"] = time_stage(
+            get_encode(config.VIDEO_ENCODE_PROFILE, from_image=True),
+            lambda: os.path.join(dir_path, "from_image.mp4"),
+            num_repeats=num_repeats,
+        )
+
+        def transcode(video_file_path: str) -> None:
+            video.transcode_video(
+                get_video_file_path(config.VIDEO_ENCODE_PROFILE),
+                video_file_path,
+                threads=threads,
+            )
+
+        results["transcode"] = time_stage(
+            transcode,
+            lambda: os.path.join(dir_path, "transcoded.mp4"),
+            num_repeats=num_repeats,
+        )
+
+    return report("encode", results, save_baseline, strict, tolerance)
+
+
+def benchmark_masks(
+    image_size: tuple[int, int] = (1920, 1080),
+    num_segments: int = synthetic.NUM_SEGMENTS,
+    num_repeats: int = NUM_REPEATS,
+    save_baseline: bool = False,
+    strict: bool = False,
+    tolerance: float = REGRESSION_TOLERANCE,
+    log_level: str = "WARNING",
+) -> dict[str, dict[str, float]]:
+    """Benchmark extracting and refining segment masks.
+
+    Masks are extracted from a synthetic segmented image of nested segments, as
+    returned by a segmentation adapter. Removing contained masks is timed on the masks
+    that refine_masks passes to it, and compared against checking all pairs of
+    full-frame masks. The uncached functions are timed, and the number of masks
+    before and after removing contained masks is reported.
+
+    Args:
+        image_size (tuple[int, int]): The width and height of the segmented image.
+        num_segments (int): The maximum number of segments in the segmented image.
+        num_repeats (int): The number of times to run each stage.
+        save_baseline (bool): Whether to save the results as the new baseline.
+        strict (bool): Whether to raise if there are regressions.
+        tolerance (float): The allowed relative increase in median duration.
+        log_level (str): The log level while benchmarking.
+
+    Returns:
+        dict: Stage name -> minimum and median durations in seconds, and the number of
+            masks.
+    """
+    utils.configure_logging(logger, log_level)
+    segmented_image = synthetic.get_segmented_image(tuple(image_size), num_segments)
+    label_map = vision.get_label_map.__wrapped__(segmented_image)
+
+    # the masks refine_masks passes to remove_contained_masks
+    masks = vision.remove_border_masks.__wrapped__(label_map)
+    masks = vision.filter_thin_ragged_masks.__wrapped__(masks)
+    masks = [
+        vision.CroppedMask(
+            binary_fill_holes(mask.data).astype(np.uint8),
+            mask.top,
+            mask.left,
+            mask.shape,
+        )
+        for mask in masks
+    ]
+    masks = vision.filter_masks_by_size.__wrapped__(masks)
+    full_masks = [mask.to_array() for mask in masks]
+
+    def remove_contained_masks_all_pairs(masks: list[np.ndarray]) -> None:
+        for i, mask_i in enumerate(masks):
+            for j, mask_j in enumerate(masks):
+                if i != j and np.array_equal(mask_i & mask_j, mask_i):
+                    break
+
+    results = {
+        "label_map": time_stage(
+            vision.get_label_map.__wrapped__,
+            lambda: segmented_image,
+            num_repeats=num_repeats,
+        ),
+        "remove_contained_masks": time_stage(
+            vision.remove_contained_masks.__wrapped__,
+            lambda: masks,
+            num_repeats=num_repeats,
+        ),
+        "remove_contained_masks_all_pairs": time_stage(
+            remove_contained_masks_all_pairs,
+            lambda: full_masks,
+            num_repeats=num_repeats,
+        ),
+    }
+    num_refined_masks = len(vision.remove_contained_masks.__wrapped__(masks))
+    logger.info(f"{len(label_map)=} {len(masks)=} {num_refined_masks=}")
+    results["label_map"]["num_masks"] = len(label_map)
+    results["remove_contained_masks"]["num_masks"] = len(masks)
+    results["remove_contained_masks"]["num_refined_masks"] = num_refined_masks
+    return report("masks", results, save_baseline, strict, tolerance)
+
+
+def benchmark_marks(
+    image_size: tuple[int, int] = (1920, 1080),
+    num_segments: int = synthetic.NUM_SEGMENTS,
+    num_repeats: int = NUM_REPEATS,
+    save_baseline: bool = False,
+    strict: bool = False,
+    tolerance: float = REGRESSION_TOLERANCE,
+    log_level: str = "WARNING",
+) -> dict[str, dict[str, float]]:
+    """Benchmark drawing Set-of-Mark images, side by side with the SoM visualizer.
+
+    The refined masks of a synthetic segmented image are drawn over a synthetic
+    screenshot. The SoM visualizer is only timed if its dependencies are installed,
+    in which case both marked images are saved next to each other to
+    BENCHMARK_DIR_PATH for visual comparison.
+
+    Args:
+        image_size (tuple[int, int]): The width and height of the image.
+        num_segments (int): The maximum number of segments in the segmented image.
+        num_repeats (int): The number of times to run each stage.
+        save_baseline (bool): Whether to save the results as the new baseline.
+        strict (bool): Whether to raise if there are regressions.
+        tolerance (float): The allowed relative increase in median duration.
+        log_level (str): The log level while benchmarking.
+
+    Returns:
+        dict: Stage name -> minimum and median durations in seconds, and the number of
+            masks.
+    """
+    utils.configure_logging(logger, log_level)
+    image_size = tuple(image_size)
+    (png_data,) = synthetic.get_screenshot_png_datas(image_size, 1)
+    image = Image.open(io.BytesIO(png_data)).convert("RGB")
+    segmented_image = synthetic.get_segmented_image(image_size, num_segments)
+    masks = vision.refine_masks(vision.get_label_map(segmented_image))
+    _, centroids = vision.calculate_bounding_boxes(masks)
+
+    results = {
+        "get_marked_image": time_stage(
+            lambda masks: plotting.get_marked_image(image, masks, centroids=centroids),
+            lambda: masks,
+            num_repeats=num_repeats,
+        ),
+    }
+    results["get_marked_image"]["num_masks"] = len(masks)
+    try:
+        som_marked_image = plotting.get_som_marked_image(image, masks)
+    except ImportError as exc:
+        logger.warning(f"skipping SoM visualizer, {exc=}")
+    else:
+        results["get_som_marked_image"] = time_stage(
+            lambda masks: plotting.get_som_marked_image(image, masks),
+            lambda: masks,
+            num_repeats=num_repeats,
+        )
+        marked_image = plotting.get_marked_image(image, masks, centroids=centroids)
+        comparison_image = Image.new("RGB", (image.width * 2, image.height))
+        comparison_image.paste(marked_image, (0, 0))
+        comparison_image.paste(som_marked_image.convert("RGB"), (image.width, 0))
+        BENCHMARK_DIR_PATH.mkdir(parents=True, exist_ok=True)
+        comparison_path = BENCHMARK_DIR_PATH / "marks.png"
+        comparison_image.save(comparison_path)
+        logger.info(f"saved marked images to {comparison_path}")
+    return report("marks", results, save_baseline, strict, tolerance)
+
+
+if __name__ == "__main__":
+    fire.Fire(
+        {
+            "events": benchmark_events,
+            "video": benchmark_video,
+            "encode": benchmark_encode,
+            "masks": benchmark_masks,
+            "marks": benchmark_marks,
+        }
+    )
@@ -0,0 +1,446 @@
+"""Persist window segmentations across replays.
+
+Segmentations are stored on disk under SEGMENTATION_DIR_PATH, keyed by the perceptual
+hash of the segmented image, so that a replay can reuse the segments and their
+descriptions for screens seen in previous replays instead of segmenting and
+describing them again. The least recently used segmentations are evicted when the
+store exceeds config.SEGMENTATION_STORE_MAX_BYTES.
+
+Each segmentation is saved as a compressed .npz file containing its image and marked
+image as PNG data, its masks bit-packed and cropped to their bounding boxes, and its
+descriptions, bounding boxes and centroids as JSON. The index of stored segmentations
+is saved alongside them whenever one is added. Finding a segmentation only updates
+its last access time in memory, which is saved with the next added segmentation or
+at exit (see SegmentationStore.flush).
+
+Stores in concurrent replays share the directory: the index is saved under a file
+lock, merged with the index saved by other stores, so that every stored file is
+counted towards the maximum size. Files missing from the index (e.g. left by an
+interrupted replay) are deleted when the index is loaded.
+
+Usage:
+
+    store = SegmentationStore()
+    fields, diff = store.find_similar(image)
+    if fields is None:
+        ...
+        store.add(segmentation)
+
+    $ python -m openadapt.segmentation_store info
+    $ python -m openadapt.segmentation_store clear
+"""
+
+from contextlib import contextmanager
+from typing import Any, Iterator
+import atexit
+import io
+import json
+import os
+import shutil
+import sys
+import time
+
+from PIL import Image
+import numpy as np
+
+from openadapt.build_utils import redirect_stdout_stderr
+from openadapt.custom_logger import logger
+
+with redirect_stdout_stderr():
+    import fire
+
+from openadapt import utils, vision
+from openadapt.config import SEGMENTATION_DIR_PATH, config
+
+if sys.platform == "win32":
+    import msvcrt
+else:
+    import fcntl
+
+SEGMENTATION_STORE_VERSION = 1
+INDEX_FILE_NAME = "index.json"
+INDEX_ARRAYS_FILE_NAME = "index.npz"
+LOCK_FILE_NAME = "index.lock"
+
+
+def _to_bytes_array(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, dtype=np.uint8)
+
+
+def _image2png(image: Image.Image) -> bytes:
+    with io.BytesIO() as output:
+        image.save(output, format="PNG")
+        return output.getvalue()
+
+
+@contextmanager
+def _lock_file(file_path: str) -> Iterator[None]:
+    """Hold an exclusive lock on a file, across processes.
+
+    Args:
+        file_path: The path of the lock file, which is created if necessary.
+    """
+    with open(file_path, "a+b") as file:
+        if sys.platform == "win32":
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            fcntl.flock(file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if sys.platform == "win32":
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+
+class SegmentationStore:
+    """A bounded, persistent store of window segmentations.
+
+    Attributes:
+        dir_path: The directory containing the stored segmentations.
+        max_bytes: The maximum total size of the stored segmentation files.
+        entries: The key (the hex perceptual hash), file size and last access time of
+            each stored segmentation. The segmentation accessed least recently is
+            evicted first.
+        image_index: The index used to find similar images, in the order of
+            entries.
+    """
+
+    def __init__(
+        self,
+        dir_path: str | None = None,
+        max_bytes: int | None = None,
+        **index_kwargs: Any,
+    ) -> None:
+        """Initialize the store, loading the index of stored segmentations.
+
+        Args:
+            dir_path: The directory containing the stored segmentations. Defaults to
+                SEGMENTATION_DIR_PATH.
+            max_bytes: The maximum total size of the stored segmentation files.
+                Defaults to config.SEGMENTATION_STORE_MAX_BYTES.
+            **index_kwargs: Passed to vision.ImageIndex.
+        """
+        self.dir_path = str(dir_path or SEGMENTATION_DIR_PATH)
+        self.max_bytes = (
+            config.SEGMENTATION_STORE_MAX_BYTES if max_bytes is None else max_bytes
+        )
+        self.image_index = vision.ImageIndex(**index_kwargs)
+        self.entries = []
+        self._is_index_dirty = False
+        # keys removed since the index was saved, which are not merged back
+        self._removed_keys = set()
+        self._load_index()
+        atexit.register(self.flush)
+
+    @property
+    def num_bytes(self) -> int:
+        """Return the total size of the stored segmentation files."""
+        return sum(entry["num_bytes"] for entry in self.entries)
+
+    def __len__(self) -> int:
+        """Return the number of stored segmentations."""
+        return len(self.entries)
+
+    def _get_file_path(self, key: str) -> str:
+        return os.path.join(self.dir_path, f"{key}.npz")
+
+    @contextmanager
+    def _lock(self) -> Iterator[None]:
+        """Hold the lock of the store's directory, shared with other processes."""
+        os.makedirs(self.dir_path, exist_ok=True)
+        with _lock_file(os.path.join(self.dir_path, LOCK_FILE_NAME)):
+            yield
+
+    def _read_index(self) -> tuple[list[dict[str, Any]], np.ndarray]:
+        """Read the saved index.
+
+        Returns:
+            tuple[list[dict], np.ndarray]: The saved entries and their SSIM arrays,
+                or no entries if the index is missing or invalid.
+        """
+        index_file_path = os.path.join(self.dir_path, INDEX_FILE_NAME)
+        arrays_file_path = os.path.join(self.dir_path, INDEX_ARRAYS_FILE_NAME)
+        if not os.path.exists(index_file_path):
+            return [], np.zeros(0)
+        try:
+            with open(index_file_path) as file:
+                index = json.load(file)
+            assert index["version"] == SEGMENTATION_STORE_VERSION, index["version"]
+            with np.load(arrays_file_path) as arrays:
+                ssim_arrays = arrays["ssim_arrays"]
+            assert len(ssim_arrays) == len(index["entries"])
+        except Exception as exc:
+            logger.warning(f"ignoring segmentation index in {self.dir_path}: {exc}")
+            return [], np.zeros(0)
+        return index["entries"], ssim_arrays
+
+    def _load_index(self) -> None:
+        if not os.path.exists(self.dir_path):
+            return
+        with self._lock():
+            entries, ssim_arrays = self._read_index()
+            for entry, ssim_array in zip(entries, ssim_arrays):
+                if not os.path.exists(self._get_file_path(entry["key"])):
+                    logger.warning(f"missing segmentation {entry['key']}")
+                    continue
+                self.entries.append(entry)
+                self.image_index.add_hashed(int(entry["key"], 16), ssim_array)
+            self._remove_unindexed_files()
+        logger.info(f"loaded {len(self)} segmentations from {self.dir_path}")
+
+    def _remove_unindexed_files(self) -> None:
+        """Delete the segmentation files which are not in the index.
+
+        Must be called with the lock held, after loading the index.
+        """
+        keys = {entry["key"] for entry in self.entries}
+        num_removed = 0
+        num_bytes_removed = 0
+        for file_name in os.listdir(self.dir_path):
+            key, ext = os.path.splitext(file_name)
+            if ext != ".npz" or file_name == INDEX_ARRAYS_FILE_NAME or key in keys:
+                continue
+            file_path = os.path.join(self.dir_path, file_name)
+            num_bytes_removed += os.path.getsize(file_path)
+            os.remove(file_path)
+            num_removed += 1
+        if num_removed:
+            logger.info(f"{num_removed=} {num_bytes_removed=}")
+
+    def _merge_index(self) -> None:
+        """Merge the saved index, e.g. of concurrent replays, into this one.
+
+        Must be called with the lock held.
+        """
+        idx_by_key = {entry["key"]: idx for idx, entry in enumerate(self.entries)}
+        entries, ssim_arrays = self._read_index()
+        for entry, ssim_array in zip(entries, ssim_arrays):
+            key = entry["key"]
+            if key in idx_by_key:
+                self_entry = self.entries[idx_by_key[key]]
+                self_entry["last_access_time"] = max(
+                    self_entry["last_access_time"], entry["last_access_time"]
+                )
+            elif key not in self._removed_keys and os.path.exists(
+                self._get_file_path(key)
+            ):
+                self.entries.append(entry)
+                self.image_index.add_hashed(int(key, 16), ssim_array)
+        # segmentations evicted by other stores
+        for idx in reversed(range(len(self.entries))):
+            if not os.path.exists(self._get_file_path(self.entries[idx]["key"])):
+                self._remove(idx)
+
+    def _save_index(self) -> None:
+        """Merge and atomically save the index, evicting segmentations if necessary.
+
+        Must be called with the lock held.
+        """
+        self._merge_index()
+        self._evict()
+        for file_name, save in (
+            (
+                INDEX_ARRAYS_FILE_NAME,
+                lambda file: np.savez(
+                    file,
+                    ssim_arrays=self.image_index.ssim_arrays.astype(np.uint8),
+                ),
+            ),
+            (
+                INDEX_FILE_NAME,
+                lambda file: file.write(
+                    json.dumps(
+                        {
+                            "version": SEGMENTATION_STORE_VERSION,
+                            "entries": self.entries,
+                        }
+                    ).encode()
+                ),
+            ),
+        ):
+            file_path = os.path.join(self.dir_path, file_name)
+            # unique per process, so that concurrent replays don't clobber each other
+            tmp_file_path = f"{file_path}.{os.getpid()}.tmp"
+            with open(tmp_file_path, "wb") as file:
+                save(file)
+            os.replace(tmp_file_path, file_path)
+        self._removed_keys.clear()
+        self._is_index_dirty = False
+
+    def flush(self) -> None:
+        """Save the index if any segmentation was accessed since it was saved.
+
+        Called at exit.
+        """
+        # skip stores whose directory was removed (e.g. by clear)
+        if self._is_index_dirty and os.path.isdir(self.dir_path):
+            with self._lock():
+                self._save_index()
+
+    def _remove(self, idx: int) -> None:
+        entry = self.entries.pop(idx)
+        self.image_index.remove(idx)
+        self._removed_keys.add(entry["key"])
+        file_path = self._get_file_path(entry["key"])
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+    def _evict(self) -> None:
+        """Remove the least recently used segmentations until within max_bytes."""
+        num_evicted = 0
+        while self.entries and self.num_bytes > self.max_bytes:
+            last_access_times = [entry["last_access_time"] for entry in self.entries]
+            self._remove(int(np.argmin(last_access_times)))
+            num_evicted += 1
+        if num_evicted:
+            logger.info(f"{num_evicted=} num_bytes={self.num_bytes}")
+
+    def add(self, segmentation: Any) -> str:
+        """Store a segmentation, replacing any with the same perceptual hash.
+
+        Args:
+            segmentation: The segmentation, with the attributes of
+                strategies.visual.Segmentation. Its masks must be set.
+
+        Returns:
+            str: The key of the stored segmentation.
+        """
+        image = segmentation.image
+        key = f"{vision.get_phash(image):016x}"
+        masks = [mask.tighten() for mask in vision.to_cropped_masks(segmentation.masks)]
+        metadata = {
+            "image_size": image.size,
+            "descriptions": segmentation.descriptions,
+            "bounding_boxes": segmentation.bounding_boxes,
+            "centroids": segmentation.centroids,
+            "mask_offsets": [(mask.top, mask.left) for mask in masks],
+        }
+        arrays = {
+            "image": _to_bytes_array(_image2png(image)),
+            "marked_image": _to_bytes_array(_image2png(segmentation.marked_image)),
+            "metadata": _to_bytes_array(json.dumps(metadata).encode()),
+        }
+        for mask_idx, mask in enumerate(masks):
+            arrays[f"mask_{mask_idx}"] = _to_bytes_array(utils.pack_mask(mask.data))
+
+        # the file and the index are written together, so that the file isn't
+        # removed as unindexed by another store in between
+        with self._lock():
+            for idx, entry in enumerate(self.entries):
+                if entry["key"] == key:
+                    self._remove(idx)
+                    break
+            file_path = self._get_file_path(key)
+            np.savez_compressed(file_path, **arrays)
+            self.entries.append(
+                {
+                    "key": key,
+                    "num_bytes": os.path.getsize(file_path),
+                    "last_access_time": time.time(),
+                }
+            )
+            self.image_index.add(image)
+            self._save_index()
+        return key
+
+    def load(self, key: str) -> dict[str, Any]:
+        """Load a stored segmentation.
+
+        Args:
+            key: The key of the segmentation.
+
+        Returns:
+            dict: The keyword arguments to strategies.visual.Segmentation.
+        """
+        with np.load(self._get_file_path(key)) as arrays:
+            image = Image.open(io.BytesIO(arrays["image"].tobytes()))
+            image.load()
+            marked_image = Image.open(io.BytesIO(arrays["marked_image"].tobytes()))
+            marked_image.load()
+            metadata = json.loads(arrays["metadata"].tobytes())
+            width, height = metadata["image_size"]
+            masks = [
+                vision.CroppedMask(
+                    utils.unpack_mask(arrays[f"mask_{mask_idx}"].tobytes()),
+                    top,
+                    left,
+                    (height, width),
+                )
+                for mask_idx, (top, left) in enumerate(metadata["mask_offsets"])
+            ]
+        return {
+            "image": image,
+            "marked_image": marked_image,
+            "masked_images": vision.extract_masked_images(image, masks),
+            "descriptions": metadata["descriptions"],
+            "bounding_boxes": metadata["bounding_boxes"],
+            "centroids": [tuple(centroid) for centroid in metadata["centroids"]],
+            "masks": masks,
+        }
+
+    def find_similar(
+        self,
+        image: Image.Image,
+        min_ssim: float = 0,
+    ) -> tuple[dict[str, Any], np.ndarray] | tuple[None, None]:
+        """Find the stored segmentation of the image most similar to the given one.
+
+        Args:
+            image: The image to compare against the stored segmentations.
+            min_ssim: The minimum SSIM for considering a match.
+
+        Returns:
+            tuple[dict, np.ndarray] | tuple[None, None]: The keyword arguments to
+                strategies.visual.Segmentation and the SSIM image resized to the
+                given image if a match is found; otherwise, None for both.
+        """
+        idxs, ssims, ssim_images = self.image_index.query(image)
+        if not len(idxs) or ssims[0] <= min_ssim:
+            return None, None
+
+        idx = int(idxs[0])
+        entry = self.entries[idx]
+        logger.info(f"{entry['key']=} similarity_index={ssims[0]}")
+        try:
+            fields = self.load(entry["key"])
+        except FileNotFoundError:
+            # evicted by another store
+            logger.warning(f"missing segmentation {entry['key']}")
+            self._remove(idx)
+            return None, None
+
+        # mark as most recently used, saved lazily (see flush)
+        entry["last_access_time"] = time.time()
+        self._is_index_dirty = True
+
+        diff = np.asarray(
+            Image.fromarray(ssim_images[0]).resize(image.size, Image.BILINEAR)
+        )
+        return fields, diff
+
+
+def info() -> dict[str, Any]:
+    """Log and return the number and total size of stored segmentations.
+
+    Returns:
+        dict: The number of stored segmentations and their total size in bytes.
+    """
+    store = SegmentationStore()
+    result = {"num_segmentations": len(store), "num_bytes": store.num_bytes}
+    logger.info(f"{result=}")
+    return result
+
+
+def clear() -> None:
+    """Delete all stored segmentations."""
+    if os.path.exists(SEGMENTATION_DIR_PATH):
+        shutil.rmtree(SEGMENTATION_DIR_PATH)
+    logger.info(f"cleared {SEGMENTATION_DIR_PATH}")
+
+
+if __name__ == "__main__":
+    fire.Fire({"info": info, "clear": clear})
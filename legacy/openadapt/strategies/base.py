@@ -95,11 +95,12 @@ class BaseReplayStrategy(ABC):
                     )
             self.log_fps()
             if action_event:
-                action_event_dict = utils.rows2dicts(
-                    [action_event],
-                    drop_constant=False,
-                )[0]
-                logger.debug(f"action_event=\n{pformat(action_event_dict)}")
+                logger.opt(lazy=True).debug(
+                    "action_event=\n{}",
+                    lambda: pformat(
+                        utils.rows2dicts([action_event], drop_constant=False)[0]
+                    ),
+                )
                 self.action_events.append(action_event)
                 try:
                     playback.play_action_event(
@@ -30,7 +30,6 @@ See prompts for details:
 
 Todo:
 - handle tab sequences
-- re-use individual segments of previous segmentations
 - handle distinct segments which look identical (e.g. spreadsheet cells)
     - e.g. include segment mask in prompt
     - e.g. annotate grid positions
@@ -51,15 +50,30 @@ import time
 from PIL import Image, ImageDraw
 import numpy as np
 
-from openadapt import adapters, common, models, plotting, strategies, utils, vision
+from openadapt import (
+    adapters,
+    common,
+    models,
+    plotting,
+    segmentation_store,
+    strategies,
+    utils,
+    vision,
+)
+from openadapt.config import config
 from openadapt.custom_logger import logger
 
 DEBUG = False
 DEBUG_REPLAY = False
-SEGMENTATIONS = []  # TODO: store to db
+SEGMENTATIONS = []  # used if config.SEGMENTATION_STORE_ENABLED is False
+SEGMENTATION_INDEX = vision.ImageIndex()  # index of each segmentation's image
+SEGMENTATION_STORE = None  # see get_segmentation_store
 MIN_SCREENSHOT_SSIM = 0.9  # threshold for considering screenshots structurally similar
 MIN_SEGMENT_SSIM = 0.95  # threshold for considering segments structurally similar
 MIN_SEGMENT_SIZE_SIM = 0  # threshold for considering segment sizes similar
+MIN_TILE_SSIM = 0.9  # threshold below which a region of a similar screenshot changed
+MIN_PIXEL_DIFF = 16  # grayscale difference above which a pixel changed
+MAX_DIRTY_TILE_FRACTION = 0.5  # fraction of changed tiles above which to re-segment
 
 
 @dataclass
@@ -79,6 +93,7 @@ class Segmentation:
             the position and size of the box.
         centroids: A list of tuples, each containing the x and y coordinates of the
             centroid of each segmented region.
+        masks: The mask of each segmented region, cropped to its bounding box.
     """
 
     image: Image.Image
@@ -87,6 +102,19 @@ class Segmentation:
     descriptions: list[str]
     bounding_boxes: list[dict[str, float]]  # "top", "left", "height", "width"
     centroids: list[tuple[float, float]]
+    masks: list[vision.CroppedMask] | None = None
+
+
+def get_segmentation_store() -> segmentation_store.SegmentationStore:
+    """Get the store of segmentations persisted across replays.
+
+    Returns:
+        segmentation_store.SegmentationStore: The store, loaded on first use.
+    """
+    global SEGMENTATION_STORE
+    if SEGMENTATION_STORE is None:
+        SEGMENTATION_STORE = segmentation_store.SegmentationStore()
+    return SEGMENTATION_STORE
 
 
 def add_active_segment_descriptions(action_events: list[models.ActionEvent]) -> None:
@@ -339,10 +367,11 @@ def find_similar_image_segmentation(
 ) -> tuple[Segmentation, np.ndarray] | tuple[None, None]:
     """Identify a similar image in the cache based on the SSIM comparison.
 
-    This function iterates through a global list of image segmentations,
-    comparing each against a given image using the SSIM index calculated by
-    get_image_similarity.
-    It logs and updates the best match found above a specified SSIM threshold.
+    This function queries the segmentations persisted across replays, or if
+    config.SEGMENTATION_STORE_ENABLED is False, the index of the images of a global
+    list of image segmentations. Either only computes SSIM for the candidates with
+    the nearest perceptual hashes.
+    It logs the best match found above a specified SSIM threshold.
 
     Args:
         image (Image.Image): The image to compare against the cache.
@@ -353,20 +382,25 @@ def find_similar_image_segmentation(
         segmentation and its difference image if a match is found;
         otherwise, None for both.
     """
-    similar_segmentation = None
-    similar_segmentation_diff = None
-
-    for segmentation in SEGMENTATIONS:
-        similarity_index, ssim_image = vision.get_image_similarity(
-            image,
-            segmentation.image,
+    if config.SEGMENTATION_STORE_ENABLED:
+        fields, similar_segmentation_diff = get_segmentation_store().find_similar(
+            image, min_ssim
         )
-        if similarity_index > min_ssim:
-            logger.info(f"{similarity_index=}")
-            min_ssim = similarity_index
-            similar_segmentation = segmentation
-            similar_segmentation_diff = ssim_image
-
+        if fields is None:
+            return None, None
+        return Segmentation(**fields), similar_segmentation_diff
+
+    idxs, similarity_indices, ssim_images = SEGMENTATION_INDEX.query(image)
+    if not len(idxs) or similarity_indices[0] <= min_ssim:
+        return None, None
+
+    similarity_index = similarity_indices[0]
+    logger.info(f"{similarity_index=}")
+    similar_segmentation = SEGMENTATIONS[idxs[0]]
+    # resize the downscaled SSIM image to the size of the image
+    similar_segmentation_diff = np.asarray(
+        Image.fromarray(ssim_images[0]).resize(image.size, Image.BILINEAR)
+    )
     return similar_segmentation, similar_segmentation_diff
 
 
@@ -396,23 +430,16 @@ def get_window_segmentation(
             find_similar_image_segmentation(original_image)
         )
         if similar_segmentation:
-            # TODO XXX: create copy of similar_segmentation, but overwrite with segments
-            # of regions of new image where segments of similar_segmentation overlap
-            # non-zero regions of similar_segmentation_diff
-            return similar_segmentation
-
-    segmentation_adapter = adapters.get_default_segmentation_adapter()
-    segmented_image = segmentation_adapter.fetch_segmented_image(original_image)
-    if DEBUG:
-        segmented_image.show()
-
-    masks = vision.get_masks_from_segmented_image(segmented_image)
-    if DEBUG:
-        plotting.display_binary_images_grid(masks)
+            segmentation = get_incremental_segmentation(
+                similar_segmentation,
+                similar_segmentation_diff,
+                original_image,
+                action_event.active_segment_description,
+            )
+            if segmentation:
+                return segmentation
 
-    refined_masks = vision.refine_masks(masks)
-    if DEBUG:
-        plotting.display_binary_images_grid(refined_masks)
+    refined_masks = segment_image(original_image)
 
     masked_images = vision.extract_masked_images(original_image, refined_masks)
 
@@ -431,28 +458,171 @@ def get_window_segmentation(
         action_event.active_segment_description,
         exceptions,
     )
-    bounding_boxes, centroids = vision.calculate_bounding_boxes(refined_masks)
+    segmentation = create_segmentation(
+        original_image, masked_images, descriptions, refined_masks
+    )
+    add_segmentation(segmentation)
+    return segmentation
+
+
+def segment_image(image: Image.Image) -> list[vision.CroppedMask]:
+    """Segment an image with the default segmentation adapter.
+
+    Args:
+        image: The image to segment.
+
+    Returns:
+        list[vision.CroppedMask]: The refined mask of each segment.
+    """
+    segmentation_adapter = adapters.get_default_segmentation_adapter()
+    segmented_image = segmentation_adapter.fetch_segmented_image(image)
+    if DEBUG:
+        segmented_image.show()
+
+    label_map = vision.get_label_map(segmented_image)
+    if DEBUG:
+        plotting.display_binary_images_grid(
+            [np.asarray(mask) for mask in label_map.get_masks()]
+        )
+
+    refined_masks = vision.refine_masks(label_map)
+    if DEBUG:
+        plotting.display_binary_images_grid(
+            [np.asarray(mask) for mask in refined_masks]
+        )
+    return refined_masks
+
+
+def create_segmentation(
+    image: Image.Image,
+    masked_images: list[Image.Image],
+    descriptions: list[str],
+    masks: list[vision.CroppedMask],
+) -> Segmentation:
+    """Create a segmentation from described masks, marking the image.
+
+    Args:
+        image: The segmented image.
+        masked_images: The image masked by each mask.
+        descriptions: The description of each mask.
+        masks: The masks of the segments.
+
+    Returns:
+        Segmentation: The segmentation.
+    """
+    bounding_boxes, centroids = vision.calculate_bounding_boxes(masks)
     assert len(bounding_boxes) == len(descriptions) == len(centroids), (
         len(bounding_boxes),
         len(descriptions),
         len(centroids),
     )
-    marked_image = plotting.get_marked_image(
-        original_image,
-        refined_masks,  # masks,
-    )
+    marked_image = plotting.get_marked_image(image, masks, centroids=centroids)
     segmentation = Segmentation(
-        original_image,
+        image,
         marked_image,
         masked_images,
         descriptions,
         bounding_boxes,
         centroids,
+        masks,
     )
     if DEBUG:
         plotting.display_images_table_with_titles(masked_images, descriptions)
+    return segmentation
+
+
+def add_segmentation(segmentation: Segmentation) -> None:
+    """Add a segmentation to those searched by find_similar_image_segmentation.
+
+    Args:
+        segmentation: The segmentation to add.
+    """
+    if config.SEGMENTATION_STORE_ENABLED:
+        get_segmentation_store().add(segmentation)
+    else:
+        SEGMENTATIONS.append(segmentation)
+        SEGMENTATION_INDEX.add(segmentation.image)
+
 
-    SEGMENTATIONS.append(segmentation)
+def get_incremental_segmentation(
+    similar_segmentation: Segmentation,
+    similar_segmentation_diff: np.ndarray,
+    image: Image.Image,
+    active_segment_description: str | None,
+    exceptions: list[Exception] | None = None,
+) -> Segmentation | None:
+    """Update a similar segmentation by re-segmenting only the regions that changed.
+
+    The image is divided into tiles, and the tiles where either the SSIM image or the
+    pixels differ from the similar image are re-segmented, along with their
+    neighbours. The masks found in these regions replace those of the similar
+    segmentation that they cover, and only the new masks are described.
+
+    Args:
+        similar_segmentation: The segmentation of an image similar to this one.
+        similar_segmentation_diff: The SSIM image of the two images, at the size of
+            this image.
+        image: The image to segment.
+        active_segment_description: Description of the active segment.
+        exceptions: List of exceptions previously raised, added to prompts.
+
+    Returns:
+        Segmentation | None: The similar segmentation if nothing changed, the
+            updated segmentation if little changed, or None if the image must be
+            segmented entirely.
+    """
+    similar_image = similar_segmentation.image
+    if similar_segmentation.masks is None or similar_image.size != image.size:
+        return None
+
+    pixel_diff = np.abs(
+        np.asarray(image.convert("L"), dtype=np.int16)
+        - np.asarray(similar_image.convert("L"), dtype=np.int16)
+    )
+    changed = (similar_segmentation_diff < MIN_TILE_SSIM) | (
+        pixel_diff > MIN_PIXEL_DIFF
+    )
+    dirty_tiles = vision.get_dirty_tiles(changed)
+    dirty_tile_fraction = float(dirty_tiles.mean())
+    logger.info(f"{dirty_tile_fraction=}")
+    if not dirty_tiles.any():
+        return similar_segmentation
+    if dirty_tile_fraction > MAX_DIRTY_TILE_FRACTION:
+        return None
+
+    shape = changed.shape
+    regions = vision.get_dirty_regions(dirty_tiles, shape)
+    new_masks = []
+    for top, left, bottom, right in regions:
+        region_masks = segment_image(image.crop((left, top, right, bottom)))
+        new_masks += [
+            vision.CroppedMask(
+                mask.data, mask.top + top, mask.left + left, shape
+            ).tighten()
+            for mask in region_masks
+        ]
+    masks = [mask.tighten() for mask in similar_segmentation.masks]
+    kept_idxs, new_masks = vision.merge_masks(masks, new_masks, dirty_tiles, regions)
+
+    masks = [masks[idx] for idx in kept_idxs] + new_masks
+    # kept masks extending past the re-segmented regions may also cover changes
+    masked_images = vision.extract_masked_images(image, masks)
+    new_descriptions = (
+        prompt_for_descriptions(
+            image,
+            masked_images[len(kept_idxs) :],
+            active_segment_description,
+            exceptions,
+        )
+        if new_masks
+        else []
+    )
+    descriptions = [
+        similar_segmentation.descriptions[idx] for idx in kept_idxs
+    ] + new_descriptions
+    logger.info(f"num_regions={len(regions)} num_new_masks={len(new_masks)}")
+    segmentation = create_segmentation(image, masked_images, descriptions, masks)
+    add_segmentation(segmentation)
     return segmentation
 
 
@@ -16,6 +16,7 @@ from openadapt.custom_logger import logger
 DEBUG = True
 DEBUG_REPLAY = False
 SEGMENTATIONS = []  # TODO: store to db
+SEGMENTATION_INDEX = vision.ImageIndex()  # index of each segmentation's image
 MIN_SCREENSHOT_SSIM = 0.9  # threshold for considering screenshots structurally similar
 MIN_SEGMENT_SSIM = 0.95  # threshold for considering segments structurally similar
 MIN_SEGMENT_SIZE_SIM = 0  # threshold for considering segment sizes similar
@@ -313,14 +314,18 @@ def find_similar_image_segmentation(
 ) -> tuple[Segmentation, np.ndarray] | tuple[None, None]:
     """Identify a similar image in the cache based on the SSIM comparison.
 
-    This function iterates through a global list of image segmentations,
-    comparing each against a given image using the SSIM index calculated by
-    get_image_similarity.
-    It logs and updates the best match found above a specified SSIM threshold.
+    This function queries the index of the images of a global list of image
+    segmentations, which only computes SSIM for the candidates with the nearest
+    perceptual hashes, on downscaled grayscale images. Since that misses small
+    changes (e.g. a typed character), and a matching segmentation is reused as is,
+    the candidates above the threshold are then compared at full resolution with
+    get_image_similarity, as was every segmentation before the index.
+    It logs the best match found above a specified SSIM threshold.
 
     Args:
         image (Image.Image): The image to compare against the cache.
-        min_ssim (float): The minimum SSIM threshold for considering a match.
+        min_ssim (float): The minimum SSIM threshold for considering a match, at
+            both resolutions.
 
     Returns:
         tuple[Segmentation, np.ndarray] | tuple[None, None]: The best matching
@@ -330,7 +335,9 @@ def find_similar_image_segmentation(
     similar_segmentation = None
     similar_segmentation_diff = None
 
-    for segmentation in SEGMENTATIONS:
+    idxs, _, _ = SEGMENTATION_INDEX.query(image, min_ssim=min_ssim)
+    for idx in idxs:
+        segmentation = SEGMENTATIONS[idx]
         similarity_index, ssim_image = vision.get_image_similarity(
             image,
             segmentation.image,
@@ -402,13 +409,17 @@ def get_window_segmentation(
         if DEBUG:
             segmented_image.show()
 
-        masks = vision.get_masks_from_segmented_image(segmented_image)
+        label_map = vision.get_label_map(segmented_image)
         if DEBUG:
-            plotting.display_binary_images_grid(masks)
+            plotting.display_binary_images_grid(
+                [np.asarray(mask) for mask in label_map.get_masks()]
+            )
 
-        refined_masks = vision.refine_masks(masks)
+        refined_masks = vision.refine_masks(label_map)
         if DEBUG:
-            plotting.display_binary_images_grid(refined_masks)
+            plotting.display_binary_images_grid(
+                [np.asarray(mask) for mask in refined_masks]
+            )
 
     masked_images = vision.extract_masked_images(original_image, refined_masks)
     if action_event.browser_event and DEBUG:
@@ -438,6 +449,7 @@ def get_window_segmentation(
     marked_image = plotting.get_marked_image(
         original_image,
         refined_masks,  # masks,
+        centroids=centroids,
     )
     segmentation = Segmentation(
         original_image,
@@ -451,6 +463,7 @@ def get_window_segmentation(
         plotting.display_images_table_with_titles(masked_images, descriptions)
 
     SEGMENTATIONS.append(segmentation)
+    SEGMENTATION_INDEX.add(original_image)
     return segmentation
 
 
@@ -0,0 +1,498 @@
+"""Generate synthetic recordings for testing and benchmarking.
+
+Events are written through openadapt.db.crud in the same format as openadapt.record
+writes them, so that synthetic recordings can be loaded and processed like real ones
+without recording the screen.
+
+Usage:
+
+    $ python -m openadapt.synthetic generate --num_clicks=100 --num_key_bursts=50
+"""
+
+from typing import Any
+import io
+import random
+import string
+import sys
+import time
+
+from PIL import Image, ImageDraw
+
+from openadapt.build_utils import redirect_stdout_stderr
+from openadapt.custom_logger import logger
+
+with redirect_stdout_stderr():
+    import fire
+
+from openadapt import browser, utils, video
+from openadapt.config import config
+from openadapt.db import crud
+from openadapt.models import Recording, Screenshot
+
+NUM_DISTINCT_SCREENSHOTS = 8
+MOVE_SEGMENT_LENGTH = 10
+SCROLL_SEGMENT_LENGTH = 5
+MIN_DT = 0.01
+MAX_DT = 0.1
+DOUBLE_CLICK_PROBABILITY = 0.2
+NUM_SEGMENTS = 400
+MIN_SEGMENT_SIZE = 8
+ELLIPSE_PROBABILITY = 0.2
+
+
+def get_screenshot_png_datas(
+    screenshot_size: tuple[int, int],
+    num_distinct: int = NUM_DISTINCT_SCREENSHOTS,
+    seed: int = 0,
+) -> list[bytes]:
+    """Generate PNG encoded screenshots of simple synthetic windows.
+
+    Args:
+        screenshot_size (tuple[int, int]): The width and height of the screenshots.
+        num_distinct (int): The number of distinct screenshots to generate.
+        seed (int): The random seed.
+
+    Returns:
+        list[bytes]: The PNG data of each screenshot.
+    """
+    rng = random.Random(seed)
+    width, height = screenshot_size
+    png_datas = []
+    for _ in range(num_distinct):
+        image = Image.new("RGB", screenshot_size, (240, 240, 240))
+        draw = ImageDraw.Draw(image)
+        for _ in range(10):
+            left = rng.randrange(width)
+            top = rng.randrange(height)
+            right = rng.randint(left, width)
+            bottom = rng.randint(top, height)
+            fill = tuple(rng.randrange(256) for _ in range(3))
+            draw.rectangle((left, top, right, bottom), fill=fill)
+        with io.BytesIO() as output:
+            image.save(output, format="PNG")
+            png_datas.append(output.getvalue())
+    return png_datas
+
+
+def get_segmented_image(
+    image_size: tuple[int, int],
+    num_segments: int = NUM_SEGMENTS,
+    seed: int = 0,
+) -> Image.Image:
+    """Generate a segmented image of nested segments, each with a unique color.
+
+    Segments are drawn inside previously drawn ones, like the panels, buttons and
+    icons that a segmentation model finds in a window, so that once their holes are
+    filled many segments are contained in others.
+
+    Args:
+        image_size (tuple[int, int]): The width and height of the image.
+        num_segments (int): The number of segments to draw. Segments may be
+            partially or completely covered by later ones.
+        seed (int): The random seed.
+
+    Returns:
+        Image.Image: The segmented image.
+    """
+    rng = random.Random(seed)
+    width, height = image_size
+    image = Image.new("RGB", image_size, (0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    boxes = [(0, 0, width, height)]
+    for color in rng.sample(range(1, 2**24), num_segments):
+        parent_left, parent_top, parent_right, parent_bottom = rng.choice(boxes)
+        parent_width = parent_right - parent_left
+        parent_height = parent_bottom - parent_top
+        box_width = max(int(parent_width * rng.uniform(0.1, 0.6)), MIN_SEGMENT_SIZE)
+        box_height = max(int(parent_height * rng.uniform(0.1, 0.6)), MIN_SEGMENT_SIZE)
+        # leave a margin so that the segment leaves a hole in its parent
+        left = parent_left + 1 + rng.randrange(parent_width - box_width - 1)
+        top = parent_top + 1 + rng.randrange(parent_height - box_height - 1)
+        box = (left, top, left + box_width, top + box_height)
+        fill = tuple(color.to_bytes(3, "big"))
+        if rng.random() < ELLIPSE_PROBABILITY:
+            draw.ellipse(box, fill=fill)
+        else:
+            draw.rectangle(box, fill=fill)
+            # only segments large enough to hold others become parents
+            if min(box_width, box_height) >= 4 * MIN_SEGMENT_SIZE:
+                boxes.append(box)
+    return image
+
+
+def get_browser_message(
+    timestamp: float,
+    action_data: dict[str, Any],
+    screenshot_size: tuple[int, int],
+) -> dict[str, Any] | None:
+    """Get the message the browser extension would send for an action.
+
+    Args:
+        timestamp (float): The timestamp of the action.
+        action_data (dict): The action event data.
+        screenshot_size (tuple[int, int]): The width and height of the screen.
+
+    Returns:
+        dict | None: The browser event message, or None if the browser would not
+            send one.
+    """
+    name = action_data["name"]
+    if name not in browser.EVENT_TYPE_MAPPING:
+        return None
+    if name == "click" and action_data["mouse_pressed"]:
+        # the browser sends a single click event on release
+        return None
+    message = {
+        "type": "USER_EVENT",
+        "eventType": browser.EVENT_TYPE_MAPPING[name],
+        "timestamp": timestamp,
+    }
+    if name in ("press", "release"):
+        message["key"] = action_data["key_char"]
+        return message
+
+    # the browser viewport is offset from the screen by a fixed toolbar height
+    width, height = screenshot_size
+    offset_y = 100
+    screen_x = action_data["mouse_x"]
+    screen_y = action_data["mouse_y"]
+    message.update(
+        {
+            "clientX": screen_x,
+            "clientY": screen_y - offset_y,
+            "screenX": screen_x,
+            "screenY": screen_y,
+            "coordMappings": {
+                "x": {"client": [0, width], "screen": [0, width]},
+                "y": {"client": [0, height], "screen": [offset_y, height + offset_y]},
+            },
+        }
+    )
+    if name == "click":
+        message["button"] = browser.MOUSE_BUTTON_MAPPING[
+            action_data["mouse_button_name"]
+        ]
+        message["targetId"] = "1"
+        message["visibleHTMLString"] = (
+            '<html><body><div data-id="1"'
+            f' data-tlbr-client="0,0,{height},{width}"></div></body></html>'
+        )
+    elif name == "scroll":
+        message["scrollDeltaX"] = action_data["mouse_dx"]
+        message["scrollDeltaY"] = action_data["mouse_dy"]
+    return message
+
+
+def generate_action_segments(
+    rng: random.Random,
+    num_moves: int,
+    num_clicks: int,
+    num_key_bursts: int,
+    key_burst_length: int,
+    num_scrolls: int,
+    num_window_switches: int,
+    screenshot_size: tuple[int, int],
+) -> list[list[dict[str, Any]]]:
+    """Generate shuffled segments of action event data.
+
+    Args:
+        rng (random.Random): The random number generator.
+        num_moves (int): The number of mouse move segments.
+        num_clicks (int): The number of clicks (some of which are double clicks).
+        num_key_bursts (int): The number of typed key bursts.
+        key_burst_length (int): The number of keys in each burst.
+        num_scrolls (int): The number of scroll segments.
+        num_window_switches (int): The number of window switches.
+        screenshot_size (tuple[int, int]): The width and height of the screen.
+
+    Returns:
+        list[list[dict]]: Segments of action event data. An empty segment indicates a
+            window switch.
+    """
+    width, height = screenshot_size
+
+    def get_position() -> dict[str, int]:
+        return {"mouse_x": rng.randrange(width), "mouse_y": rng.randrange(height)}
+
+    def get_key_events(key_char: str) -> list[dict[str, Any]]:
+        return [
+            {
+                "name": name,
+                "key_name": None,
+                "key_char": key_char,
+                "key_vk": None,
+                "canonical_key_name": None,
+                "canonical_key_char": key_char,
+                "canonical_key_vk": None,
+            }
+            for name in ("press", "release")
+        ]
+
+    segments = []
+    for _ in range(num_moves):
+        segments.append(
+            [{"name": "move", **get_position()} for _ in range(MOVE_SEGMENT_LENGTH)]
+        )
+    for _ in range(num_clicks):
+        position = get_position()
+        num_presses = 2 if rng.random() < DOUBLE_CLICK_PROBABILITY else 1
+        segments.append(
+            [
+                {
+                    "name": "click",
+                    **position,
+                    "mouse_button_name": "left",
+                    "mouse_pressed": pressed,
+                }
+                for _ in range(num_presses)
+                for pressed in (True, False)
+            ]
+        )
+    for _ in range(num_key_bursts):
+        segments.append(
+            [
+                key_event
+                for _ in range(key_burst_length)
+                for key_event in get_key_events(rng.choice(string.ascii_lowercase))
+            ]
+        )
+    for _ in range(num_scrolls):
+        position = get_position()
+        segments.append(
+            [
+                {
+                    "name": "scroll",
+                    **position,
+                    "mouse_dx": 0,
+                    "mouse_dy": rng.choice([-1, 1]),
+                }
+                for _ in range(SCROLL_SEGMENT_LENGTH)
+            ]
+        )
+    segments += [[] for _ in range(num_window_switches)]
+    rng.shuffle(segments)
+    return segments
+
+
+def generate_recording(
+    session: crud.SaSession,
+    num_moves: int = 50,
+    num_clicks: int = 50,
+    num_key_bursts: int = 20,
+    key_burst_length: int = 8,
+    num_scrolls: int = 10,
+    num_window_switches: int = 5,
+    browser_event_fraction: float = 0.5,
+    screenshot_size: tuple[int, int] = (1280, 800),
+    seed: int = 0,
+    task_description: str = "synthetic",
+) -> Recording:
+    """Generate a synthetic recording and write it to the database.
+
+    A screenshot is saved before each segment of actions, and a window event at the
+    start and at each window switch. Browser events are written for the actions in a
+    fraction of the segments, as if those segments took place in a browser.
+
+    Args:
+        session (sa.orm.Session): The database session.
+        num_moves (int): The number of mouse move segments.
+        num_clicks (int): The number of clicks (some of which are double clicks).
+        num_key_bursts (int): The number of typed key bursts.
+        key_burst_length (int): The number of keys in each burst.
+        num_scrolls (int): The number of scroll segments.
+        num_window_switches (int): The number of window switches.
+        browser_event_fraction (float): The fraction of segments with browser events.
+        screenshot_size (tuple[int, int]): The width and height of the screenshots.
+        seed (int): The random seed.
+        task_description (str): The task description of the recording.
+
+    Returns:
+        Recording: The recording.
+    """
+    rng = random.Random(seed)
+    screenshot_size = tuple(screenshot_size)
+    screenshot_datas = [
+        {
+            "png_data": png_data,
+            **(
+                Screenshot.get_thumbnail_data(Image.open(io.BytesIO(png_data)))
+                if config.RECORD_THUMBNAILS
+                else {}
+            ),
+        }
+        for png_data in get_screenshot_png_datas(screenshot_size, seed=seed)
+    ]
+    timestamp = time.time()
+    width, height = screenshot_size
+    recording = crud.insert_recording(
+        session,
+        {
+            "timestamp": timestamp,
+            "monitor_width": width,
+            "monitor_height": height,
+            "double_click_distance_pixels": utils.DEFAULT_DOUBLE_CLICK_DISTANCE_PIXELS,
+            "double_click_interval_seconds": (
+                utils.DEFAULT_DOUBLE_CLICK_INTERVAL_SECONDS
+            ),
+            "platform": sys.platform,
+            "task_description": task_description,
+            "config": config.model_dump(obfuscated=True),
+        },
+    )
+    segments = generate_action_segments(
+        rng,
+        num_moves,
+        num_clicks,
+        num_key_bursts,
+        key_burst_length,
+        num_scrolls,
+        num_window_switches,
+        screenshot_size,
+    )
+
+    def get_window_data(window_idx: int) -> dict[str, Any]:
+        return {
+            "title": f"Window {window_idx}",
+            "left": 0,
+            "top": 0,
+            "width": width,
+            "height": height,
+            "window_id": str(window_idx),
+            "state": {},
+        }
+
+    window_idx = 0
+    window_timestamp = timestamp
+    crud.insert_window_event(session, recording, timestamp, get_window_data(window_idx))
+    num_action_events = 0
+    num_screenshots = 0
+    num_browser_events = 0
+    for segment in segments:
+        timestamp += rng.uniform(MIN_DT, MAX_DT)
+        if not segment:
+            window_idx += 1
+            window_timestamp = timestamp
+            crud.insert_window_event(
+                session, recording, timestamp, get_window_data(window_idx)
+            )
+            continue
+        screenshot_timestamp = timestamp
+        crud.insert_screenshot(
+            session,
+            recording,
+            screenshot_timestamp,
+            screenshot_datas[num_screenshots % len(screenshot_datas)],
+        )
+        num_screenshots += 1
+        is_browser = rng.random() < browser_event_fraction
+        for action_data in segment:
+            timestamp += rng.uniform(MIN_DT, MAX_DT)
+            crud.insert_action_event(
+                session,
+                recording,
+                timestamp,
+                {
+                    **action_data,
+                    "screenshot_timestamp": screenshot_timestamp,
+                    "window_event_timestamp": window_timestamp,
+                },
+            )
+            num_action_events += 1
+            message = (
+                get_browser_message(timestamp, action_data, screenshot_size)
+                if is_browser
+                else None
+            )
+            if message:
+                crud.insert_browser_event(
+                    session, recording, timestamp, {"message": message}
+                )
+                num_browser_events += 1
+    crud.post_process_events(session, recording)
+    logger.info(
+        f"{recording.id=} {num_action_events=} {num_screenshots=} "
+        f"{num_browser_events=} num_window_events={window_idx + 1}"
+    )
+    return recording
+
+
+def generate_video(
+    video_file_path: str,
+    duration: float = 60,
+    fps: int = 24,
+    frame_size: tuple[int, int] = (1280, 800),
+    seed: int = 0,
+    gop_size: int | None = None,
+    segment_duration: float = 0,
+    **kwargs: Any,
+) -> list[float]:
+    """Generate a synthetic video in the same format as openadapt.record writes it.
+
+    Each frame is one of a small set of synthetic screenshots, with a marker whose
+    position depends on the frame number so that consecutive frames differ.
+
+    Args:
+        video_file_path (str): The path to the video file to write.
+        duration (float): The duration of the video in seconds.
+        fps (int): The number of frames per second.
+        frame_size (tuple[int, int]): The width and height of the frames.
+        seed (int): The random seed.
+        gop_size (int, optional): The maximum number of frames between key frames.
+            Defaults to the encoder's default.
+        segment_duration (float): The minimum duration of each segment file in
+            seconds, or 0 to write a single file (see video.SegmentedVideoWriter).
+        **kwargs: Keyword arguments passed to video.initialize_video_writer, e.g.
+            crf and preset.
+
+    Returns:
+        list[float]: The timestamp of each frame in seconds, relative to the start of
+            the video.
+    """
+    width, height = frame_size = tuple(frame_size)
+    images = [
+        Image.open(io.BytesIO(png_data)).convert("RGB")
+        for png_data in get_screenshot_png_datas(frame_size, seed=seed)
+    ]
+    utils.set_start_time()
+    video_writer = video.SegmentedVideoWriter(
+        video_file_path,
+        width,
+        height,
+        segment_duration,
+        video_start_timestamp=0,
+        fps=fps,
+        gop_size=gop_size,
+        **kwargs,
+    )
+    num_frames = int(duration * fps)
+    timestamps = [frame_idx / fps for frame_idx in range(num_frames)]
+    for frame_idx, timestamp in enumerate(timestamps):
+        image = images[frame_idx % len(images)].copy()
+        marker_size = max(1, min(width, height) // 20)
+        left = frame_idx * marker_size % (width - marker_size)
+        top = frame_idx // 20 * marker_size % (height - marker_size)
+        ImageDraw.Draw(image).rectangle(
+            (left, top, left + marker_size, top + marker_size), fill=(0, 0, 0)
+        )
+        video_writer.write_frame(image, timestamp)
+    video_writer.finalize()
+    logger.info(f"{video_file_path=} {num_frames=}")
+    return timestamps
+
+
+def generate(**kwargs: Any) -> int:
+    """Generate a synthetic recording in the configured database.
+
+    Args:
+        **kwargs: Keyword arguments passed to generate_recording.
+
+    Returns:
+        int: The id of the recording.
+    """
+    session = crud.get_new_session(read_and_write=True)
+    recording = generate_recording(session, **kwargs)
+    return recording.id
+
+
+if __name__ == "__main__":
+    fire.Fire({"generate": generate})
@@ -3,6 +3,7 @@
 This module provides various utility functions used throughout OpenAdapt.
 """
 
+from collections import OrderedDict
 from functools import wraps
 from io import BytesIO
 from logging import StreamHandler
@@ -12,17 +13,21 @@ import base64
 import importlib.metadata
 import inspect
 import os
+import struct
 import subprocess
 import sys
 import threading
 import time
+import zlib
 
 from bs4 import BeautifulSoup
 from jinja2 import Environment, FileSystemLoader
 from PIL import Image, ImageEnhance
 from posthog import Posthog
+from scipy import ndimage
 import multiprocessing_utils
 
+from openadapt import cache
 from openadapt.build_utils import is_running_from_executable, redirect_stdout_stderr
 from openadapt.custom_logger import logger
 
@@ -33,6 +38,13 @@ import mss
 import mss.base
 import numpy as np
 import orjson
+import sqlalchemy as sa
+
+try:
+    # faster JPEG encoding with libjpeg-turbo
+    import simplejpeg
+except ImportError:
+    simplejpeg = None
 
 if sys.platform == "win32":
     import mss.windows
@@ -57,6 +69,18 @@ EMPTY = (None, [], {}, "")
 # TODO: move to config.py
 DEFAULT_DOUBLE_CLICK_INTERVAL_SECONDS = 0.5
 DEFAULT_DOUBLE_CLICK_DISTANCE_PIXELS = 5
+# changes within about this many pixels of each other share a bounding box
+DIFF_BBOX_BLOCK_SIZE = 16
+# Pillow's default
+JPEG_QUALITY = 75
+# non-column attributes included in row dicts when present on the row
+ROW_DICT_INCLUDE = [
+    "key",
+    "text",
+    "canonical_key",
+    "canonical_text",
+    "reducer_names",
+]
 
 _logger_lock = threading.Lock()
 _start_time = None
@@ -65,6 +89,9 @@ _start_perf_counter = None
 # Process-local storage for MSS instances
 _process_local = multiprocessing_utils.local()
 
+# row class -> (column keys, include keys), see get_row_plan
+_row_plans = {}
+
 
 def configure_logging(logger: logger, log_level: str) -> None:
     """Configure the logging settings for OpenAdapt.
@@ -99,6 +126,42 @@ def configure_logging(logger: logger, log_level: str) -> None:
         logger.debug(f"{log_level=}")
 
 
+def get_row_plan(row: db.BaseModel) -> tuple[list[str], list[str]] | None:
+    """Get the attributes to read when converting a row to a dictionary.
+
+    The plan is computed once per row class. It contains the same keys as
+    row.asdict, without the per-row mapper inspection and argument copying.
+
+    Args:
+        row (db.BaseModel): A row of the class whose plan to get.
+
+    Returns:
+        tuple[list[str], list[str]] | None: The column attribute names and the
+            names of the ROW_DICT_INCLUDE attributes present on the row, or None if
+            the row class overrides asdict.
+    """
+    row_cls = type(row)
+    if row_cls not in _row_plans:
+        if row_cls.asdict is not db.BaseModel.asdict:
+            _row_plans[row_cls] = None
+        else:
+            mapper = sa.inspect(row_cls)
+            exclude = getattr(row_cls, "dictalchemy_exclude", None) or []
+            if getattr(row_cls, "dictalchemy_exclude_underscore", True):
+                exclude = exclude + [
+                    attr.key for attr in mapper.attrs if attr.key.startswith("_")
+                ]
+            column_keys = [
+                key
+                for key in [attr.key for attr in mapper.column_attrs]
+                + [attr.key for attr in mapper.synonyms]
+                if key not in exclude
+            ]
+            include_keys = [key for key in ROW_DICT_INCLUDE if hasattr(row, key)]
+            _row_plans[row_cls] = (column_keys, include_keys)
+    return _row_plans[row_cls]
+
+
 def row2dict(row: dict | db.BaseModel, follow: bool = True) -> dict:
     """Convert a row object to a dictionary.
 
@@ -113,23 +176,43 @@ def row2dict(row: dict | db.BaseModel, follow: bool = True) -> dict:
         return {}
     if isinstance(row, dict):
         return row
-    try_follow = ["children"] if follow else []
-    to_follow = [key for key in try_follow if hasattr(row, key)]
+    plan = get_row_plan(row)
+    if plan is None:
+        try_follow = ["children"] if follow else []
+        to_follow = [key for key in try_follow if hasattr(row, key)]
+
+        # follow children recursively
+        if "children" in to_follow:
+            to_follow = {key: {} for key in to_follow}
+            to_follow["children"]["follow"] = to_follow
+
+        to_include = [key for key in ROW_DICT_INCLUDE if hasattr(row, key)]
+        return row.asdict(follow=to_follow, include=to_include)
+    column_keys, include_keys = plan
+    row_dict = {key: getattr(row, key) for key in column_keys + include_keys}
+    if follow and hasattr(row, "children"):
+        # like asdict, children are followed recursively without includes
+        row_dict["children"] = [_row2dict_columns(child) for child in row.children]
+    return row_dict
 
-    # follow children recursively
-    if "children" in to_follow:
-        to_follow = {key: {} for key in to_follow}
-        to_follow["children"]["follow"] = to_follow
 
-    try_include = [
-        "key",
-        "text",
-        "canonical_key",
-        "canonical_text",
-        "reducer_names",
-    ]
-    to_include = [key for key in try_include if hasattr(row, key)]
-    row_dict = row.asdict(follow=to_follow, include=to_include)
+def _row2dict_columns(row: db.BaseModel) -> dict:
+    """Convert a row object and its descendants to dictionaries, without includes.
+
+    Args:
+        row (db.BaseModel): The row object.
+
+    Returns:
+        dict: The row object converted to a dictionary.
+    """
+    plan = get_row_plan(row)
+    if plan is None:
+        to_follow = {"children": {}}
+        to_follow["children"]["follow"] = to_follow
+        return row.asdict(follow=to_follow)
+    column_keys, _ = plan
+    row_dict = {key: getattr(row, key) for key in column_keys}
+    row_dict["children"] = [_row2dict_columns(child) for child in row.children]
     return row_dict
 
 
@@ -159,6 +242,9 @@ def rows2dicts(
 ) -> list[dict]:
     """Convert a list of rows to a list of dictionaries.
 
+    Which columns to keep is decided in a single pass over each column, comparing
+    values by equality rather than by their repr.
+
     Args:
         rows (list): The list of rows.
         drop_empty (bool): Flag indicating whether to drop empty rows. Defaults to True.
@@ -173,32 +259,29 @@ def rows2dicts(
     if num_digits:
         round_timestamps(rows, num_digits)
     row_dicts = [row2dict(row) for row in rows]
-    if drop_empty:
-        keep_keys = set()
-        for row_dict in row_dicts:
-            for key in row_dict:
-                if row_dict[key] not in EMPTY:
-                    keep_keys.add(key)
-        for row_dict in row_dicts:
-            for key in list(row_dict.keys()):
-                if key not in keep_keys:
-                    del row_dict[key]
-    if drop_constant:
-        key_to_values = {}
-        for row_dict in row_dicts:
-            for key in row_dict:
-                key_to_values.setdefault(key, set())
-                value = repr(row_dict[key])
-                key_to_values[key].add(value)
-        for row_dict in row_dicts:
-            for key in list(row_dict.keys()):
-                value = row_dict[key]
-                if len(key_to_values[key]) <= 1 or drop_empty and value in EMPTY:
-                    del row_dict[key]
+
+    key_to_values = {}
     for row_dict in row_dicts:
-        for key in drop_cols:
-            if key in row_dict:
-                del row_dict[key]
+        for key, value in row_dict.items():
+            key_to_values.setdefault(key, []).append(value)
+    keep_keys = set()
+    for key, values in key_to_values.items():
+        if key in drop_cols:
+            continue
+        if drop_empty and all(value in EMPTY for value in values):
+            continue
+        if drop_constant and all(value == values[0] for value in values[1:]):
+            continue
+        keep_keys.add(key)
+    drop_empty_values = drop_empty and drop_constant
+
+    rval = []
+    for row_dict in row_dicts:
+        row_dict = {
+            key: value
+            for key, value in row_dict.items()
+            if key in keep_keys and not (drop_empty_values and value in EMPTY)
+        }
         # TODO: keep attributes in children which vary across parents
         if "children" in row_dict:
             row_dict["children"] = rows2dicts(
@@ -207,7 +290,8 @@ def rows2dicts(
                 drop_constant,
                 drop_cols,
             )
-    return row_dicts
+        rval.append(row_dict)
+    return rval
 
 
 def override_double_click_interval_seconds(
@@ -357,28 +441,178 @@ def get_scale_ratios(
     return width_ratio, height_ratio
 
 
-def image2utf8(image: Image.Image, image_format: str = "JPEG") -> str:
+class ImageEncodeCache:
+    """Cache of images encoded by image2utf8, keyed by their contents.
+
+    Encoded images are evicted in least recently used order once their total size
+    exceeds max_bytes.
+
+    Attributes:
+        max_bytes (int): The maximum total size of the encoded images in bytes.
+        num_bytes (int): The total size of the encoded images in bytes.
+        stats (dict): The number of hits, misses and evictions.
+    """
+
+    def __init__(self, max_bytes: int | None = None) -> None:
+        """Initialize the cache.
+
+        Args:
+            max_bytes (int, optional): The maximum total size of the encoded images
+                in bytes, or 0 to disable caching. Defaults to
+                config.IMAGE_ENCODE_CACHE_MAX_BYTES.
+        """
+        self.max_bytes = (
+            config.IMAGE_ENCODE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        )
+        self.image_utf8s = OrderedDict()
+        self.num_bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self.lock = threading.Lock()
+
+    @property
+    def hit_rate(self) -> float | None:
+        """The fraction of lookups which were hits, or None if there were none."""
+        num_lookups = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / num_lookups if num_lookups else None
+
+    def get_key(self, image: Image.Image, *args: Any) -> tuple:
+        """Get the cache key of an image.
+
+        The content hash is memoized on the image by cache.get_content_hash, so
+        repeat encodes of the same image are not rehashed and images must not be
+        modified in place once encoded.
+
+        Args:
+            image (Image.Image): The image.
+            *args: The encoding parameters.
+
+        Returns:
+            tuple: The key.
+        """
+        return (cache.get_content_hash(image), *args)
+
+    def get(self, key: tuple) -> str | None:
+        """Get an encoded image.
+
+        Args:
+            key (tuple): The key returned by get_key.
+
+        Returns:
+            str | None: The encoded image, or None if it is not cached.
+        """
+        with self.lock:
+            image_utf8 = self.image_utf8s.get(key)
+            if image_utf8 is None:
+                self.stats["misses"] += 1
+            else:
+                self.image_utf8s.move_to_end(key)
+                self.stats["hits"] += 1
+            return image_utf8
+
+    def put(self, key: tuple, image_utf8: str) -> None:
+        """Add an encoded image, evicting the least recently used ones if needed.
+
+        Args:
+            key (tuple): The key returned by get_key.
+            image_utf8 (str): The encoded image.
+        """
+        if len(image_utf8) > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.image_utf8s:
+                self.num_bytes -= len(self.image_utf8s.pop(key))
+            self.image_utf8s[key] = image_utf8
+            self.num_bytes += len(image_utf8)
+            while self.num_bytes > self.max_bytes:
+                _, evicted_image_utf8 = self.image_utf8s.popitem(last=False)
+                self.num_bytes -= len(evicted_image_utf8)
+                self.stats["evictions"] += 1
+
+    def clear(self) -> None:
+        """Remove all encoded images from the cache."""
+        with self.lock:
+            self.image_utf8s.clear()
+            self.num_bytes = 0
+
+
+# for use in image2utf8
+image_encode_cache = ImageEncodeCache()
+
+
+def encode_image(
+    image: Image.Image,
+    image_format: str = "JPEG",
+    quality: int = JPEG_QUALITY,
+) -> bytes:
+    """Encode an image, with simplejpeg if it is installed and the format is JPEG.
+
+    Args:
+        image (PIL.Image.Image): The image to encode.
+        image_format (str): The format of the image ("JPEG" or "PNG").
+        quality (int): The JPEG quality, from 1 to 100.
+
+    Returns:
+        bytes: The encoded image.
+    """
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    if image_format == "JPEG" and simplejpeg is not None:
+        return simplejpeg.encode_jpeg(
+            np.ascontiguousarray(image), quality=quality, colorspace="RGB"
+        )
+    buffered = BytesIO()
+    if image_format == "JPEG":
+        image.save(buffered, format=image_format, quality=quality)
+    else:
+        image.save(buffered, format=image_format)
+    return buffered.getvalue()
+
+
+def image2utf8(
+    image: Image.Image,
+    image_format: str = "JPEG",
+    quality: int = JPEG_QUALITY,
+    max_side: int | None = None,
+) -> str:
     """Convert an image to UTF-8 format.
 
+    Encoded images are cached by their contents and encoding parameters (see
+    ImageEncodeCache), since the same image is often encoded several times.
+
     Args:
         image (PIL.Image.Image): The image to convert.
         image_format (str): The format of the image ("JPEG" or "PNG").
+        quality (int): The JPEG quality, from 1 to 100.
+        max_side (int, optional): If provided, the image is downscaled such that
+            neither side exceeds this many pixels.
 
     Returns:
         str: The UTF-8 encoded image.
     """
     KNOWN_FORMATS = ("JPEG", "PNG")
+    image_format = image_format.upper()
     assert image_format in KNOWN_FORMATS, (image_format, KNOWN_FORMATS)
     if not image:
         return ""
-    image = image.convert("RGB")
-    buffered = BytesIO()
-    image.save(buffered, format=image_format.upper())
-    image_str = base64.b64encode(buffered.getvalue())
+    key = None
+    if image_encode_cache.max_bytes:
+        key = image_encode_cache.get_key(image, image_format, quality, max_side)
+        image_utf8 = image_encode_cache.get(key)
+        if image_utf8 is not None:
+            return image_utf8
+    if max_side and max(image.size) > max_side:
+        image = image.copy()
+        image.thumbnail((max_side, max_side))
+    image_str = base64.b64encode(encode_image(image, image_format, quality))
     fmt = image_format.lower()
     base64_prefix = bytes(f"data:image/{fmt};base64,", encoding="utf-8")
     image_base64 = base64_prefix + image_str
     image_utf8 = image_base64.decode("utf-8")
+    if key is not None:
+        image_encode_cache.put(key, image_utf8)
+    logger.opt(lazy=True).debug(
+        "{}", lambda: f"{image_encode_cache.stats=} {image_encode_cache.num_bytes=}"
+    )
     return image_utf8
 
 
@@ -467,12 +701,37 @@ def take_screenshot() -> Image.Image:
     Returns:
         PIL.Image: The screenshot image.
     """
+    return bgra2image(take_screenshot_bgra())
+
+
+def take_screenshot_bgra() -> np.ndarray:
+    """Take a screenshot without converting it to an image.
+
+    Returns:
+        np.ndarray: The screenshot as a (height, width, 4) BGRA array, viewing the
+            buffer captured by mss without copying it.
+    """
     # monitor 0 is all in one
     sct = get_process_local_sct()
     monitor = sct.monitors[0]
     sct_img = sct.grab(monitor)
-    image = Image.frombytes("RGB", sct_img.size, sct_img.bgra, "raw", "BGRX")
-    return image
+    width, height = sct_img.size
+    return np.frombuffer(sct_img.raw, dtype=np.uint8).reshape(height, width, 4)
+
+
+def bgra2image(bgra: np.ndarray) -> Image.Image:
+    """Convert a BGRA array (e.g. from take_screenshot_bgra) to an RGB image.
+
+    Args:
+        bgra (np.ndarray): The (height, width, 4) BGRA array.
+
+    Returns:
+        PIL.Image: The image.
+    """
+    height, width, _ = bgra.shape
+    return Image.frombuffer(
+        "RGB", (width, height), np.ascontiguousarray(bgra), "raw", "BGRX", 0, 1
+    )
 
 
 def get_strategy_class_by_name() -> dict:
@@ -541,6 +800,118 @@ def compute_diff(image1: Image.Image, image2: Image.Image) -> Image.Image:
     return Image.fromarray(diff.astype("uint8"))
 
 
+def get_diff(array1: np.ndarray, array2: np.ndarray) -> np.ndarray:
+    """Get the absolute difference between two images.
+
+    Args:
+        array1 (np.ndarray): The (height, width) or (height, width, channels) uint8
+            array of the first image.
+        array2 (np.ndarray): The array of the second image, of the same shape.
+
+    Returns:
+        np.ndarray: The per channel absolute difference, as by ImageChops.difference.
+    """
+    assert array1.shape == array2.shape, (array1.shape, array2.shape)
+    # absolute difference without overflow
+    return np.maximum(array1, array2) - np.minimum(array1, array2)
+
+
+def get_diff_mask(array1: np.ndarray, array2: np.ndarray) -> np.ndarray:
+    """Get the mask of the pixels which differ noticeably between two images.
+
+    The difference image is converted to bilevel as by PIL, i.e. its luminance is
+    thresholded with Floyd-Steinberg dithering, so that small changes (e.g. from
+    compression) are mostly ignored.
+
+    Args:
+        array1 (np.ndarray): The (height, width) or (height, width, channels) uint8
+            array of the first image.
+        array2 (np.ndarray): The array of the second image, of the same shape.
+
+    Returns:
+        np.ndarray: The (height, width) boolean mask.
+    """
+    diff_image = Image.fromarray(get_diff(array1, array2))
+    return np.asarray(diff_image.convert("1"))
+
+
+def get_mask_bboxes(
+    mask: np.ndarray,
+    block_size: int = DIFF_BBOX_BLOCK_SIZE,
+) -> list[list[int]]:
+    """Get the bounding boxes of the regions of a mask.
+
+    The mask is divided into blocks, and adjacent blocks containing any set pixels
+    are grouped into regions, so that nearby changes (e.g. the characters of a
+    word) share a bounding box. Each bounding box is then shrunk to the set pixels
+    it contains.
+
+    Args:
+        mask (np.ndarray): The (height, width) boolean mask.
+        block_size (int): The size of the blocks in pixels.
+
+    Returns:
+        list[list[int]]: The left, top, right and bottom (exclusive) of each region,
+            ordered by top then left.
+    """
+    height, width = mask.shape
+    padded_mask = np.pad(mask, ((0, -height % block_size), (0, -width % block_size)))
+    blocks = padded_mask.reshape(
+        padded_mask.shape[0] // block_size,
+        block_size,
+        padded_mask.shape[1] // block_size,
+        block_size,
+    ).any(axis=(1, 3))
+    labels, _ = ndimage.label(blocks, structure=np.ones((3, 3)))
+    bboxes = []
+    for block_rows, block_cols in ndimage.find_objects(labels):
+        top = block_rows.start * block_size
+        left = block_cols.start * block_size
+        region = mask[
+            top : block_rows.stop * block_size, left : block_cols.stop * block_size
+        ]
+        rows = np.flatnonzero(region.any(axis=1))
+        cols = np.flatnonzero(region.any(axis=0))
+        bboxes.append(
+            [
+                left + int(cols[0]),
+                top + int(rows[0]),
+                left + int(cols[-1]) + 1,
+                top + int(rows[-1]) + 1,
+            ]
+        )
+    return bboxes
+
+
+def pack_mask(mask: np.ndarray) -> bytes:
+    """Pack a boolean mask into 1 bit per pixel, compressed.
+
+    Args:
+        mask (np.ndarray): The (height, width) boolean mask.
+
+    Returns:
+        bytes: The packed mask, including its shape (see unpack_mask).
+    """
+    height, width = mask.shape
+    return struct.pack("<II", height, width) + zlib.compress(
+        np.packbits(mask).tobytes(), 1
+    )
+
+
+def unpack_mask(data: bytes) -> np.ndarray:
+    """Unpack a boolean mask packed with pack_mask.
+
+    Args:
+        data (bytes): The packed mask.
+
+    Returns:
+        np.ndarray: The (height, width) boolean mask.
+    """
+    height, width = struct.unpack_from("<II", data)
+    bits = np.frombuffer(zlib.decompress(data[struct.calcsize("<II") :]), np.uint8)
+    return np.unpackbits(bits, count=height * width).reshape(height, width) > 0
+
+
 def get_functions(name: str) -> dict:
     """Get a dictionary of function names to functions for all non-private functions.
 
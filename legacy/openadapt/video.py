@@ -1,7 +1,22 @@
-"""Module for recording and manipulating video recordings."""
+"""Module for recording and manipulating video recordings.
 
+Usage:
+
+    # re-encode the latest recording's video with the archival encode profile
+    $ python -m openadapt.video transcode
+
+    # compare every 10th frame of the latest recording's video to its stored
+    # screenshots
+    $ python -m openadapt.video verify --every=10
+"""
+
+from concurrent.futures import ThreadPoolExecutor
 from fractions import Fraction
 from pprint import pformat
+from typing import Any
+import bisect
+import io
+import json
 import os
 import subprocess
 import tempfile
@@ -9,10 +24,33 @@ import threading
 
 from PIL import Image
 import av
+import numpy as np
+
+from openadapt.build_utils import redirect_stdout_stderr
+from openadapt.custom_logger import logger
+
+with redirect_stdout_stderr():
+    import fire
 
 from openadapt import utils
 from openadapt.config import config
-from openadapt.custom_logger import logger
+
+# Seek rather than decode forward to frames further ahead than this many seconds
+SEEK_THRESHOLD_SECONDS = 2
+FRAME_INDEX_VERSION = 1
+VIDEO_MANIFEST_VERSION = 1
+# libx264 options by encode profile
+ENCODE_PROFILES = {
+    # lossless, fast enough to keep up with capture at the cost of larger files
+    "lossless_fast": {"qp": "0", "preset": "ultrafast"},
+    # not lossless, but differences are not visible
+    "visually_lossless": {"crf": "17", "preset": "fast"},
+    # lossless and smallest, but too slow to capture large screens in real time;
+    # see transcode_video
+    "archival": {"crf": "0", "preset": "veryslow"},
+}
+# number of consecutive frames compared by each verification task
+VERIFY_CHUNK_SIZE = 64
 
 
 def get_video_file_path(recording_timestamp: float) -> str:
@@ -30,6 +68,71 @@ def get_video_file_path(recording_timestamp: float) -> str:
     )
 
 
+def get_frame_index_file_path(video_file_path: str) -> str:
+    """Get the path of the frame index sidecar file of a video file.
+
+    Args:
+        video_file_path (str): The path to the video file.
+
+    Returns:
+        str: The path to the frame index file.
+    """
+    return f"{os.path.splitext(video_file_path)[0]}.index.json"
+
+
+def get_manifest_file_path(video_file_path: str) -> str:
+    """Get the path of the manifest file of a video recorded in segments.
+
+    Args:
+        video_file_path (str): The path to the video file.
+
+    Returns:
+        str: The path to the manifest file.
+    """
+    return f"{os.path.splitext(video_file_path)[0]}.manifest.json"
+
+
+def get_segment_file_path(video_file_path: str, segment_number: int) -> str:
+    """Get the path of a segment file of a video recorded in segments.
+
+    Args:
+        video_file_path (str): The path to the video file.
+        segment_number (int): The number of the segment, starting at 0.
+
+    Returns:
+        str: The path to the segment file.
+    """
+    base, ext = os.path.splitext(video_file_path)
+    return f"{base}.{segment_number:05d}{ext}"
+
+
+def get_video_file_paths(video_file_path: str) -> list[str]:
+    """Get the paths of the existing files which make up a video.
+
+    Args:
+        video_file_path (str): The path to the video file.
+
+    Returns:
+        list[str]: The paths to the video file or, if the video was recorded in
+            segments, its manifest and segment files, followed by their frame index
+            files.
+    """
+    manifest = VideoManifest.load(video_file_path)
+    if manifest is None:
+        file_paths = [video_file_path]
+    else:
+        file_paths = [
+            get_manifest_file_path(video_file_path),
+            *manifest.get_segment_file_paths(video_file_path),
+        ]
+    file_paths += [
+        get_frame_index_file_path(file_path)
+        for file_path in file_paths
+        if file_path.endswith(".mp4")
+    ]
+    return [file_path for file_path in file_paths if os.path.exists(file_path)]
+
+
 def delete_video_file(recording_timestamp: float) -> None:
     """Deletes the video file corresponding to the given recording timestamp.
 
@@ -37,11 +140,37 @@ def delete_video_file(recording_timestamp: float) -> None:
         recording_timestamp (float): The timestamp of the recording to delete.
     """
     video_file_path = get_video_file_path(recording_timestamp)
-    if os.path.exists(video_file_path):
-        os.remove(video_file_path)
-        logger.info(f"Deleted video file: {video_file_path}")
-    else:
+    file_paths = get_video_file_paths(video_file_path)
+    if not file_paths:
         logger.error(f"Video file not found: {video_file_path}")
+    for file_path in file_paths:
+        os.remove(file_path)
+        logger.info(f"Deleted video file: {file_path}")
+
+
+def get_encode_options(
+    profile: str,
+    crf: int | None = None,
+    preset: str | None = None,
+) -> dict[str, str]:
+    """Get the encoder options of an encode profile.
+
+    Args:
+        profile (str): The name of the encode profile (see ENCODE_PROFILES).
+        crf (int, optional): Constant Rate Factor overriding the profile's quality.
+        preset (str, optional): Preset overriding the profile's.
+
+    Returns:
+        dict[str, str]: The encoder options.
+    """
+    assert profile in ENCODE_PROFILES, f"{profile=} not in {list(ENCODE_PROFILES)}"
+    options = dict(ENCODE_PROFILES[profile])
+    if crf is not None:
+        options.pop("qp", None)
+        options["crf"] = str(crf)
+    if preset is not None:
+        options["preset"] = preset
+    return options
 
 
 def initialize_video_writer(
@@ -51,11 +180,17 @@ def initialize_video_writer(
     fps: int = 24,
     codec: str = config.VIDEO_ENCODING,
     pix_fmt: str = config.VIDEO_PIXEL_FORMAT,
-    crf: int = 0,
-    preset: str = "veryslow",
+    crf: int | None = None,
+    preset: str | None = None,
+    profile: str = config.VIDEO_ENCODE_PROFILE,
+    threads: int = config.VIDEO_ENCODE_THREADS,
+    gop_size: int | None = None,
 ) -> tuple[av.container.OutputContainer, av.stream.Stream, float]:
     """Initializes video writer and returns the container, stream, and base timestamp.
 
+    Encoder options are taken from the encode profile (see ENCODE_PROFILES), and
+    can be overridden with crf and preset.
+
     Args:
         output_path (str): Path to the output video file.
         width (int): Width of the video.
@@ -64,22 +199,31 @@ def initialize_video_writer(
         codec (str, optional): Codec used for encoding the video.
             Defaults to 'libx264'.
         pix_fmt (str, optional): Pixel format of the video. Defaults to 'yuv420p'.
-        crf (int, optional): Constant Rate Factor for encoding quality.
-            Defaults to 0 for lossless.
-        preset (str, optional): Encoding speed/quality trade-off.
-            Defaults to 'veryslow' for maximum compression.
+        crf (int, optional): Constant Rate Factor for encoding quality, overriding
+            the profile's.
+        preset (str, optional): Encoding speed/quality trade-off, overriding the
+            profile's.
+        profile (str, optional): The name of the encode profile. Defaults to
+            config.VIDEO_ENCODE_PROFILE.
+        threads (int, optional): The number of encoder threads, or 0 to choose
+            automatically. Defaults to config.VIDEO_ENCODE_THREADS.
+        gop_size (int, optional): The maximum number of frames between key frames.
+            Defaults to the encoder's default.
 
     Returns:
         tuple[av.container.OutputContainer, av.stream.Stream, float]: The initialized
             container, stream, and base timestamp.
     """
-    logger.info("initializing video stream...")
+    logger.info(f"initializing video stream... {profile=} {threads=}")
     video_container = av.open(output_path, mode="w")
     video_stream = video_container.add_stream(codec, rate=fps)
     video_stream.width = width
     video_stream.height = height
     video_stream.pix_fmt = pix_fmt
-    video_stream.options = {"crf": str(crf), "preset": preset}
+    video_stream.options = get_encode_options(profile, crf, preset)
+    video_stream.codec_context.thread_count = threads
+    if gop_size:
+        video_stream.codec_context.gop_size = gop_size
 
     base_timestamp = utils.get_timestamp()
 
@@ -89,16 +233,19 @@ def initialize_video_writer(
 def write_video_frame(
     video_container: av.container.OutputContainer,
     video_stream: av.stream.Stream,
-    screenshot: Image.Image,
+    screenshot: Image.Image | np.ndarray,
     timestamp: float,
     video_start_timestamp: float,
     last_pts: int,
     force_key_frame: bool = False,
+    frame_timestamps: list[float] | None = None,
 ) -> int:
     """Encodes and writes a video frame to the output container from a given screenshot.
 
-    This function converts a PIL.Image to an AVFrame,
-    and encodes it for writing to the video stream. It calculates the
+    This function converts a PIL.Image or a BGRA array (as returned by
+    utils.take_screenshot_bgra) to an AVFrame, and encodes it for writing to the
+    video stream. BGRA arrays are converted to the stream's pixel format once, by
+    the encoder, without an intermediate RGB image. It calculates the
     presentation timestamp (PTS) for each frame based on the elapsed time since
     the base timestamp, ensuring monotonically increasing PTS values.
 
@@ -106,12 +253,16 @@ def write_video_frame(
         video_container (av.container.OutputContainer): The output container to which
             the frame is written.
         video_stream (av.stream.Stream): The video stream within the container.
-        screenshot (Image.Image): The screenshot to be written as a video frame.
+        screenshot (Image.Image | np.ndarray): The screenshot to be written as a
+            video frame, as an image or a (height, width, 4) BGRA array.
         timestamp (float): The timestamp of the current frame.
         video_start_timestamp (float): The base timestamp from which the video
             recording started.
         last_pts (int): The PTS of the last written frame.
         force_key_frame (bool): Whether to force this frame to be a key frame.
+        frame_timestamps (list[float], optional): If provided, the timestamp is
+            appended to it, for use in the frame index written by
+            finalize_video_writer.
 
     Returns:
         int: The updated last_pts value, to be used for writing the next frame.
@@ -122,13 +273,16 @@ def write_video_frame(
         - The function logs the current timestamp, base timestamp, and
               calculated PTS values for debugging purposes.
     """
-    # Convert the PIL Image to an AVFrame
-    av_frame = av.VideoFrame.from_image(screenshot)
+    # Convert the PIL Image or BGRA array to an AVFrame
+    if isinstance(screenshot, np.ndarray):
+        av_frame = av.VideoFrame.from_ndarray(screenshot, format="bgra")
+    else:
+        av_frame = av.VideoFrame.from_image(screenshot)
 
     # Optionally force a key frame
     # TODO: force key frames on active window change?
     if force_key_frame:
-        av_frame.pict_type = "I"
+        av_frame.pict_type = av.video.frame.PictureType.I
 
     # Calculate the time difference in seconds
     time_diff = timestamp - video_start_timestamp
@@ -146,6 +300,8 @@ def write_video_frame(
         logger.debug(f"incremented {pts=}")
     av_frame.pts = pts
     last_pts = pts  # Update the last_pts
+    if frame_timestamps is not None:
+        frame_timestamps.append(timestamp)
 
     # Encode and write the frame
     for packet in video_stream.encode(av_frame):
@@ -159,20 +315,25 @@ def finalize_video_writer(
     video_container: av.container.OutputContainer,
     video_stream: av.stream.Stream,
     video_start_timestamp: float,
-    last_frame: Image.Image,
+    last_frame: Image.Image | np.ndarray,
     last_frame_timestamp: float,
     last_pts: int,
     video_file_path: str,
     fix_moov: bool = False,
+    frame_timestamps: list[float] | None = None,
 ) -> None:
     """Finalizes the video writer, ensuring all buffered frames are encoded and written.
 
+    Once the video file is closed, its frame index is written to a sidecar file (see
+    FrameIndex).
+
     Args:
         video_container (av.container.OutputContainer): The AV container to finalize.
         video_stream (av.stream.Stream): The AV stream to finalize.
         video_start_timestamp (float): The base timestamp from which the video
             recording started.
-        last_frame (Image.Image): The last frame that was written (to be written again).
+        last_frame (Image.Image | np.ndarray): The last frame that was written (to be
+            written again).
         last_frame_timestamp (float): The timestamp of the last frame that was written.
         last_pts (int): The last presentation timestamp.
         video_file_path (str): The path to the video file.
@@ -180,6 +341,9 @@ def finalize_video_writer(
             Setting this to True will fix a bug when displaying the video in Github
             comments causing the video to appear to start a few seconds after 0:00.
             However, this causes extract_frames to fail.
+        frame_timestamps (list[float], optional): The timestamps of the written
+            frames, as collected by write_video_frame. If provided, they are stored in
+            the frame index so that frames can be looked up by screenshot timestamp.
     """
     # Closing the container in the main thread leads to a GIL deadlock.
     # https://github.com/PyAV-Org/PyAV/issues/1053
@@ -193,6 +357,7 @@ def finalize_video_writer(
         video_start_timestamp,
         last_pts,
         force_key_frame=True,
+        frame_timestamps=frame_timestamps,
     )
 
     # Closing in the same thread sometimes hangs, so do it in a different thread:
@@ -222,6 +387,13 @@ def finalize_video_writer(
         logger.warning(f"{fix_moov=} will cause extract_frames() to fail!!!")
         move_moov_atom(video_file_path)
 
+    # Index the final file, since moving the moov atom changes byte offsets
+    logger.info("writing frame index...")
+    frame_index = FrameIndex.build(
+        video_file_path, frame_timestamps, video_start_timestamp
+    )
+    frame_index.save(video_file_path)
+
     logger.info("done")
 
 
@@ -263,77 +435,1101 @@ def move_moov_atom(input_file: str, output_file: str = None) -> None:
         os.replace(temp_file, input_file)
 
 
+class FrameIndex:
+    """Index of the frames of a video file, stored in a sidecar file next to it.
+
+    For each frame in presentation order (i.e. by frame number), the index stores its
+    PTS, the byte offset of its packet, whether it is a key frame, and the timestamp
+    of the screenshot it was written from. Frames can then be looked up by timestamp
+    in O(log n), and decoded after seeking directly to the preceding key frame.
+    """
+
+    def __init__(
+        self,
+        time_base: Fraction,
+        pts: list[int],
+        pos: list[int],
+        is_keyframe: list[bool],
+        screenshot_timestamps: list[float] | None = None,
+        video_start_timestamp: float | None = None,
+    ) -> None:
+        """Initialize the frame index.
+
+        Args:
+            time_base (Fraction): The time base of the PTS values.
+            pts (list[int]): The PTS of each frame.
+            pos (list[int]): The byte offset of each frame's packet in the file.
+            is_keyframe (list[bool]): Whether each frame is a key frame.
+            screenshot_timestamps (list[float], optional): The timestamp of the
+                screenshot each frame was written from.
+            video_start_timestamp (float, optional): The base timestamp from which
+                the video recording started.
+        """
+        assert len(pts) == len(pos) == len(is_keyframe), (
+            len(pts),
+            len(pos),
+            len(is_keyframe),
+        )
+        self.time_base = Fraction(time_base)
+        self.pts = pts
+        self.pos = pos
+        self.is_keyframe = is_keyframe
+        self.screenshot_timestamps = screenshot_timestamps
+        self.video_start_timestamp = video_start_timestamp
+        # timestamps relative to the start of the video, as used by extract_frames
+        if screenshot_timestamps is not None and video_start_timestamp is not None:
+            self.timestamps = [
+                timestamp - video_start_timestamp for timestamp in screenshot_timestamps
+            ]
+        else:
+            self.timestamps = [frame_pts * float(time_base) for frame_pts in pts]
+        self.keyframe_numbers = [
+            frame_number
+            for frame_number, keyframe in enumerate(is_keyframe)
+            if keyframe
+        ]
+
+    def __len__(self) -> int:
+        """Return the number of frames."""
+        return len(self.pts)
+
+    @classmethod
+    def build(
+        cls: type["FrameIndex"],
+        video_file_path: str,
+        screenshot_timestamps: list[float] | None = None,
+        video_start_timestamp: float | None = None,
+    ) -> "FrameIndex":
+        """Build the frame index of a video file by demuxing it without decoding.
+
+        Args:
+            video_file_path (str): The path to the video file.
+            screenshot_timestamps (list[float], optional): The timestamp of the
+                screenshot each frame was written from, in the order written.
+            video_start_timestamp (float, optional): The base timestamp from which
+                the video recording started.
+
+        Returns:
+            FrameIndex: The frame index.
+        """
+        video_container = av.open(video_file_path)
+        video_stream = video_container.streams.video[0]
+        packets = sorted(
+            (packet.pts, packet.pos, packet.is_keyframe)
+            for packet in video_container.demux(video_stream)
+            # skip the empty packet which flushes the demuxer
+            if packet.pts is not None
+        )
+        time_base = video_stream.time_base
+        video_container.close()
+
+        if screenshot_timestamps is not None and len(screenshot_timestamps) != len(
+            packets
+        ):
+            logger.warning(
+                f"{len(screenshot_timestamps)=} != {len(packets)=}, not indexing"
+                " screenshot timestamps"
+            )
+            screenshot_timestamps = None
+        pts = [frame_pts for frame_pts, _, _ in packets]
+        pos = [frame_pos for _, frame_pos, _ in packets]
+        is_keyframe = [keyframe for _, _, keyframe in packets]
+        return cls(
+            time_base,
+            pts,
+            pos,
+            is_keyframe,
+            screenshot_timestamps,
+            video_start_timestamp,
+        )
+
+    @classmethod
+    def load(cls: type["FrameIndex"], video_file_path: str) -> "FrameIndex | None":
+        """Load the frame index of a video file from its sidecar file.
+
+        Args:
+            video_file_path (str): The path to the video file.
+
+        Returns:
+            FrameIndex | None: The frame index, or None if the video file has no
+                sidecar file, e.g. because it was recorded before indexing was added.
+        """
+        frame_index_file_path = get_frame_index_file_path(video_file_path)
+        if not os.path.exists(frame_index_file_path):
+            return None
+        with open(frame_index_file_path) as f:
+            data = json.load(f)
+        assert data["version"] == FRAME_INDEX_VERSION, data["version"]
+        return cls(
+            Fraction(*data["time_base"]),
+            data["pts"],
+            data["pos"],
+            data["is_keyframe"],
+            data["screenshot_timestamps"],
+            data["video_start_timestamp"],
+        )
+
+    def save(self, video_file_path: str) -> None:
+        """Save the frame index to the sidecar file of a video file.
+
+        Args:
+            video_file_path (str): The path to the video file.
+        """
+        frame_index_file_path = get_frame_index_file_path(video_file_path)
+        with open(frame_index_file_path, "w") as f:
+            json.dump(
+                {
+                    "version": FRAME_INDEX_VERSION,
+                    "time_base": [
+                        self.time_base.numerator,
+                        self.time_base.denominator,
+                    ],
+                    "video_start_timestamp": self.video_start_timestamp,
+                    "pts": self.pts,
+                    "pos": self.pos,
+                    "is_keyframe": self.is_keyframe,
+                    "screenshot_timestamps": self.screenshot_timestamps,
+                },
+                f,
+            )
+        logger.info(f"{frame_index_file_path=} num_frames={len(self)}")
+
+    def find(self, timestamp: float) -> int:
+        """Find the frame closest to a timestamp.
+
+        Args:
+            timestamp (float): The timestamp in seconds, relative to the start of the
+                video.
+
+        Returns:
+            int: The frame number.
+        """
+        assert self.timestamps, "Empty frame index"
+        idx = bisect.bisect_left(self.timestamps, timestamp)
+        if idx == len(self.timestamps):
+            return idx - 1
+        if idx > 0 and (
+            timestamp - self.timestamps[idx - 1] <= self.timestamps[idx] - timestamp
+        ):
+            return idx - 1
+        return idx
+
+    def get_keyframe_number(self, frame_number: int) -> int:
+        """Get the key frame at or preceding a frame.
+
+        Args:
+            frame_number (int): The frame number.
+
+        Returns:
+            int: The frame number of the key frame.
+        """
+        idx = bisect.bisect_right(self.keyframe_numbers, frame_number) - 1
+        assert idx >= 0, f"No key frame precedes {frame_number=}"
+        return self.keyframe_numbers[idx]
+
+    def extract_frames(
+        self,
+        video_file_path: str,
+        timestamps: list[float],
+        tolerance: float = 0.1,
+        allow_missing: bool = False,
+    ) -> list[Image.Image | None]:
+        """Extract the frames closest to the given timestamps, using the index.
+
+        Each requested frame is decoded after seeking to its preceding key frame,
+        unless it can be reached by decoding forward from the last decoded frame
+        without passing another key frame.
+
+        Args:
+            video_file_path (str): The path to the video file.
+            timestamps (list[float]): The timestamps in seconds, relative to the
+                start of the video.
+            tolerance (float): The maximum difference in seconds between a timestamp
+                and the timestamp of its frame.
+            allow_missing (bool): Whether to return None for timestamps without a
+                frame within the tolerance, instead of raising.
+
+        Returns:
+            list[Image.Image | None]: The frames, in the order of timestamps.
+
+        Raises:
+            Exception: If no frame is within the tolerance for any of the timestamps,
+                unless allow_missing is True.
+        """
+        frame_numbers = [self.find(timestamp) for timestamp in timestamps]
+        missing_frame_timestamps = [
+            timestamp
+            for timestamp, frame_number in zip(timestamps, frame_numbers)
+            if abs(self.timestamps[frame_number] - timestamp) > tolerance
+        ]
+        if missing_frame_timestamps:
+            if not allow_missing:
+                raise Exception(
+                    "No frame within tolerance for timestamps"
+                    f" {missing_frame_timestamps}."
+                )
+            frame_numbers = [
+                (
+                    None
+                    if abs(self.timestamps[frame_number] - timestamp) > tolerance
+                    else frame_number
+                )
+                for timestamp, frame_number in zip(timestamps, frame_numbers)
+            ]
+
+        video_container = av.open(video_file_path)
+        video_stream = video_container.streams.video[0]
+        frames = None
+        image_by_frame_number = {}
+        # the number of the frame which the decoder will return next
+        next_frame_number = None
+        num_seeks = 0
+        num_decoded = 0
+        for frame_number in sorted(set(frame_numbers) - {None}):
+            keyframe_number = self.get_keyframe_number(frame_number)
+            if next_frame_number is None or not (
+                keyframe_number <= next_frame_number <= frame_number
+            ):
+                video_container.seek(
+                    self.pts[keyframe_number],
+                    backward=True,
+                    any_frame=False,
+                    stream=video_stream,
+                )
+                frames = video_container.decode(video_stream)
+                num_seeks += 1
+            for frame in frames:
+                num_decoded += 1
+                if frame.pts >= self.pts[frame_number]:
+                    break
+            assert frame.pts == self.pts[frame_number], (frame.pts, frame_number)
+            image_by_frame_number[frame_number] = frame.to_image()
+            next_frame_number = frame_number + 1
+        video_container.close()
+        logger.debug(f"{len(timestamps)=} {num_decoded=} {num_seeks=}")
+
+        return [
+            image_by_frame_number.get(frame_number) for frame_number in frame_numbers
+        ]
+
+
+class VideoManifest:
+    """Manifest of the segment files of a video, stored in a file next to them.
+
+    Long recordings are written as a sequence of segment files (see
+    SegmentedVideoWriter). For each finalized segment, the manifest stores its file
+    name, the timestamps of its first and last frames, and its number of frames.
+    Segments are added to the manifest as they are finalized, so frames can be
+    extracted from them while recording continues.
+    """
+
+    def __init__(
+        self,
+        video_start_timestamp: float,
+        segments: list[dict] | None = None,
+        complete: bool = False,
+    ) -> None:
+        """Initialize the manifest.
+
+        Args:
+            video_start_timestamp (float): The base timestamp from which the video
+                recording started.
+            segments (list[dict], optional): The file_name, start_timestamp,
+                end_timestamp and num_frames of each segment, in order.
+            complete (bool): Whether the recording has finished.
+        """
+        self.video_start_timestamp = video_start_timestamp
+        self.segments = segments or []
+        self.complete = complete
+
+    def __len__(self) -> int:
+        """Return the number of segments."""
+        return len(self.segments)
+
+    @classmethod
+    def load(
+        cls: type["VideoManifest"], video_file_path: str
+    ) -> "VideoManifest | None":
+        """Load the manifest of a video.
+
+        Args:
+            video_file_path (str): The path to the video file.
+
+        Returns:
+            VideoManifest | None: The manifest, or None if the video was not recorded
+                in segments.
+        """
+        manifest_file_path = get_manifest_file_path(video_file_path)
+        if not os.path.exists(manifest_file_path):
+            return None
+        with open(manifest_file_path) as f:
+            data = json.load(f)
+        assert data["version"] == VIDEO_MANIFEST_VERSION, data["version"]
+        return cls(
+            data["video_start_timestamp"],
+            data["segments"],
+            data["complete"],
+        )
+
+    def save(self, video_file_path: str) -> None:
+        """Save the manifest of a video.
+
+        The manifest is replaced atomically, so that a crash while saving does not
+        lose the segments already listed.
+
+        Args:
+            video_file_path (str): The path to the video file.
+        """
+        manifest_file_path = get_manifest_file_path(video_file_path)
+        temp_file_path = f"{manifest_file_path}.tmp"
+        with open(temp_file_path, "w") as f:
+            json.dump(
+                {
+                    "version": VIDEO_MANIFEST_VERSION,
+                    "video_start_timestamp": self.video_start_timestamp,
+                    "complete": self.complete,
+                    "segments": self.segments,
+                },
+                f,
+            )
+        os.replace(temp_file_path, manifest_file_path)
+        logger.info(f"{manifest_file_path=} num_segments={len(self)}")
+
+    def add_segment(
+        self,
+        segment_file_path: str,
+        start_timestamp: float,
+        end_timestamp: float,
+        num_frames: int,
+    ) -> None:
+        """Add a finalized segment to the manifest.
+
+        Args:
+            segment_file_path (str): The path to the segment file.
+            start_timestamp (float): The base timestamp of the segment, from which
+                the PTS of its frames are calculated.
+            end_timestamp (float): The timestamp of the last frame of the segment.
+            num_frames (int): The number of frames in the segment.
+        """
+        assert (
+            not self.segments or start_timestamp > self.segments[-1]["start_timestamp"]
+        )
+        self.segments.append(
+            {
+                "file_name": os.path.basename(segment_file_path),
+                "start_timestamp": start_timestamp,
+                "end_timestamp": end_timestamp,
+                "num_frames": num_frames,
+            }
+        )
+
+    def get_segment_file_paths(self, video_file_path: str) -> list[str]:
+        """Get the paths of the segment files.
+
+        Args:
+            video_file_path (str): The path to the video file.
+
+        Returns:
+            list[str]: The path to each segment file.
+        """
+        dir_path = os.path.dirname(video_file_path)
+        return [
+            os.path.join(dir_path, segment["file_name"]) for segment in self.segments
+        ]
+
+    def find(self, timestamp: float) -> int:
+        """Find the segment containing the frame closest to a timestamp.
+
+        Args:
+            timestamp (float): The timestamp in seconds, relative to the start of the
+                video.
+
+        Returns:
+            int: The segment number.
+        """
+        assert self.segments, "Empty manifest"
+        timestamp += self.video_start_timestamp
+        start_timestamps = [segment["start_timestamp"] for segment in self.segments]
+        idx = max(bisect.bisect_right(start_timestamps, timestamp) - 1, 0)
+        # between the last frame of a segment and the first frame of the next
+        if (
+            idx + 1 < len(self.segments)
+            and timestamp > self.segments[idx]["end_timestamp"]
+            and start_timestamps[idx + 1] - timestamp
+            < timestamp - self.segments[idx]["end_timestamp"]
+        ):
+            idx += 1
+        return idx
+
+    def extract_frames(
+        self,
+        video_file_path: str,
+        timestamps: list[float],
+        tolerance: float = 0.1,
+        seek_threshold: float = SEEK_THRESHOLD_SECONDS,
+        allow_missing: bool = False,
+    ) -> list[Image.Image | None]:
+        """Extract the frames closest to the given timestamps from the segment files.
+
+        Args:
+            video_file_path (str): The path to the video file.
+            timestamps (list[float]): The timestamps in seconds, relative to the
+                start of the video.
+            tolerance (float): The maximum difference in seconds between a timestamp
+                and the timestamp of its frame.
+            seek_threshold (float): Passed to extract_frames for segment files
+                without a frame index.
+            allow_missing (bool): Whether to return None for timestamps without a
+                frame within the tolerance, instead of raising.
+
+        Returns:
+            list[Image.Image | None]: The frames, in the order of timestamps.
+
+        Raises:
+            Exception: If no frame is within the tolerance for any of the timestamps,
+                e.g. because they are in a segment which has not been finalized yet,
+                unless allow_missing is True.
+        """
+        segment_file_paths = self.get_segment_file_paths(video_file_path)
+        # segment number -> indices into timestamps
+        idxs_by_segment_number = {}
+        for idx, timestamp in enumerate(timestamps):
+            segment_number = self.find(timestamp)
+            idxs_by_segment_number.setdefault(segment_number, []).append(idx)
+
+        frames = [None] * len(timestamps)
+        for segment_number, idxs in idxs_by_segment_number.items():
+            # convert to timestamps relative to the start of the segment
+            offset = (
+                self.video_start_timestamp
+                - self.segments[segment_number]["start_timestamp"]
+            )
+            segment_frames = extract_frames(
+                segment_file_paths[segment_number],
+                [timestamps[idx] + offset for idx in idxs],
+                tolerance,
+                seek_threshold,
+                allow_missing=allow_missing,
+            )
+            for idx, frame in zip(idxs, segment_frames):
+                frames[idx] = frame
+        return frames
+
+
+class SegmentedVideoWriter:
+    """Writes a video as a sequence of rolling segment files.
+
+    A segment is finalized, and a new one started, at the first frame written
+    segment_duration seconds or more after the start of the current segment. Each
+    segment is a standalone video file with its own frame index, listed in the
+    video's manifest (see VideoManifest) once finalized. A crash therefore loses at
+    most the current segment, and seeking and exporting only involve the segments
+    needed.
+
+    If segment_duration is 0, the video is written to a single file without a
+    manifest.
+    """
+
+    def __init__(
+        self,
+        video_file_path: str,
+        width: int,
+        height: int,
+        segment_duration: float = config.VIDEO_SEGMENT_DURATION_SECONDS,
+        video_start_timestamp: float | None = None,
+        **kwargs: Any,
+    ) -> None:
+        """Initialize the writer and its first segment.
+
+        Args:
+            video_file_path (str): The path to the video file.
+            width (int): Width of the video.
+            height (int): Height of the video.
+            segment_duration (float): The minimum duration of each segment in
+                seconds, or 0 to write a single file. Defaults to
+                config.VIDEO_SEGMENT_DURATION_SECONDS.
+            video_start_timestamp (float, optional): The base timestamp from which
+                the video recording started. Defaults to the current timestamp.
+            **kwargs: Keyword arguments passed to initialize_video_writer.
+        """
+        self.video_file_path = video_file_path
+        self.width = width
+        self.height = height
+        self.segment_duration = segment_duration
+        self.kwargs = kwargs
+        self.num_frames = 0
+        self.manifest = None
+        self._start_segment(video_start_timestamp)
+        self.video_start_timestamp = self.segment_start_timestamp
+        if segment_duration:
+            self.manifest = VideoManifest(self.video_start_timestamp)
+            self.manifest.save(video_file_path)
+
+    def _start_segment(self, start_timestamp: float | None) -> None:
+        """Initialize the video writer of the next segment.
+
+        Args:
+            start_timestamp (float, optional): The base timestamp of the segment.
+                Defaults to the current timestamp.
+        """
+        if self.segment_duration:
+            segment_number = len(self.manifest) if self.manifest else 0
+            self.segment_file_path = get_segment_file_path(
+                self.video_file_path, segment_number
+            )
+        else:
+            self.segment_file_path = self.video_file_path
+        self.video_container, self.video_stream, base_timestamp = (
+            initialize_video_writer(
+                self.segment_file_path, self.width, self.height, **self.kwargs
+            )
+        )
+        self.segment_start_timestamp = (
+            base_timestamp if start_timestamp is None else start_timestamp
+        )
+        self.last_pts = -1
+        self.last_frame = None
+        self.last_frame_timestamp = None
+        self.frame_timestamps = []
+
+    def _finalize_segment(self) -> None:
+        """Finalize the current segment and add it to the manifest."""
+        finalize_video_writer(
+            self.video_container,
+            self.video_stream,
+            self.segment_start_timestamp,
+            self.last_frame,
+            self.last_frame_timestamp,
+            self.last_pts,
+            self.segment_file_path,
+            frame_timestamps=self.frame_timestamps,
+        )
+        if self.manifest is not None:
+            self.manifest.add_segment(
+                self.segment_file_path,
+                self.segment_start_timestamp,
+                self.last_frame_timestamp,
+                len(self.frame_timestamps),
+            )
+            self.manifest.save(self.video_file_path)
+
+    def write_frame(
+        self,
+        screenshot: Image.Image | np.ndarray,
+        timestamp: float,
+        force_key_frame: bool = False,
+    ) -> None:
+        """Write a frame, first starting a new segment if the current one is full.
+
+        Args:
+            screenshot (Image.Image | np.ndarray): The screenshot to be written as a
+                video frame (see write_video_frame).
+            timestamp (float): The timestamp of the screenshot.
+            force_key_frame (bool): Whether to force this frame to be a key frame.
+        """
+        if (
+            self.segment_duration
+            and self.frame_timestamps
+            and timestamp - self.segment_start_timestamp >= self.segment_duration
+        ):
+            self._finalize_segment()
+            self._start_segment(timestamp)
+        self.last_pts = write_video_frame(
+            self.video_container,
+            self.video_stream,
+            screenshot,
+            timestamp,
+            self.segment_start_timestamp,
+            self.last_pts,
+            force_key_frame,
+            self.frame_timestamps,
+        )
+        self.last_frame = screenshot
+        self.last_frame_timestamp = timestamp
+        self.num_frames += 1
+
+    def finalize(self) -> None:
+        """Finalize the current segment, and mark the manifest complete."""
+        if self.last_frame is None:
+            logger.warning(f"no frames written to {self.segment_file_path=}")
+            self.video_container.close()
+            os.remove(self.segment_file_path)
+        else:
+            self._finalize_segment()
+        if self.manifest is not None:
+            self.manifest.complete = True
+            self.manifest.save(self.video_file_path)
+
+
 def extract_frames(
     video_filename: str,
-    timestamps: list[str],
+    timestamps: list[float],
     tolerance: float = 0.1,
-) -> list[Image.Image]:
+    seek_threshold: float = SEEK_THRESHOLD_SECONDS,
+    frame_index: FrameIndex | None = None,
+    stats: dict[str, int] | None = None,
+    allow_missing: bool = False,
+) -> list[Image.Image | None]:
     """Extracts frames from a video file at specified timestamps within a tolerance.
 
+    The requested timestamps are sorted, and the video is decoded forward from the
+    start. The container seeks to the key frame preceding the next requested
+    timestamp instead of decoding the frames in between only if that key frame is
+    ahead of the last decoded frame, since seeking would otherwise decode frames
+    again. Without an index, this is the case if the timestamp is at least the
+    longest interval between key frames decoded so far past the last key frame, and
+    more than seek_threshold seconds ahead of the last decoded frame. Each decoded
+    frame is matched against the requested timestamps by binary search, and only the
+    matched frames are converted to images.
+
+    If the video has a frame index, frames are instead looked up in the index and
+    decoded after seeking directly to their preceding key frames. If the video was
+    recorded in segments, frames are extracted from the segment files listed in its
+    manifest (see VideoManifest).
+
     Args:
         video_filename (str): The path to the video file.
         timestamps (list): A list of timestamps (in seconds) at which to extract frames.
         tolerance (float, optional): The maximum difference in seconds between
             the timestamp and the actual frame timestamp. Defaults to 0.1.
+        seek_threshold (float, optional): The minimum gap in seconds between the last
+            decoded frame and the next requested timestamp for which to seek rather
+            than decode forward. Not used if the video has a frame index.
+        frame_index (FrameIndex, optional): The frame index of the video. Defaults
+            to the index loaded from the video's sidecar file, if any.
+        stats (dict, optional): If provided, updated with the number of seeks and
+            decoded frames of a video without an index.
+        allow_missing (bool, optional): Whether to return None for timestamps without
+            a frame within the tolerance, instead of raising. Defaults to False.
 
     Returns:
-        list: A list of extracted frames as PIL Image objects.
+        list: A list of extracted frames as PIL Image objects, in the order of
+            timestamps. Each is the frame closest to the corresponding timestamp.
 
     Raises:
-        Exception: If a frame is found to be the closest for more than one timestamp.
         Exception: If no frame is found within the tolerance for any of the timestamps.
     """
+    if frame_index is None:
+        manifest = VideoManifest.load(video_filename)
+        if manifest is not None:
+            return manifest.extract_frames(
+                video_filename, timestamps, tolerance, seek_threshold, allow_missing
+            )
+        frame_index = FrameIndex.load(video_filename)
+    if frame_index is not None:
+        return frame_index.extract_frames(
+            video_filename, timestamps, tolerance, allow_missing
+        )
+
+    sorted_timestamps = sorted(set(timestamps))
+    # timestamp -> (difference, frame) of the closest frame found so far
+    frame_by_timestamp = {}
+
     # Open the video file
     video_container = av.open(video_filename)
     video_stream = video_container.streams.video[0]  # Assuming the first video stream
 
-    # To store matched frames
-    frame_by_timestamp = {t: None for t in timestamps}
-    # To store closest frame differences
-    frame_differences = {t: float("inf") for t in timestamps}
-
-    # Prepare to convert PTS to seconds
+    # Prepare to convert between PTS and seconds
     time_base = float(video_stream.time_base)
 
-    for frame in video_container.decode(video_stream):
-        frame_timestamp = frame.pts * time_base  # Convert to float
-        # Find the closest timestamp within tolerance
-        for timestamp in timestamps:
+    frames = video_container.decode(video_stream)
+    frame_timestamp = 0
+    seek_timestamp = float("-inf")
+    # the last key frame decoded, and the longest interval between consecutive key
+    # frames decoded without seeking in between, to estimate the next key frame
+    keyframe_timestamp = None
+    max_keyframe_interval = None
+    num_seeks = 0
+    num_decoded = 0
+    # index of the first timestamp which may still match a later frame
+    idx = 0
+    while idx < len(sorted_timestamps):
+        start_timestamp = sorted_timestamps[idx] - tolerance
+        # don't seek again until the target of the last seek has been reached, in
+        # case the preceding key frame is further back than estimated
+        if (
+            max_keyframe_interval is not None
+            and keyframe_timestamp is not None
+            and start_timestamp - frame_timestamp > seek_threshold
+            and start_timestamp >= keyframe_timestamp + max_keyframe_interval
+            and frame_timestamp >= seek_timestamp
+        ):
+            video_container.seek(
+                int(start_timestamp / time_base),
+                backward=True,
+                any_frame=False,
+                stream=video_stream,
+            )
+            frames = video_container.decode(video_stream)
+            seek_timestamp = start_timestamp
+            keyframe_timestamp = None
+            num_seeks += 1
+        frame = next(frames, None)
+        if frame is None:
+            break
+        num_decoded += 1
+        frame_timestamp = frame.pts * time_base
+        if frame.key_frame:
+            if keyframe_timestamp is not None:
+                max_keyframe_interval = max(
+                    max_keyframe_interval or 0, frame_timestamp - keyframe_timestamp
+                )
+            keyframe_timestamp = frame_timestamp
+
+        # Find the timestamps within tolerance of this frame
+        lo = bisect.bisect_left(sorted_timestamps, frame_timestamp - tolerance, idx)
+        hi = bisect.bisect_right(sorted_timestamps, frame_timestamp + tolerance, lo)
+        for timestamp in sorted_timestamps[lo:hi]:
             difference = abs(frame_timestamp - timestamp)
-            # if difference <= tolerance and difference < frame_differences[timestamp]:
-            if difference <= tolerance:
-                # Check if this frame is already the closest for another timestamp
-                if frame_timestamp in frame_differences.values():
-                    raise Exception(
-                        f"Frame at {frame_timestamp}s is closest for more than one"
-                        " timestamp."
-                    )
-                frame_by_timestamp[timestamp] = frame
-                frame_differences[timestamp] = difference
+            if (
+                timestamp not in frame_by_timestamp
+                or difference < frame_by_timestamp[timestamp][0]
+            ):
+                frame_by_timestamp[timestamp] = (difference, frame)
+
+        # Frames are decoded in presentation order, so later frames can't be closer
+        # to timestamps at or before this one
+        idx = bisect.bisect_right(sorted_timestamps, frame_timestamp, idx)
 
     video_container.close()
 
-    logger.debug(f"frame_differences=\n{pformat(frame_differences)}")
-    invalid_frame_differences = {
-        timestamp: difference
-        for timestamp, difference in frame_differences.items()
-        if difference > tolerance
-    }
-    if invalid_frame_differences:
-        logger.warning(
-            f"invalid_frame_differences=\n{pformat(invalid_frame_differences)}"
-        )
+    logger.debug(f"{len(sorted_timestamps)=} {num_decoded=} {num_seeks=}")
+    if stats is not None:
+        stats["num_seeks"] = stats.get("num_seeks", 0) + num_seeks
+        stats["num_decoded"] = stats.get("num_decoded", 0) + num_decoded
+    logger.opt(lazy=True).debug(
+        "frame_differences=\n{}",
+        lambda: pformat(
+            {
+                timestamp: difference
+                for timestamp, (difference, _) in frame_by_timestamp.items()
+            }
+        ),
+    )
 
     # Check if all timestamps have been matched
     missing_frame_timestamps = [
-        timestamp for timestamp, frame in frame_by_timestamp.items() if frame is None
+        timestamp for timestamp in timestamps if timestamp not in frame_by_timestamp
     ]
-    if missing_frame_timestamps:
+    if missing_frame_timestamps and not allow_missing:
         raise Exception(
             f"No frame within tolerance for timestamps {missing_frame_timestamps}."
         )
 
-    # Convert frames to PIL Image and return
-    extracted_frames = [frame_by_timestamp[t].to_image() for t in timestamps]
+    # Convert frames to PIL Image once each and return
+    image_by_pts = {}
+    extracted_frames = []
+    for timestamp in timestamps:
+        if timestamp not in frame_by_timestamp:
+            extracted_frames.append(None)
+            continue
+        _, frame = frame_by_timestamp[timestamp]
+        if frame.pts not in image_by_pts:
+            image_by_pts[frame.pts] = frame.to_image()
+        extracted_frames.append(image_by_pts[frame.pts])
 
     return extracted_frames
+
+
+def transcode_video(
+    input_path: str,
+    output_path: str | None = None,
+    profile: str = "archival",
+    threads: int = config.VIDEO_ENCODE_THREADS,
+) -> str:
+    """Re-encode a video with another encode profile, preserving frame timestamps.
+
+    This allows videos to be captured with a fast profile, and compressed with a slow
+    one once recording has finished. The frame index is rebuilt for the new file,
+    keeping the screenshot timestamps of the original.
+
+    Args:
+        input_path (str): The path to the video file.
+        output_path (str, optional): The path to the re-encoded video file. If None,
+            the input file is replaced.
+        profile (str): The name of the encode profile (see ENCODE_PROFILES).
+        threads (int): The number of encoder threads, or 0 to choose automatically.
+
+    Returns:
+        str: The path to the re-encoded video file.
+    """
+    replace = output_path is None
+    if replace:
+        output_path = tempfile.NamedTemporaryFile(
+            delete=False,
+            suffix=".mp4",
+            dir=os.path.dirname(input_path),
+        ).name
+    frame_index = FrameIndex.load(input_path)
+
+    input_container = av.open(input_path)
+    input_stream = input_container.streams.video[0]
+    output_container = av.open(output_path, mode="w")
+    output_stream = output_container.add_stream(
+        config.VIDEO_ENCODING, rate=input_stream.average_rate
+    )
+    output_stream.width = input_stream.codec_context.width
+    output_stream.height = input_stream.codec_context.height
+    output_stream.pix_fmt = input_stream.codec_context.pix_fmt
+    output_stream.codec_context.time_base = input_stream.time_base
+    output_stream.options = get_encode_options(profile)
+    output_stream.codec_context.thread_count = threads
+
+    num_frames = 0
+    last_pts = None
+    for frame in input_container.decode(input_stream):
+        # the final frame written by finalize_video_writer may repeat the PTS of the
+        # previous frame, which the muxer rejects
+        if last_pts is not None and frame.pts <= last_pts:
+            frame.pts = last_pts + 1
+        last_pts = frame.pts
+        # let the encoder choose key frames
+        frame.pict_type = av.video.frame.PictureType.NONE
+        for packet in output_stream.encode(frame):
+            output_container.mux(packet)
+        num_frames += 1
+    for packet in output_stream.encode():
+        output_container.mux(packet)
+    output_container.close()
+    input_container.close()
+
+    input_size = os.path.getsize(input_path)
+    output_size = os.path.getsize(output_path)
+    logger.info(f"{num_frames=} {input_size=} {output_size=}")
+    if replace:
+        os.replace(output_path, input_path)
+        output_path = input_path
+
+    FrameIndex.build(
+        output_path,
+        frame_index.screenshot_timestamps if frame_index else None,
+        frame_index.video_start_timestamp if frame_index else None,
+    ).save(output_path)
+    return output_path
+
+
+def transcode(
+    recording_id: int | None = None,
+    profile: str = "archival",
+    threads: int = config.VIDEO_ENCODE_THREADS,
+) -> str:
+    """Re-encode the video of a recording in place with another encode profile.
+
+    Videos recorded in segments are re-encoded one segment at a time.
+
+    Args:
+        recording_id (int, optional): The id of the recording. Defaults to the latest
+            recording.
+        profile (str): The name of the encode profile (see ENCODE_PROFILES).
+        threads (int): The number of encoder threads, or 0 to choose automatically.
+
+    Returns:
+        str: The path to the video file.
+    """
+    # avoid circular import
+    from openadapt.db import crud
+
+    session = crud.get_new_session(read_only=True)
+    if recording_id:
+        recording = crud.get_recording_by_id(session, recording_id)
+    else:
+        recording = crud.get_latest_recording(session)
+    video_file_path = get_video_file_path(recording.timestamp)
+    manifest = VideoManifest.load(video_file_path)
+    segment_file_paths = (
+        manifest.get_segment_file_paths(video_file_path)
+        if manifest
+        else [video_file_path]
+    )
+    for segment_file_path in segment_file_paths:
+        logger.info(f"transcoding {segment_file_path=} with {profile=}")
+        transcode_video(segment_file_path, profile=profile, threads=threads)
+    return video_file_path
+
+
+def get_frame_diff_stats(frame: np.ndarray, image: np.ndarray) -> tuple[float, int]:
+    """Compare a video frame to the screenshot it was written from.
+
+    Args:
+        frame (np.ndarray): The RGB array of the video frame.
+        image (np.ndarray): The RGB array of the screenshot.
+
+    Returns:
+        tuple[float, int]: The peak signal-to-noise ratio in dB, which is infinite if
+            the arrays are identical, and the maximum absolute difference.
+    """
+    assert frame.shape == image.shape, (frame.shape, image.shape)
+    diff = np.abs(frame.astype(np.int16) - image.astype(np.int16))
+    max_abs_diff = int(diff.max())
+    if not max_abs_diff:
+        return float("inf"), 0
+    mse = np.mean(np.square(diff, dtype=np.float64))
+    psnr = float(10 * np.log10(255**2 / mse))
+    return psnr, max_abs_diff
+
+
+def _verify_chunk(
+    video_file_path: str,
+    timestamps: list[float],
+    png_datas: list[bytes],
+) -> list[tuple[float, int] | None]:
+    """Compare the video frames at some timestamps to their screenshots.
+
+    Args:
+        video_file_path (str): The path to the video file.
+        timestamps (list[float]): The timestamps of the screenshots, relative to
+            the start of the video.
+        png_datas (list[bytes]): The PNG data of the screenshots.
+
+    Returns:
+        list[tuple[float, int] | None]: The result of get_frame_diff_stats for each
+            screenshot, or None if its frame is missing from the video.
+    """
+    frames = extract_frames(video_file_path, timestamps, allow_missing=True)
+    missing_timestamps = [
+        timestamp for timestamp, frame in zip(timestamps, frames) if frame is None
+    ]
+    if missing_timestamps:
+        logger.warning(f"{missing_timestamps=}")
+    return [
+        (
+            get_frame_diff_stats(
+                np.asarray(frame.convert("RGB")),
+                np.asarray(Image.open(io.BytesIO(png_data)).convert("RGB")),
+            )
+            if frame is not None
+            else None
+        )
+        for frame, png_data in zip(frames, png_datas)
+    ]
+
+
+def verify_frames(
+    video_file_path: str,
+    timestamps: list[float],
+    png_datas: list[bytes],
+    chunk_size: int = VERIFY_CHUNK_SIZE,
+    num_workers: int | None = None,
+) -> list[tuple[float, int] | None]:
+    """Compare video frames to the screenshots they were written from.
+
+    The screenshots are split into chunks of consecutive frames, which are decoded
+    and compared in parallel.
+
+    Args:
+        video_file_path (str): The path to the video file.
+        timestamps (list[float]): The timestamps of the screenshots in ascending
+            order, relative to the start of the video.
+        png_datas (list[bytes]): The PNG data of each screenshot.
+        chunk_size (int): The number of screenshots compared by each task.
+        num_workers (int, optional): The number of worker threads. Defaults to
+            ThreadPoolExecutor's default.
+
+    Returns:
+        list[tuple[float, int] | None]: The PSNR and maximum absolute difference of
+            each frame (see get_frame_diff_stats), or None if it is missing.
+    """
+    assert len(timestamps) == len(png_datas), (len(timestamps), len(png_datas))
+    chunk_starts = range(0, len(timestamps), chunk_size)
+    with ThreadPoolExecutor(num_workers) as executor:
+        chunk_results = executor.map(
+            lambda start: _verify_chunk(
+                video_file_path,
+                timestamps[start : start + chunk_size],
+                png_datas[start : start + chunk_size],
+            ),
+            chunk_starts,
+        )
+        return [result for results in chunk_results for result in results]
+
+
+def verify(
+    recording_id: int | None = None,
+    every: int = 1,
+    chunk_size: int = VERIFY_CHUNK_SIZE,
+    num_workers: int | None = None,
+    report_file_path: str | None = None,
+) -> dict:
+    """Verify the fidelity of a recording's video against its stored screenshots.
+
+    Requires the recording to have been made with both RECORD_VIDEO and
+    RECORD_IMAGES. A report with the PSNR and maximum absolute difference of each
+    compared frame is written as JSON, with a PSNR of null for identical frames, and
+    null values for frames missing from the video.
+
+    Args:
+        recording_id (int, optional): The id of the recording. Defaults to the latest
+            recording.
+        every (int): Compare every this many screenshots, for faster checks.
+        chunk_size (int): The number of screenshots compared by each task.
+        num_workers (int, optional): The number of worker threads.
+        report_file_path (str, optional): The path of the report. Defaults to the
+            path of the video file with a .verify.json extension.
+
+    Returns:
+        dict: The summary of the report.
+    """
+    # avoid circular import
+    from openadapt.db import crud
+
+    session = crud.get_new_session(read_only=True)
+    if recording_id:
+        recording = crud.get_recording_by_id(session, recording_id)
+    else:
+        recording = crud.get_latest_recording(session)
+    video_file_path = get_video_file_path(recording.timestamp)
+    screenshots = [
+        screenshot
+        for screenshot in crud.get_screenshots(session, recording)
+        if screenshot.png_data
+    ][::every]
+    assert screenshots, f"No stored screenshots in {recording.id=}"
+    timestamps = [
+        screenshot.timestamp - recording.video_start_time for screenshot in screenshots
+    ]
+    logger.info(f"verifying {len(screenshots)=} against {video_file_path=}")
+    results = verify_frames(
+        video_file_path,
+        timestamps,
+        [screenshot.png_data for screenshot in screenshots],
+        chunk_size,
+        num_workers,
+    )
+
+    found_results = [result for result in results if result is not None]
+    psnrs = [psnr for psnr, _ in found_results if psnr != float("inf")]
+    summary = {
+        "recording_id": recording.id,
+        "encode_profile": (recording.config or {}).get("VIDEO_ENCODE_PROFILE"),
+        "every": every,
+        "num_frames": len(results),
+        "num_missing": len(results) - len(found_results),
+        "num_lossless": len(found_results) - len(psnrs),
+        "min_psnr": min(psnrs, default=None),
+        "mean_psnr": sum(psnrs) / len(psnrs) if psnrs else None,
+        "max_abs_diff": max(
+            (max_abs_diff for _, max_abs_diff in found_results), default=None
+        ),
+    }
+    if report_file_path is None:
+        report_file_path = f"{os.path.splitext(video_file_path)[0]}.verify.json"
+    with open(report_file_path, "w") as f:
+        json.dump(
+            {
+                "summary": summary,
+                "screenshot_id": [screenshot.id for screenshot in screenshots],
+                "timestamp": timestamps,
+                "psnr": [
+                    result[0] if result and result[0] != float("inf") else None
+                    for result in results
+                ],
+                "max_abs_diff": [result[1] if result else None for result in results],
+            },
+            f,
+        )
+    logger.info(f"{report_file_path=} summary=\n{pformat(summary)}")
+    return summary
+
+
+if __name__ == "__main__":
+    fire.Fire({"transcode": transcode, "verify": verify})
@@ -1,9 +1,19 @@
 """Computer vision module."""
 
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+from typing import Any, Callable
 import math
 
 from PIL import Image
-from scipy.ndimage import binary_fill_holes
+from scipy.fft import dctn
+from scipy.ndimage import (
+    binary_dilation,
+    binary_fill_holes,
+    find_objects,
+    label,
+    uniform_filter,
+)
 from skimage.metrics import structural_similarity as ssim
 import cv2
 import numpy as np
@@ -11,15 +21,379 @@ import numpy as np
 from openadapt import cache
 from openadapt.custom_logger import logger
 
+PHASH_SIZE = 8
+PHASH_HIGHFREQ_FACTOR = 4
+MAX_HASH_DISTANCE = 20
+SIMILARITY_TOP_K = 4
+SSIM_SIZE = 128
+# number of masks processed by each task in map_masks
+MASK_CHUNK_SIZE = 16
+# side length of the tiles in which changes between screenshots are tracked
+TILE_SIZE = 64
+
+
+@cache.register_array_type
+class CroppedMask:
+    """A binary mask stored as a crop of its bounding box within a larger frame.
+
+    Attributes:
+        data: The cropped mask array.
+        top: The row of the top edge of the crop within the frame.
+        left: The column of the left edge of the crop within the frame.
+        shape: The (height, width) of the full frame.
+    """
+
+    def __init__(
+        self,
+        data: np.ndarray,
+        top: int,
+        left: int,
+        shape: tuple[int, int],
+    ) -> None:
+        """Initialize the cropped mask.
+
+        Args:
+            data: The cropped mask array.
+            top: The row of the top edge of the crop within the frame.
+            left: The column of the left edge of the crop within the frame.
+            shape: The (height, width) of the full frame.
+        """
+        self.data = data
+        self.top = int(top)
+        self.left = int(left)
+        self.shape = tuple(shape[:2])
+
+    @classmethod
+    def from_array(cls: type["CroppedMask"], mask: np.ndarray) -> "CroppedMask":
+        """Create a cropped mask from a full-frame mask.
+
+        Args:
+            mask: The full-frame mask array.
+
+        Returns:
+            The mask cropped to the bounding box of its "on" pixels.
+        """
+        return cls(mask, 0, 0, mask.shape).tighten()
+
+    @property
+    def bbox(self) -> tuple[int, int, int, int]:
+        """Return the (top, left, bottom, right) of the crop, exclusive of the end."""
+        height, width = self.data.shape[:2]
+        return self.top, self.left, self.top + height, self.left + width
+
+    @property
+    def area(self) -> int:
+        """Return the number of "on" pixels."""
+        return int(np.count_nonzero(self.data))
+
+    def tighten(self) -> "CroppedMask":
+        """Shrink the crop to the bounding box of the "on" pixels.
+
+        Returns:
+            A new CroppedMask, or an empty one if no pixels are set.
+        """
+        rows = np.flatnonzero(self.data.any(axis=1))
+        if not rows.size:
+            return CroppedMask(self.data[:0, :0], 0, 0, self.shape)
+        cols = np.flatnonzero(self.data.any(axis=0))
+        rmin, rmax = rows[0], rows[-1] + 1
+        cmin, cmax = cols[0], cols[-1] + 1
+        return CroppedMask(
+            self.data[rmin:rmax, cmin:cmax],
+            self.top + rmin,
+            self.left + cmin,
+            self.shape,
+        )
+
+    def pad(self, size: int) -> "CroppedMask":
+        """Grow the crop by up to `size` pixels on each side, clipped to the frame.
+
+        Args:
+            size: The number of pixels to add on each side.
+
+        Returns:
+            A new CroppedMask covering the enlarged region.
+        """
+        top, left, bottom, right = self.bbox
+        new_top, new_left = max(top - size, 0), max(left - size, 0)
+        new_bottom = min(bottom + size, self.shape[0])
+        new_right = min(right + size, self.shape[1])
+        data = np.zeros(
+            (new_bottom - new_top, new_right - new_left), dtype=self.data.dtype
+        )
+        data[top - new_top : bottom - new_top, left - new_left : right - new_left] = (
+            self.data
+        )
+        return CroppedMask(data, new_top, new_left, self.shape)
+
+    def contains(self, other: "CroppedMask") -> bool:
+        """Check whether every "on" pixel of `other` is also set in this mask.
+
+        Args:
+            other: The mask to check. Must be tightly cropped.
+
+        Returns:
+            True if `other` is completely contained in this mask.
+        """
+        top, left, bottom, right = self.bbox
+        other_top, other_left, other_bottom, other_right = other.bbox
+        if (
+            other_top < top
+            or other_left < left
+            or other_bottom > bottom
+            or other_right > right
+        ):
+            return False
+        data = self.data[
+            other_top - top : other_bottom - top,
+            other_left - left : other_right - left,
+        ]
+        return np.array_equal(other.data & data, other.data)
+
+    def to_array(self) -> np.ndarray:
+        """Return the mask as a full-frame array."""
+        mask = np.zeros(self.shape, dtype=self.data.dtype)
+        top, left, bottom, right = self.bbox
+        mask[top:bottom, left:right] = self.data
+        return mask
+
+    def __array__(
+        self, dtype: np.dtype | None = None, copy: bool | None = None
+    ) -> np.ndarray:
+        """Support `np.asarray(mask)` by returning the full-frame array."""
+        mask = self.to_array()
+        return mask if dtype is None else mask.astype(dtype)
+
+    @cached_property
+    def content_hash(self) -> str:
+        """Return a hash of the mask, computed once (see cache.array_cache)."""
+        return cache.get_hash(
+            cache.get_content_hash(self.data), str((self.top, self.left, self.shape))
+        )
+
+    def to_arrays(self) -> tuple[dict[str, np.ndarray], dict[str, Any]]:
+        """Return the arrays and metadata to store in cache.array_cache."""
+        return {"data": self.data}, {
+            "top": self.top,
+            "left": self.left,
+            "shape": self.shape,
+        }
+
+    @classmethod
+    def from_arrays(
+        cls: type["CroppedMask"],
+        arrays: dict[str, np.ndarray],
+        metadata: dict[str, Any],
+    ) -> "CroppedMask":
+        """Create a cropped mask from the arrays and metadata returned by to_arrays."""
+        return cls(arrays["data"], metadata["top"], metadata["left"], metadata["shape"])
+
+
+@cache.register_array_type
+class LabelMap:
+    """A segmentation stored as one integer label per pixel.
+
+    Attributes:
+        labels: An array of shape (height, width) containing the index of the segment
+            each pixel belongs to.
+        colors: An array of shape (num_labels, 3) containing the RGB color of each
+            segment in the segmented image.
+        bboxes: An array of shape (num_labels, 4) containing the (top, left, bottom,
+            right) of each segment, exclusive of the end.
+        areas: An array of shape (num_labels,) containing the number of pixels in
+            each segment.
+    """
+
+    def __init__(
+        self,
+        labels: np.ndarray,
+        colors: np.ndarray,
+        bboxes: np.ndarray,
+        areas: np.ndarray,
+    ) -> None:
+        """Initialize the label map.
+
+        Args:
+            labels: The per-pixel segment indices.
+            colors: The RGB color of each segment.
+            bboxes: The (top, left, bottom, right) of each segment.
+            areas: The number of pixels in each segment.
+        """
+        self.labels = labels
+        self.colors = colors
+        self.bboxes = bboxes
+        self.areas = areas
+
+    @classmethod
+    def from_segmented_image(
+        cls: type["LabelMap"], segmented_image: Image.Image
+    ) -> "LabelMap":
+        """Create a label map from an image in which each segment has a unique color.
+
+        Args:
+            segmented_image: A PIL.Image object of the segmented image.
+
+        Returns:
+            The label map, with labels ordered by color.
+        """
+        segmented_image_np = np.asarray(segmented_image)
+        if segmented_image_np.ndim == 2:
+            segmented_image_np = segmented_image_np[:, :, None]
+
+        # Encode each RGB color into a single integer, ignoring any alpha channel
+        segmented_image_np = segmented_image_np[:, :, :3].astype(np.uint32)
+        codes = np.zeros(segmented_image_np.shape[:2], dtype=np.uint32)
+        for channel in range(segmented_image_np.shape[2]):
+            codes = (codes << 8) | segmented_image_np[:, :, channel]
+
+        unique_codes, inverse = np.unique(codes, return_inverse=True)
+        labels = inverse.reshape(codes.shape).astype(np.int32)
+        num_labels = len(unique_codes)
+        colors = np.stack(
+            [
+                (unique_codes >> (8 * shift)) & 0xFF
+                for shift in reversed(range(segmented_image_np.shape[2]))
+            ],
+            axis=-1,
+        ).astype(np.uint8)
+        areas = np.bincount(labels.ravel(), minlength=num_labels)
+        bboxes = np.array(
+            [
+                (rows.start, cols.start, rows.stop, cols.stop)
+                for rows, cols in find_objects(labels + 1, max_label=num_labels)
+            ],
+            dtype=np.int64,
+        ).reshape(-1, 4)
+        return cls(labels, colors, bboxes, areas)
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        """Return the (height, width) of the frame."""
+        return self.labels.shape
+
+    def __len__(self) -> int:
+        """Return the number of labels."""
+        return len(self.areas)
+
+    def get_mask(self, label: int) -> CroppedMask:
+        """Get the mask of a single label, cropped to its bounding box.
+
+        Args:
+            label: The index of the label.
+
+        Returns:
+            The cropped mask.
+        """
+        top, left, bottom, right = self.bboxes[label]
+        data = self.labels[top:bottom, left:right] == label
+        return CroppedMask(data, top, left, self.shape)
+
+    def get_masks(self, sort_by_area: bool = False) -> list[CroppedMask]:
+        """Get the cropped mask of every label.
+
+        Args:
+            sort_by_area: A boolean flag to sort masks by their area in descending
+                order.
+
+        Returns:
+            A list of CroppedMask objects.
+        """
+        labels = range(len(self))
+        if sort_by_area:
+            labels = np.argsort(-self.areas, kind="stable")
+        return [self.get_mask(label) for label in labels]
+
+    @cached_property
+    def content_hash(self) -> str:
+        """Return a hash of the label map, computed once (see cache.array_cache)."""
+        return cache.get_hash(
+            cache.get_content_hash(self.labels), cache.get_content_hash(self.colors)
+        )
 
-@cache.cache()
+    def to_arrays(self) -> tuple[dict[str, np.ndarray], dict[str, Any]]:
+        """Return the arrays and metadata to store in cache.array_cache."""
+        return {
+            "labels": self.labels,
+            "colors": self.colors,
+            "bboxes": self.bboxes,
+            "areas": self.areas,
+        }, {}
+
+    @classmethod
+    def from_arrays(
+        cls: type["LabelMap"],
+        arrays: dict[str, np.ndarray],
+        metadata: dict[str, Any],
+    ) -> "LabelMap":
+        """Create a label map from the arrays and metadata returned by to_arrays."""
+        return cls(
+            arrays["labels"], arrays["colors"], arrays["bboxes"], arrays["areas"]
+        )
+
+
+MaskList = list[np.ndarray] | list[CroppedMask] | LabelMap
+
+
+def to_cropped_masks(masks: MaskList) -> list[CroppedMask]:
+    """Convert masks in any supported form to a list of CroppedMask objects.
+
+    Args:
+        masks: A LabelMap, or a list of full-frame arrays or CroppedMask objects.
+
+    Returns:
+        A list of CroppedMask objects.
+    """
+    if isinstance(masks, LabelMap):
+        return masks.get_masks()
+    return [
+        mask if isinstance(mask, CroppedMask) else CroppedMask.from_array(mask)
+        for mask in masks
+    ]
+
+
+def _restore_masks(
+    masks: MaskList,
+    cropped_masks: list[CroppedMask],
+) -> list[np.ndarray] | list[CroppedMask]:
+    """Return full-frame arrays if the input masks were full-frame arrays.
+
+    Args:
+        masks: The masks originally passed by the caller.
+        cropped_masks: The processed masks.
+
+    Returns:
+        The processed masks, in the same form as the input where possible.
+    """
+    if isinstance(masks, LabelMap) or (masks and isinstance(masks[0], CroppedMask)):
+        return cropped_masks
+    return [mask.to_array() for mask in cropped_masks]
+
+
+@cache.array_cache()
+def get_label_map(segmented_image: Image.Image) -> LabelMap:
+    """Get a label map from a segmented image.
+
+    Args:
+        segmented_image: A PIL.Image object of the segmented image, in which each
+            segment has a unique color.
+
+    Returns:
+        The LabelMap of the segmented image.
+    """
+    label_map = LabelMap.from_segmented_image(segmented_image)
+    logger.info(f"{len(label_map)=}")
+    return label_map
+
+
+@cache.array_cache()
 def get_masks_from_segmented_image(
     segmented_image: Image.Image, sort_by_area: bool = False
 ) -> list[np.ndarray]:
     """Get masks from a segmented image.
 
     Process the image to find unique masks based on color channels and optionally sort
-    them by area.
+    them by area. Prefer `get_label_map`, which avoids allocating a full-frame array
+    per mask.
 
     Args:
         segmented_image: A PIL.Image object of the segmented image.
@@ -30,62 +404,40 @@ def get_masks_from_segmented_image(
             specified.
     """
     logger.info("starting...")
-    segmented_image_np = np.array(segmented_image)
-
-    # Assume the last channel is the alpha channel if the image has 4 channels
-    if segmented_image_np.shape[2] == 4:
-        segmented_image_np = segmented_image_np[:, :, :3]
-
-    # Find unique colors in the image, each unique color corresponds to a unique mask
-    unique_colors = np.unique(
-        segmented_image_np.reshape(-1, segmented_image_np.shape[2]), axis=0
-    )
-    logger.info(f"{len(unique_colors)=}")
-
-    masks = []
-    for color in unique_colors:
-        # Create a mask for each unique color
-        mask = np.all(segmented_image_np == color, axis=-1)
-        masks.append(mask)
-
-    if sort_by_area:
-        # Calculate the area of each mask and sort the masks by area in descending order
-        masks.sort(key=np.sum, reverse=True)
-
+    label_map = get_label_map(segmented_image)
+    masks = [mask.to_array() for mask in label_map.get_masks(sort_by_area=sort_by_area)]
     logger.info(f"{len(masks)=}")
     return masks
 
 
-@cache.cache()
+@cache.array_cache()
 def filter_masks_by_size(
-    masks: list[np.ndarray],
+    masks: MaskList,
     min_mask_size: tuple[int, int] = (15, 15),
-) -> list[np.ndarray]:
+) -> list[np.ndarray] | list[CroppedMask]:
     """Filter masks based on minimum size using the bounding box of "on" pixels.
 
     Args:
-        masks: A list of numpy.ndarrays, each representing a mask.
+        masks: A LabelMap, or a list of numpy.ndarrays or CroppedMask objects, each
+            representing a mask.
         min_mask_size: A tuple specifying the minimum dimensions (height, width) that
             the bounding box of the "on" pixels must have to be retained.
 
     Returns:
-        A list of numpy.ndarrays, each representing a mask that meets the size criteria.
+        A list of masks that meet the size criteria, in the same form as the input
+        (CroppedMask objects if the input is a LabelMap).
     """
     size_filtered_masks = []
-    for mask in masks:
-        coords = np.argwhere(mask)  # Get coordinates of all "on" pixels
-        if coords.size > 0:
-            y_min, x_min = coords.min(axis=0)
-            y_max, x_max = coords.max(axis=0)
-            height = y_max - y_min + 1
-            width = x_max - x_min + 1
-            if height >= min_mask_size[0] and width >= min_mask_size[1]:
-                size_filtered_masks.append(mask)
-    return size_filtered_masks
-
-
-@cache.cache()
-def refine_masks(masks: list[np.ndarray]) -> list[np.ndarray]:
+    for mask in to_cropped_masks(masks):
+        mask = mask.tighten()
+        height, width = mask.data.shape[:2]
+        if height >= min_mask_size[0] and width >= min_mask_size[1]:
+            size_filtered_masks.append(mask)
+    return _restore_masks(masks, size_filtered_masks)
+
+
+@cache.array_cache()
+def refine_masks(masks: MaskList) -> list[np.ndarray] | list[CroppedMask]:
     """Refine the list of masks.
 
     - Fill holes of any size.
@@ -93,102 +445,186 @@ def refine_masks(masks: list[np.ndarray]) -> list[np.ndarray]:
     - Exclude masks where the convex hull does not meet a specified minimum
       size in any dimension.
 
+    Each mask is processed within its bounding box, so passing a LabelMap avoids
+    materializing full-frame arrays entirely.
+
     Args:
-        masks: A list of numpy.ndarrays, each representing a mask.
-        min_mask_size: A tuple specifying the minimum dimensions (height,
-            width) that the convex hull of a mask must have to be retained.
+        masks: A LabelMap, or a list of numpy.ndarrays or CroppedMask objects, each
+            representing a mask.
 
     Returns:
-        A list of numpy.ndarrays, each representing a refined mask.
+        A list of refined masks, in the same form as the input (CroppedMask objects if
+        the input is a LabelMap).
     """
     logger.info(f"{len(masks)=}")
 
-    masks = remove_border_masks(masks)
-    masks = filter_thin_ragged_masks(masks)
+    cropped_masks = to_cropped_masks(masks)
+    cropped_masks = remove_border_masks(cropped_masks)
+    cropped_masks = filter_thin_ragged_masks(cropped_masks)
 
     # Fill holes in each mask
-    filled_masks = [binary_fill_holes(mask).astype(np.uint8) for mask in masks]
+    filled_masks = [
+        CroppedMask(
+            binary_fill_holes(mask.data).astype(np.uint8),
+            mask.top,
+            mask.left,
+            mask.shape,
+        )
+        for mask in cropped_masks
+    ]
 
     size_filtered_masks = filter_masks_by_size(filled_masks)
 
     # Remove masks completely contained within other masks
-    refined_masks = []
-    for i, mask_i in enumerate(size_filtered_masks):
-        contained = False
-        for j, mask_j in enumerate(size_filtered_masks):
-            if i != j:
-                # Check if mask_i is completely contained in mask_j
-                if np.array_equal(mask_i & mask_j, mask_i):
-                    contained = True
-                    break
-        if not contained:
-            refined_masks.append(mask_i)
+    refined_masks = remove_contained_masks(size_filtered_masks)
 
     logger.info(f"{len(refined_masks)=}")
-    return refined_masks
+    return _restore_masks(masks, refined_masks)
+
+
+@cache.array_cache()
+def remove_contained_masks(masks: MaskList) -> list[np.ndarray] | list[CroppedMask]:
+    """Remove masks completely contained within other masks.
+
+    A mask can only be contained in a mask of at least the same area whose bounding
+    box contains its own. Masks are therefore sorted by area, and each mask is only
+    compared against the larger masks passing the bounding box test, within its own
+    bounding box. Identical masks are contained in each other, so all copies are
+    removed.
+
+    Args:
+        masks: A LabelMap, or a list of numpy.ndarrays or CroppedMask objects, each
+            representing a mask.
+
+    Returns:
+        A list of the masks not contained in any other mask, in their original order
+        and in the same form as the input (CroppedMask objects if the input is a
+        LabelMap).
+    """
+    cropped_masks = [mask.tighten() for mask in to_cropped_masks(masks)]
+    num_masks = len(cropped_masks)
+    bboxes = np.array([mask.bbox for mask in cropped_masks]).reshape(-1, 4)
+    areas = np.array([mask.area for mask in cropped_masks], dtype=np.int64)
+
+    order = np.argsort(-areas, kind="stable")
+    sorted_neg_areas = -areas[order]
+    sorted_bboxes = bboxes[order]
+    is_contained = np.zeros(num_masks, dtype=bool)
+    num_compared = 0
+    for i in range(num_masks):
+        if not areas[i]:
+            # An empty mask is contained in any other mask
+            is_contained[i] = num_masks > 1
+            continue
+
+        # Masks with at least the same area precede this one in sorted order
+        num_candidates = np.searchsorted(sorted_neg_areas, -areas[i], side="right")
+        candidate_bboxes = sorted_bboxes[:num_candidates]
+        top, left, bottom, right = bboxes[i]
+        candidates = order[:num_candidates][
+            (candidate_bboxes[:, 0] <= top)
+            & (candidate_bboxes[:, 1] <= left)
+            & (candidate_bboxes[:, 2] >= bottom)
+            & (candidate_bboxes[:, 3] >= right)
+        ]
+        for j in candidates:
+            if j == i:
+                continue
+            num_compared += 1
+            if cropped_masks[j].contains(cropped_masks[i]):
+                is_contained[i] = True
+                break
+
+    num_pairs = num_masks * (num_masks - 1)
+    logger.info(
+        f"{num_masks=} {num_compared=} {num_pairs=} num_contained="
+        f"{is_contained.sum()}"
+    )
+    remaining_masks = [
+        mask
+        for mask, mask_is_contained in zip(cropped_masks, is_contained)
+        if not mask_is_contained
+    ]
+    return _restore_masks(masks, remaining_masks)
 
 
-@cache.cache()
+@cache.array_cache()
 def filter_thin_ragged_masks(
-    masks: list[np.ndarray],
+    masks: MaskList,
     kernel_size: int = 3,
     iterations: int = 5,
-) -> list[np.ndarray]:
+) -> list[np.ndarray] | list[CroppedMask]:
     """Applies morphological operations to filter out thin and ragged masks.
 
     Args:
-        masks: A list of ndarrays, where each ndarray is a binary mask.
+        masks: A LabelMap, or a list of ndarrays or CroppedMask objects, where each
+            is a binary mask.
         kernel_size: Size of the structuring element.
         iterations: Number of times the operation is applied.
 
     Returns:
-        A list of ndarrays with thin and ragged masks filtered out.
+        A list of masks with thin and ragged masks filtered out, in the same form as
+        the input (CroppedMask objects if the input is a LabelMap).
     """
     logger.info(f"{len(masks)=}")
     kernel = np.ones((kernel_size, kernel_size), np.uint8)
+    # Pad each crop so that the dilation is not clipped by the crop boundary
+    padding = (kernel_size // 2) * iterations
     filtered_masks = []
 
-    for mask in masks:
+    for mask in to_cropped_masks(masks):
+        mask = mask.pad(padding)
         # Convert boolean mask to uint8
-        mask_uint8 = mask.astype(np.uint8) * 255
+        mask_uint8 = mask.data.astype(np.uint8) * 255
         # Perform erosion
         eroded_mask = cv2.erode(mask_uint8, kernel, iterations=iterations)
         # Perform dilation
         dilated_mask = cv2.dilate(eroded_mask, kernel, iterations=iterations)
 
         # Convert back to boolean mask and add to the filtered list
-        filtered_masks.append(dilated_mask > 0)
+        filtered_masks.append(
+            CroppedMask(dilated_mask > 0, mask.top, mask.left, mask.shape).tighten()
+        )
 
     logger.info(f"{len(filtered_masks)=}")
-    return filtered_masks
+    return _restore_masks(masks, filtered_masks)
 
 
-@cache.cache()
+@cache.array_cache()
 def remove_border_masks(
-    masks: list[np.ndarray],
+    masks: MaskList,
     threshold_percent: float = 5.0,
-) -> list[np.ndarray]:
+) -> list[np.ndarray] | list[CroppedMask]:
     """Removes masks whose "on" pixels are close to the mask borders on all four sides.
 
     Args:
-        masks: A list of ndarrays, where each ndarray is a binary mask.
+        masks: A LabelMap, or a list of ndarrays or CroppedMask objects, where each
+            is a binary mask.
         threshold_percent: A float indicating how close the "on" pixels can be to
               the border, represented as a percentage of the mask's dimensions.
 
     Returns:
-    - A list of ndarrays with the border masks removed.
+    - A list of masks with the border masks removed, in the same form as the input
+      (CroppedMask objects if the input is a LabelMap).
     """
 
-    def is_close_to_all_borders(mask: np.ndarray, threshold: float) -> bool:
-        # Determine actual threshold in pixels based on the percentage
-        threshold_rows = int(mask.shape[0] * (threshold_percent / 100))
-        threshold_cols = int(mask.shape[1] * (threshold_percent / 100))
+    def is_close_to_all_borders(mask: CroppedMask, threshold: float) -> bool:
+        if not mask.area:
+            return False
 
-        # Check for "on" pixels close to each border
-        top = np.any(mask[:threshold_rows, :])
-        bottom = np.any(mask[-threshold_rows:, :])
-        left = np.any(mask[:, :threshold_cols])
-        right = np.any(mask[:, -threshold_cols:])
+        # Determine actual threshold in pixels based on the percentage
+        height, width = mask.shape
+        threshold_rows = int(height * (threshold_percent / 100))
+        threshold_cols = int(width * (threshold_percent / 100))
+
+        # Check for "on" pixels close to each border. A threshold of zero matches
+        # no rows from the start and every row from the end, as with
+        # `mask[:0]` and `mask[-0:]`.
+        mask_top, mask_left, mask_bottom, mask_right = mask.bbox
+        top = mask_top < threshold_rows
+        bottom = not threshold_rows or mask_bottom > height - threshold_rows
+        left = mask_left < threshold_cols
+        right = not threshold_cols or mask_right > width - threshold_cols
 
         # If "on" pixels are close to all borders, return True
         return top and bottom and left and right
@@ -196,65 +632,117 @@ def remove_border_masks(
     logger.info(f"{len(masks)=}")
 
     filtered_masks = []
-    for mask in masks:
+    for mask in to_cropped_masks(masks):
         # Only add mask if it is not close to all borders
         if not is_close_to_all_borders(mask, threshold_percent):
             filtered_masks.append(mask)
 
     logger.info(f"{len(filtered_masks)=}")
-    return filtered_masks
+    return _restore_masks(masks, filtered_masks)
+
+
+def map_masks(
+    fn: Callable[[CroppedMask], Any],
+    masks: MaskList,
+    chunk_size: int = MASK_CHUNK_SIZE,
+    num_workers: int | None = None,
+) -> list[Any]:
+    """Apply a function to each mask, in parallel.
 
+    Masks are processed in chunks, each in a worker thread. Each mask is cropped to
+    the bounding box of its "on" pixels within the worker before being passed to the
+    function, so that full-frame masks are also only scanned in parallel. NumPy
+    releases the GIL for most array operations.
+
+    Args:
+        fn: The function, called with each tightly cropped mask.
+        masks: A LabelMap, or a list of numpy.ndarrays or CroppedMask objects, each
+            representing a mask.
+        chunk_size: The number of masks processed by each task.
+        num_workers: The number of worker threads. Defaults to ThreadPoolExecutor's
+            default.
+
+    Returns:
+        The result of the function for each mask, in order.
+    """
 
-@cache.cache()
+    def get_mask(idx: int) -> CroppedMask:
+        if isinstance(masks, LabelMap):
+            return masks.get_mask(idx)
+        mask = masks[idx]
+        if isinstance(mask, CroppedMask):
+            return mask.tighten()
+        return CroppedMask.from_array(mask)
+
+    def map_chunk(start: int) -> list[Any]:
+        return [
+            fn(get_mask(idx))
+            for idx in range(start, min(start + chunk_size, len(masks)))
+        ]
+
+    with ThreadPoolExecutor(num_workers) as executor:
+        chunk_results = executor.map(map_chunk, range(0, len(masks), chunk_size))
+        return [result for results in chunk_results for result in results]
+
+
+@cache.array_cache()
 def extract_masked_images(
     original_image: Image.Image,
-    masks: list[np.ndarray],
+    masks: MaskList,
+    chunk_size: int = MASK_CHUNK_SIZE,
+    num_workers: int | None = None,
 ) -> list[Image.Image]:
     """Apply each mask to the original image.
 
     Resize the image to fit the mask's bounding box, discarding pixels outside the mask.
+    Only the region of the image within each mask's bounding box is read, and masks
+    are processed in parallel (see map_masks).
 
     Args:
         original_image: A PIL.Image object of the original image.
-        masks: A list of numpy.ndarrays, each representing a refined mask.
+        masks: A LabelMap, or a list of numpy.ndarrays or CroppedMask objects, each
+            representing a refined mask.
+        chunk_size: The number of masks processed by each task.
+        num_workers: The number of worker threads.
 
     Returns:
         A list of PIL.Image objects, each cropped to the mask's bounding box and
         containing the content of the original image within that mask.
     """
     logger.info(f"{len(masks)=}")
-    original_image_np = np.array(original_image)
-    masked_images = []
+    original_image_np = np.asarray(original_image)
 
-    for mask in masks:
-        # Find the bounding box of the mask
-        rows = np.any(mask, axis=1)
-        cols = np.any(mask, axis=0)
-        rmin, rmax = np.where(rows)[0][[0, -1]]
-        cmin, cmax = np.where(cols)[0][[0, -1]]
-
-        # Crop the mask and the image to the bounding box
-        cropped_mask = mask[rmin : rmax + 1, cmin : cmax + 1]
-        cropped_image = original_image_np[rmin : rmax + 1, cmin : cmax + 1]
+    def get_masked_image(mask: CroppedMask) -> Image.Image:
+        # Crop the image to the bounding box of the mask
+        top, left, bottom, right = mask.bbox
+        cropped_image = original_image_np[top:bottom, left:right]
 
         # Apply the mask
-        masked_image = np.where(cropped_mask[:, :, None], cropped_image, 0).astype(
+        masked_image = np.where(mask.data[:, :, None], cropped_image, 0).astype(
             np.uint8
         )
-        masked_images.append(Image.fromarray(masked_image))
+        return Image.fromarray(masked_image)
 
+    masked_images = map_masks(get_masked_image, masks, chunk_size, num_workers)
     logger.info(f"{len(masked_images)=}")
     return masked_images
 
 
-@cache.cache()
+@cache.array_cache()
 def calculate_bounding_boxes(
-    masks: list[np.ndarray],
+    masks: MaskList,
+    chunk_size: int = MASK_CHUNK_SIZE,
+    num_workers: int | None = None,
 ) -> tuple[list[dict[str, float]], list[tuple[float, float]]]:
     """Calculate bounding boxes and centers for each mask in the list separately.
 
+    Masks are processed in parallel (see map_masks).
+
     Args:
-        masks: A list of numpy.ndarrays, each representing a mask.
+        masks: A LabelMap, or a list of numpy.ndarrays or CroppedMask objects, each
+            representing a mask.
+        chunk_size: The number of masks processed by each task.
+        num_workers: The number of worker threads.
 
     Returns:
         A tuple containing two lists:
@@ -263,35 +751,162 @@ def calculate_bounding_boxes(
         - The second list contains tuples, each representing the "center" as a
           tuple of (x, y) for each mask.
     """
-    bounding_boxes = []
-    centroids = []
-    for mask in masks:
-        # Find all indices where mask is True
-        rows, cols = np.where(mask)
-        if len(rows) == 0 or len(cols) == 0:  # In case of an empty mask
-            bounding_boxes.append({})
-            centroids.append((float("nan"), float("nan")))
-            continue
+
+    def get_bounding_box(
+        mask: CroppedMask,
+    ) -> tuple[dict[str, float], tuple[float, float]]:
+        if not mask.data.size:  # In case of an empty mask
+            return {}, (float("nan"), float("nan"))
 
         # Calculate bounding box
-        top, left = rows.min(), cols.min()
-        height, width = rows.max() - top, cols.max() - left
+        top, left, bottom, right = mask.bbox
+        height, width = bottom - 1 - top, right - 1 - left
 
         # Calculate center
         center_x, center_y = left + width / 2, top + height / 2
 
-        # Append data to the lists
-        bounding_boxes.append(
-            {
-                "top": float(top),
-                "left": float(left),
-                "height": float(height),
-                "width": float(width),
-            }
+        bounding_box = {
+            "top": float(top),
+            "left": float(left),
+            "height": float(height),
+            "width": float(width),
+        }
+        return bounding_box, (float(center_x), float(center_y))
+
+    results = map_masks(get_bounding_box, masks, chunk_size, num_workers)
+    bounding_boxes = [bounding_box for bounding_box, _ in results]
+    centroids = [centroid for _, centroid in results]
+    return bounding_boxes, centroids
+
+
+def get_dirty_tiles(changed: np.ndarray, tile_size: int = TILE_SIZE) -> np.ndarray:
+    """Get the tiles of an image containing changed pixels.
+
+    Args:
+        changed: A boolean array of the changed pixels of the image.
+        tile_size: The side length of each tile. Tiles at the right and bottom edges
+            may extend past the image.
+
+    Returns:
+        np.ndarray: A boolean array with one element per tile, true for the tiles
+            containing any changed pixel.
+    """
+    height, width = changed.shape
+    num_rows, num_cols = -(-height // tile_size), -(-width // tile_size)
+    padded = np.zeros((num_rows * tile_size, num_cols * tile_size), dtype=bool)
+    padded[:height, :width] = changed
+    return padded.reshape(num_rows, tile_size, num_cols, tile_size).any(axis=(1, 3))
+
+
+def get_dirty_regions(
+    dirty_tiles: np.ndarray,
+    shape: tuple[int, int],
+    tile_size: int = TILE_SIZE,
+    padding: int = 1,
+) -> list[tuple[int, int, int, int]]:
+    """Get the regions of an image to re-segment, one per group of dirty tiles.
+
+    Each group of adjacent dirty tiles is padded by whole tiles, so that segments
+    crossing its boundary are not cut off when the region is segmented on its own.
+
+    Args:
+        dirty_tiles: The dirty tiles, as returned by get_dirty_tiles.
+        shape: The (height, width) of the image.
+        tile_size: The side length of each tile.
+        padding: The number of tiles to pad each group by.
+
+    Returns:
+        list[tuple[int, int, int, int]]: The (top, left, bottom, right) of each
+            region, exclusive of the end and clipped to the image.
+    """
+    if padding and dirty_tiles.any():
+        dirty_tiles = binary_dilation(dirty_tiles, iterations=padding)
+    labels, _ = label(dirty_tiles, structure=np.ones((3, 3)))
+    height, width = shape[:2]
+    return [
+        (
+            rows.start * tile_size,
+            cols.start * tile_size,
+            min(rows.stop * tile_size, height),
+            min(cols.stop * tile_size, width),
         )
-        centroids.append((float(center_x), float(center_y)))
+        for rows, cols in find_objects(labels)
+    ]
 
-    return bounding_boxes, centroids
+
+def merge_masks(
+    masks: list[CroppedMask],
+    new_masks: list[CroppedMask],
+    dirty_tiles: np.ndarray,
+    regions: list[tuple[int, int, int, int]],
+    tile_size: int = TILE_SIZE,
+) -> tuple[list[int], list[CroppedMask]]:
+    """Merge the masks of a previous segmentation with those of re-segmented regions.
+
+    A previous mask is replaced if it overlaps a dirty tile and lies within a
+    re-segmented region, which then covers it entirely. Previous masks extending past
+    the re-segmented regions are kept, since they cannot be found again within them.
+    A new mask is kept if it overlaps a dirty tile. As in refine_masks, masks
+    contained in a kept mask of the other segmentation are then removed.
+
+    Args:
+        masks: The tightly cropped masks of the previous segmentation.
+        new_masks: The tightly cropped masks found in the re-segmented regions, in the
+            frame of the whole image.
+        dirty_tiles: The dirty tiles, as returned by get_dirty_tiles.
+        regions: The re-segmented regions, as returned by get_dirty_regions.
+        tile_size: The side length of each tile.
+
+    Returns:
+        tuple[list[int], list[CroppedMask]]: The indexes of the kept previous masks,
+            and the kept new masks.
+    """
+
+    def is_dirty(mask: CroppedMask) -> bool:
+        top, left, bottom, right = mask.bbox
+        tile_rows = np.arange(top, bottom) // tile_size
+        tile_cols = np.arange(left, right) // tile_size
+        if not dirty_tiles[tile_rows[0] : tile_rows[-1] + 1][
+            :, tile_cols[0] : tile_cols[-1] + 1
+        ].any():
+            return False
+        dirty_pixels = dirty_tiles[tile_rows][:, tile_cols]
+        return bool((mask.data.astype(bool) & dirty_pixels).any())
+
+    def is_in_region(mask: CroppedMask) -> bool:
+        top, left, bottom, right = mask.bbox
+        return any(
+            region_top <= top
+            and region_left <= left
+            and bottom <= region_bottom
+            and right <= region_right
+            for region_top, region_left, region_bottom, region_right in regions
+        )
+
+    kept_idxs = [
+        idx
+        for idx, mask in enumerate(masks)
+        if mask.data.size and not (is_dirty(mask) and is_in_region(mask))
+    ]
+    kept_new_masks = [mask for mask in new_masks if mask.data.size and is_dirty(mask)]
+
+    contained_idxs = {
+        idx
+        for idx in kept_idxs
+        if any(new_mask.contains(masks[idx]) for new_mask in kept_new_masks)
+    }
+    kept_idxs = [idx for idx in kept_idxs if idx not in contained_idxs]
+    # a new mask identical to a previous one replaces it, rather than both removed
+    kept_new_masks = [
+        new_mask
+        for new_mask in kept_new_masks
+        if not any(masks[idx].contains(new_mask) for idx in kept_idxs)
+    ]
+    logger.info(
+        f"num_masks={len(masks)} num_kept={len(kept_idxs)} "
+        f"num_new_masks={len(new_masks)} num_kept_new={len(kept_new_masks)}"
+    )
+    return kept_idxs, kept_new_masks
 
 
 def get_image_similarity(
@@ -363,18 +978,267 @@ def get_image_similarity(
     return mssim, diff_image
 
 
-@cache.cache()
+def get_phash(image: Image.Image, hash_size: int = PHASH_SIZE) -> int:
+    """Calculate the perceptual hash of an image.
+
+    The image is converted to grayscale and downscaled, and each bit of the hash
+    indicates whether a low frequency DCT coefficient is above the median.
+
+    Args:
+        image (Image.Image): The image to hash.
+        hash_size (int): The hash has hash_size**2 bits.
+
+    Returns:
+        int: The hash.
+    """
+    size = hash_size * PHASH_HIGHFREQ_FACTOR
+    pixels = np.asarray(image.convert("L").resize((size, size), Image.LANCZOS))
+    dct = dctn(pixels.astype(np.float64), norm="ortho")[:hash_size, :hash_size]
+    bits = dct > np.median(dct)
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def get_hash_distances(phash: int, phashes: np.ndarray) -> np.ndarray:
+    """Calculate the Hamming distances between a perceptual hash and other hashes.
+
+    Args:
+        phash (int): The hash, as returned by get_phash with the default hash_size.
+        phashes (np.ndarray): An array of hashes with dtype np.uint64.
+
+    Returns:
+        np.ndarray: The number of differing bits between phash and each hash.
+    """
+    xor = (phashes ^ np.uint64(phash)).astype(">u8")
+    return np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+def get_ssim_array(image: Image.Image, size: int = SSIM_SIZE) -> np.ndarray:
+    """Convert an image to the array compared by get_batch_image_similarity.
+
+    Args:
+        image (Image.Image): The image to convert.
+        size (int): The width and height to resize the image to.
+
+    Returns:
+        np.ndarray: The grayscale image as a (size, size) float32 array.
+    """
+    image = image.convert("L").resize((size, size), Image.BILINEAR)
+    return np.asarray(image, dtype=np.float32)
+
+
+def get_batch_image_similarity(
+    array: np.ndarray,
+    arrays: np.ndarray,
+    win_size: int = 7,
+    data_range: float = 255,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Calculate the SSIM between an image and a batch of images at once.
+
+    The local statistics of all images are computed with a single uniform filter over
+    the stacked arrays, matching skimage's structural_similarity with its default
+    (uniform, sample covariance) settings.
+
+    Args:
+        array (np.ndarray): The image as returned by get_ssim_array.
+        arrays (np.ndarray): The images to compare against, stacked into an array of
+            shape (num_images, size, size).
+        win_size (int): Window size for SSIM calculation. Must be odd.
+        data_range (float): The range of pixel values.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The SSIM of each image, and the SSIM image of
+            each image.
+    """
+    x = array[None].astype(np.float32)
+    y = arrays.astype(np.float32)
+    window = (1, win_size, win_size)
+    num_pixels = win_size**2
+    cov_norm = num_pixels / (num_pixels - 1)
+
+    ux = uniform_filter(x, size=window)
+    uy = uniform_filter(y, size=window)
+    vx = cov_norm * (uniform_filter(x * x, size=window) - ux * ux)
+    vy = cov_norm * (uniform_filter(y * y, size=window) - uy * uy)
+    vxy = cov_norm * (uniform_filter(x * y, size=window) - ux * uy)
+
+    c1 = (0.01 * data_range) ** 2
+    c2 = (0.03 * data_range) ** 2
+    ssim_images = ((2 * ux * uy + c1) * (2 * vxy + c2)) / (
+        (ux**2 + uy**2 + c1) * (vx + vy + c2)
+    )
+    # ignore the edges, where the filter window is incomplete
+    pad = (win_size - 1) // 2
+    ssims = ssim_images[:, pad:-pad, pad:-pad].mean(axis=(1, 2))
+    return ssims, ssim_images
+
+
+class ImageIndex:
+    """An index of images for finding the images most similar to a query image.
+
+    Candidates are first filtered by the Hamming distance between their perceptual
+    hashes, and SSIM is only calculated for the top_k nearest, on downscaled
+    grayscale images via get_batch_image_similarity.
+
+    Attributes:
+        max_hash_distance: The maximum Hamming distance between the perceptual hashes
+            of similar images.
+        top_k: The maximum number of candidates to calculate SSIM for.
+        ssim_size: The size of the arrays passed to get_batch_image_similarity.
+        phashes: The perceptual hash of each image.
+        ssim_arrays: The downscaled grayscale array of each image.
+        stats: The number of queries, candidates, pruned candidates and SSIM
+            comparisons.
+    """
+
+    def __init__(
+        self,
+        max_hash_distance: int = MAX_HASH_DISTANCE,
+        top_k: int = SIMILARITY_TOP_K,
+        ssim_size: int = SSIM_SIZE,
+    ) -> None:
+        """Initialize the index.
+
+        Args:
+            max_hash_distance: The maximum Hamming distance between the perceptual
+                hashes of similar images.
+            top_k: The maximum number of candidates to calculate SSIM for.
+            ssim_size: The size of the arrays passed to get_batch_image_similarity.
+        """
+        self.max_hash_distance = max_hash_distance
+        self.top_k = top_k
+        self.ssim_size = ssim_size
+        # preallocated, and grown geometrically, so that adding an image doesn't copy
+        # the arrays of all others
+        self._size = 0
+        self._phashes = np.zeros(0, dtype=np.uint64)
+        self._ssim_arrays = np.zeros((0, ssim_size, ssim_size), dtype=np.float32)
+        self.stats = {
+            "num_queries": 0,
+            "num_candidates": 0,
+            "num_pruned": 0,
+            "num_compared": 0,
+        }
+
+    def __len__(self) -> int:
+        """Return the number of images in the index."""
+        return self._size
+
+    @property
+    def phashes(self) -> np.ndarray:
+        """Get the perceptual hash of each image."""
+        return self._phashes[: self._size]
+
+    @property
+    def ssim_arrays(self) -> np.ndarray:
+        """Get the downscaled grayscale array of each image."""
+        return self._ssim_arrays[: self._size]
+
+    def add(self, image: Image.Image) -> int:
+        """Add an image to the index.
+
+        Args:
+            image (Image.Image): The image to add.
+
+        Returns:
+            int: The index of the image, in the order images were added.
+        """
+        return self.add_hashed(get_phash(image), get_ssim_array(image, self.ssim_size))
+
+    def add_hashed(self, phash: int, ssim_array: np.ndarray) -> int:
+        """Add an image to the index by its precomputed hash and SSIM array.
+
+        Args:
+            phash (int): The perceptual hash of the image, as returned by get_phash.
+            ssim_array (np.ndarray): The array of the image, as returned by
+                get_ssim_array with this index's ssim_size.
+
+        Returns:
+            int: The index of the image, in the order images were added.
+        """
+        if self._size == len(self._phashes):
+            capacity = max(2 * self._size, 16)
+            phashes = np.zeros(capacity, dtype=np.uint64)
+            phashes[: self._size] = self.phashes
+            ssim_arrays = np.zeros(
+                (capacity, self.ssim_size, self.ssim_size), dtype=np.float32
+            )
+            ssim_arrays[: self._size] = self.ssim_arrays
+            self._phashes = phashes
+            self._ssim_arrays = ssim_arrays
+        self._phashes[self._size] = np.uint64(phash)
+        self._ssim_arrays[self._size] = ssim_array
+        self._size += 1
+        return self._size - 1
+
+    def remove(self, idx: int) -> None:
+        """Remove an image from the index.
+
+        The indices of the images added after it are decremented.
+
+        Args:
+            idx (int): The index of the image.
+        """
+        # shifted in place
+        self._phashes[idx : self._size - 1] = self._phashes[idx + 1 : self._size]
+        self._ssim_arrays[idx : self._size - 1] = self._ssim_arrays[
+            idx + 1 : self._size
+        ]
+        self._size -= 1
+
+    def query(
+        self,
+        image: Image.Image,
+        min_ssim: float = 0,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Find the images most similar to the given image.
+
+        Args:
+            image (Image.Image): The query image.
+            min_ssim (float): The minimum SSIM of returned images.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray, np.ndarray]: The indices, SSIMs and SSIM
+                images of the matching images, in descending order of SSIM.
+        """
+        if not len(self):
+            return (
+                np.zeros(0, dtype=np.int64),
+                np.zeros(0, dtype=np.float32),
+                np.zeros((0, self.ssim_size, self.ssim_size), dtype=np.float32),
+            )
+
+        distances = get_hash_distances(get_phash(image), self.phashes)
+        idxs = np.flatnonzero(distances <= self.max_hash_distance)
+        idxs = idxs[np.argsort(distances[idxs], kind="stable")][: self.top_k]
+        num_pruned = len(self) - len(idxs)
+        self.stats["num_queries"] += 1
+        self.stats["num_candidates"] += len(self)
+        self.stats["num_pruned"] += num_pruned
+        self.stats["num_compared"] += len(idxs)
+        logger.info(f"num_candidates={len(self)} {num_pruned=}")
+
+        ssims, ssim_images = get_batch_image_similarity(
+            get_ssim_array(image, self.ssim_size), self.ssim_arrays[idxs]
+        )
+        order = np.argsort(-ssims, kind="stable")
+        order = order[ssims[order] >= min_ssim]
+        return idxs[order], ssims[order], ssim_images[order]
+
+
+@cache.array_cache()
 def get_similar_image_idxs(
     images: list[Image.Image],
     min_ssim: float,
     min_size_sim: float,
     short_circuit_ssim: bool = True,
+    max_hash_distance: int = MAX_HASH_DISTANCE,
 ) -> tuple[list[list[int]], list[int], list[list[float]], list[list[float]]]:
     """Get images having Structural Similarity Index Measure (SSIM) above a threshold.
 
     Return the SSIM and size similarity matrices. Also returns indices of images not
-    in any group. Optionally skips SSIM computation if the size difference exceeds the
-    threshold.
+    in any group. Optionally skips SSIM computation if the size difference or the
+    distance between perceptual hashes exceeds the threshold. SSIM is computed on
+    downscaled grayscale images, one batch per image.
 
     Args:
         images: A list of PIL.Image objects to compare.
@@ -383,7 +1247,10 @@ def get_similar_image_idxs(
         min_size_sim: Minimum required similarity in size as a fraction
             (e.g., 0.9 for 90% similarity required).
         short_circuit_ssim: If True, skips SSIM calculation when size similarity is
-            below the threshold.
+            below the threshold, or the Hamming distance between perceptual hashes is
+            above max_hash_distance.
+        max_hash_distance: The maximum Hamming distance between the perceptual hashes
+            of images to compute SSIM for, if short_circuit_ssim is True.
 
     Returns:
         A tuple containing four elements:
@@ -399,19 +1266,34 @@ def get_similar_image_idxs(
     ssim_matrix = [[0.0] * num_images for _ in range(num_images)]
     size_similarity_matrix = [[0.0] * num_images for _ in range(num_images)]
     all_indices = set(range(num_images))
+    ssim_arrays = [get_ssim_array(image) for image in images]
+    phashes = np.array([get_phash(image) for image in images], dtype=np.uint64)
+    num_pruned = 0
 
     for i in range(num_images):
         ssim_matrix[i][i] = 1.0
         size_similarity_matrix[i][i] = 1.0
+        hash_distances = get_hash_distances(int(phashes[i]), phashes)
+        candidate_idxs = []
         for j in range(i + 1, num_images):
             size_sim = get_size_similarity(images[i], images[j])
             size_similarity_matrix[i][j] = size_similarity_matrix[j][i] = size_sim
 
-            if not short_circuit_ssim or size_sim >= min_size_sim:
-                s_ssim, _ = get_image_similarity(images[i], images[j])
-                ssim_matrix[i][j] = ssim_matrix[j][i] = s_ssim
+            if not short_circuit_ssim or (
+                size_sim >= min_size_sim and hash_distances[j] <= max_hash_distance
+            ):
+                candidate_idxs.append(j)
             else:
                 ssim_matrix[i][j] = ssim_matrix[j][i] = math.nan
+                num_pruned += 1
+
+        if candidate_idxs:
+            ssims, _ = get_batch_image_similarity(
+                ssim_arrays[i], np.stack([ssim_arrays[j] for j in candidate_idxs])
+            )
+            for j, s_ssim in zip(candidate_idxs, ssims):
+                ssim_matrix[i][j] = ssim_matrix[j][i] = float(s_ssim)
+    logger.info(f"{num_images=} {num_pruned=}")
 
     for i in range(num_images):
         if i in already_compared:
@@ -21,7 +21,7 @@ from openadapt import video
 from openadapt.config import RECORDING_DIR_PATH, config
 from openadapt.db import crud
 from openadapt.events import get_events
-from openadapt.models import Recording
+from openadapt.models import FramePrefetcher, Recording
 from openadapt.plotting import display_event
 from openadapt.utils import (
     EMPTY,
@@ -30,6 +30,7 @@ from openadapt.utils import (
     evenly_spaced,
     get_posthog_instance,
     image2utf8,
+    image_encode_cache,
     row2dict,
     rows2dicts,
     truncate_html,
@@ -216,11 +217,14 @@ def main(
 
     meta = {}
     action_events = get_events(session, recording, process=PROCESS_EVENTS, meta=meta)
-    event_dicts = rows2dicts(action_events)
 
-    if SCRUB:
-        event_dicts = scrub.scrub_list_dicts(event_dicts)
-    logger.info(f"event_dicts=\n{pformat(event_dicts)}")
+    def get_event_dicts() -> list[dict]:
+        event_dicts = rows2dicts(action_events)
+        if SCRUB:
+            event_dicts = scrub.scrub_list_dicts(event_dicts)
+        return event_dicts
+
+    logger.opt(lazy=True).info("event_dicts=\n{}", lambda: pformat(get_event_dicts()))
 
     recording_dict = row2dict(recording)
     if SCRUB:
@@ -286,13 +290,22 @@ def main(
     ]
     logger.info(f"{len(action_events)=}")
 
-    if diff_video:
-        video_file_path = video.get_video_file_path(recording.timestamp)
-        timestamps = [
+    # decode the video frames needed below ahead of the loop
+    frame_timestamps = [
+        (
             action_event.screenshot.timestamp - recording.video_start_time
-            for action_event in action_events
-        ]
-        frames = video.extract_frames(video_file_path, timestamps)
+            if action_event.screenshot
+            and (diff_video or not action_event.screenshot.png_data)
+            else None
+        )
+        for action_event in action_events
+    ]
+    prefetcher = None
+    if any(timestamp is not None for timestamp in frame_timestamps):
+        prefetcher = FramePrefetcher(
+            video.get_video_file_path(recording.timestamp),
+            [timestamp for timestamp in frame_timestamps if timestamp is not None],
+        ).start()
 
     num_events = (
         min(MAX_EVENTS, len(action_events))
@@ -311,6 +324,10 @@ def main(
                 if idx == MAX_EVENTS:
                     break
 
+                frame_timestamp = frame_timestamps[idx]
+                if frame_timestamp is not None:
+                    prefetcher.wait(frame_timestamp)
+
                 try:
                     image = display_event(action_event)
                 except TypeError as exc:
@@ -320,7 +337,7 @@ def main(
 
                 if image:
                     if diff_video:
-                        frame_image = frames[idx]
+                        frame_image = prefetcher.get_frame(frame_timestamp)
                         diff_image = compute_diff(
                             frame_image, action_event.screenshot.image
                         )
@@ -406,6 +423,11 @@ def main(
 
             progress.close()
 
+    if prefetcher:
+        prefetcher.stop()
+        logger.info(f"{prefetcher.stats=}")
+    logger.info(f"{image_encode_cache.stats=} {image_encode_cache.hit_rate=}")
+
     # Visualize BrowserEvents
     rows.append([row(Div(text="<h2>Browser Events</h2>"))])
     browser_events = crud.get_browser_events(session, recording)
@@ -0,0 +1,62 @@
+"""Tests for the array cache in openadapt.cache."""
+
+from PIL import Image
+import numpy as np
+
+from openadapt import cache, vision
+
+
+def test_array_cache(tmp_path: str) -> None:
+    """Test that results are cached by content and loaded with the same structure.
+
+    Args:
+        tmp_path (str): The temporary cache directory.
+    """
+    num_calls = 0
+
+    @cache.array_cache(dir_path=tmp_path, enabled=True)
+    def segment(
+        image: Image.Image, threshold: int = 128
+    ) -> tuple[vision.LabelMap, list[vision.CroppedMask], dict[str, float]]:
+        nonlocal num_calls
+        num_calls += 1
+        segmented_image = Image.fromarray(
+            (np.array(image) > threshold).astype(np.uint8) * 255
+        )
+        label_map = vision.LabelMap.from_segmented_image(segmented_image)
+        return label_map, label_map.get_masks(), {"nan": float("nan"), "one": 1.0}
+
+    array = np.zeros((40, 60, 3), dtype=np.uint8)
+    array[10:20, 5:25] = 255
+    image = Image.fromarray(array)
+
+    label_map, masks, values = segment(image)
+    assert num_calls == 1
+    assert segment.stats["misses"] == 1
+
+    # an equal image is a hit, even though it is a different object
+    cached_label_map, cached_masks, cached_values = segment(image.copy())
+    assert num_calls == 1
+    assert segment.stats["hits"] == 1
+    assert isinstance(cached_label_map, vision.LabelMap)
+    assert np.array_equal(cached_label_map.labels, label_map.labels)
+    assert np.array_equal(cached_label_map.bboxes, label_map.bboxes)
+    assert len(cached_masks) == len(masks) == 2
+    for cached_mask, mask in zip(cached_masks, masks):
+        assert isinstance(cached_mask, vision.CroppedMask)
+        assert cached_mask.bbox == mask.bbox
+        assert np.array_equal(cached_mask.data, mask.data)
+    assert np.isnan(cached_values["nan"]) and cached_values["one"] == 1.0
+
+    # results carry the same content hashes whether computed or loaded
+    assert cached_label_map.content_hash == label_map.content_hash
+    assert cache.get_content_hash(cached_masks) == cache.get_content_hash(masks)
+
+    # default arguments are part of the key, other values are not
+    segment(image, threshold=128)
+    assert num_calls == 1
+    segment(image, threshold=0)
+    assert num_calls == 2
+
+    stats = cache.get_array_cache_stats()[f"{__name__}.{segment.__qualname__}"]
+    assert stats["hit_rate"] == 0.5
@@ -1,26 +1,35 @@
 """Module to test events.py."""
 
 from functools import partial
+from pathlib import Path
 from pprint import pformat
 from typing import Callable, Optional
 import itertools
 
 from deepdiff import DeepDiff
 import pytest
+import sqlalchemy as sa
 
 from openadapt.custom_logger import logger
 from openadapt.events import (
+    OnlineEventGrouper,
     discard_unused_events,
+    get_events_batch,
+    group_action_events,
     merge_consecutive_keyboard_events,
     merge_consecutive_mouse_click_events,
     merge_consecutive_mouse_move_events,
     merge_consecutive_mouse_scroll_events,
     remove_redundant_mouse_move_events,
+    verify_event_groups,
 )
-from openadapt.models import ActionEvent, WindowEvent
+from openadapt.db.db import Base
+from openadapt.models import ActionEvent, Recording, WindowEvent
 from openadapt.utils import (
+    get_double_click_distance_pixels,
     get_double_click_interval_seconds,
     override_double_click_interval_seconds,
+    row2dict,
     rows2dicts,
 )
 
@@ -792,3 +801,184 @@ def test_discard_unused_events() -> None:
         )
     )
     assert expected_filtered_window_events == actual_filtered_window_events
+
+
+def make_online_grouper() -> OnlineEventGrouper:
+    """Create an OnlineEventGrouper with the double click interval and distance.
+
+    Returns:
+        OnlineEventGrouper: The grouper.
+    """
+    return OnlineEventGrouper(
+        get_double_click_interval_seconds(),
+        get_double_click_distance_pixels(),
+    )
+
+
+def test_online_event_grouper() -> None:
+    """Test that groups assigned online match those found by processing.
+
+    Returns:
+        None
+    """
+    double_click_interval_seconds = get_double_click_interval_seconds()
+    dt_short = double_click_interval_seconds / 10
+    dt_long = double_click_interval_seconds * 10
+
+    def make_raw_events() -> list[ActionEvent]:
+        reset_timestamp()
+        raw_events = [
+            *make_click_events(dt_long, button_name="right"),
+            # doubleclick
+            *make_click_events(dt_short),
+            *make_click_events(dt_long),
+            # type
+            *make_key_events("a"),
+            *make_key_events("b"),
+            make_scroll_event(),
+            # singleclick
+            *make_click_events(dt_long),
+            # redundant move does not interrupt the type group
+            make_move_event(),
+            *make_key_events("c"),
+            *make_key_events("d"),
+        ]
+        grouper = make_online_grouper()
+        for event in raw_events:
+            event.group_timestamp = grouper.add(
+                event.timestamp, row2dict(event, follow=False)
+            )
+        return raw_events
+
+    raw_events = make_raw_events()
+    assert raw_events[0].group_timestamp is None
+    assert len({event.group_timestamp for event in raw_events[2:6]}) == 1
+
+    online_events = group_action_events(raw_events)
+    assert [event.name for event in online_events] == [
+        "click",
+        "click",
+        "doubleclick",
+        "type",
+        "scroll",
+        "singleclick",
+        "move",
+        "type",
+    ]
+
+    processed_events = merge_consecutive_mouse_click_events(
+        merge_consecutive_keyboard_events(
+            remove_redundant_mouse_move_events(make_raw_events())
+        )
+    )
+    assert verify_event_groups(processed_events) == {
+        "num_matched": 4,
+        "num_mismatched": 0,
+        "num_unmatched_online": 0,
+    }
+
+    # grouping by the online groups replaces the keyboard and click merges (whose
+    # children differ in timestamps, since the keyboard merge shifts the clicks)
+    grouped_events = group_action_events(
+        remove_redundant_mouse_move_events(make_raw_events())
+    )
+    assert [
+        (event.name, round(event.timestamp, NUM_TIMESTAMP_DIGITS), len(event.children))
+        for event in grouped_events
+    ] == [
+        (event.name, round(event.timestamp, NUM_TIMESTAMP_DIGITS), len(event.children))
+        for event in processed_events
+    ]
+    assert verify_event_groups(grouped_events) == {
+        "num_matched": 4,
+        "num_mismatched": 0,
+        "num_unmatched_online": 0,
+    }
+
+
+def test_online_event_grouper__named_keys() -> None:
+    """Test that typing groups are split on named keys, as when processing.
+
+    Returns:
+        None
+    """
+    key_events = [
+        ("press", "a", None),
+        ("release", "a", None),
+        ("press", None, "ctrl"),
+        ("press", "c", None),
+        ("release", "c", None),
+        ("release", None, "ctrl"),
+        ("press", "f", None),
+        ("release", "f", None),
+    ]
+    grouper = make_online_grouper()
+    group_timestamps = [
+        grouper.add(
+            timestamp,
+            {"name": name, "key_char": key_char, "key_name": key_name},
+        )
+        for timestamp, (name, key_char, key_name) in enumerate(key_events)
+    ]
+    assert group_timestamps == [0, 0, 2, 2, 2, 2, 6, 6]
+
+
+def test_get_events_batch(tmp_path: Path) -> None:
+    """Test that recordings are processed in worker processes, and failures kept.
+
+    Args:
+        tmp_path (Path): The temporary directory containing the fixture database.
+
+    Returns:
+        None
+    """
+    db_url = f"sqlite:///{tmp_path / 'batch.db'}"
+    engine = sa.create_engine(db_url)
+    Base.metadata.create_all(bind=engine)
+    session = sa.orm.sessionmaker(bind=engine)()
+    recording_ids = []
+    for num_action_events in (2, 3, 0):
+        recording = Recording(
+            timestamp=len(recording_ids),
+            monitor_width=1920,
+            monitor_height=1080,
+            double_click_interval_seconds=0.5,
+            double_click_distance_pixels=5,
+            platform="win32",
+            task_description="batch",
+        )
+        session.add(recording)
+        session.flush()
+        for i in range(num_action_events):
+            session.add(
+                ActionEvent(
+                    name="move",
+                    timestamp=i,
+                    recording_id=recording.id,
+                    mouse_x=i,
+                    mouse_y=i,
+                )
+            )
+        recording_ids.append(recording.id)
+    session.commit()
+    session.close()
+    empty_recording_id = recording_ids[-1]
+    missing_recording_id = max(recording_ids) + 1
+
+    results, failures = get_events_batch(
+        recording_ids + [missing_recording_id],
+        process=False,
+        max_workers=2,
+        db_url=db_url,
+    )
+
+    assert sorted(results) == recording_ids[:2]
+    for recording_id, num_action_events in zip(recording_ids, (2, 3)):
+        event_dicts = results[recording_id]["result"]
+        assert [event_dict["mouse_x"] for event_dict in event_dicts] == list(
+            range(num_action_events)
+        )
+        assert results[recording_id]["duration"] > 0
+    assert sorted(failures) == [empty_recording_id, missing_recording_id]
+    assert "No action events found" in failures[empty_recording_id]
+    assert "No recording found" in failures[missing_recording_id]
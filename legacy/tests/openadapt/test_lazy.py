@@ -0,0 +1,150 @@
+"""Tests for the lazy event tree in the openadapt.db.lazy module."""
+
+import sqlalchemy as sa
+
+from openadapt.db.lazy import LazyEventTree
+from openadapt.models import ActionEvent, Recording, Screenshot, WindowEvent
+
+
+def create_recording(session: sa.orm.Session, num_events: int) -> Recording:
+    """Create a recording with top-level action events, each with nested children.
+
+    Args:
+        session (sa.orm.Session): The database session.
+        num_events (int): The number of top-level action events.
+
+    Returns:
+        Recording: The recording.
+    """
+    recording = Recording(
+        timestamp=0,
+        monitor_width=1920,
+        monitor_height=1080,
+        double_click_interval_seconds=0,
+        double_click_distance_pixels=0,
+        platform="Windows",
+        task_description="lazy",
+    )
+    session.add(recording)
+    session.flush()
+    for i in range(num_events):
+        screenshot = Screenshot(recording_id=recording.id, timestamp=i)
+        session.add(screenshot)
+        session.flush()
+        parent = ActionEvent(
+            name="type",
+            timestamp=i,
+            recording_id=recording.id,
+            screenshot_id=screenshot.id,
+        )
+        session.add(parent)
+        session.flush()
+        child = ActionEvent(
+            name="press",
+            key_char="a",
+            timestamp=i,
+            recording_id=recording.id,
+            parent_id=parent.id,
+        )
+        session.add(child)
+        session.flush()
+        session.add(
+            ActionEvent(
+                name="release",
+                key_char="a",
+                timestamp=i + 0.5,
+                recording_id=recording.id,
+                parent_id=child.id,
+            )
+        )
+    session.commit()
+    return recording
+
+
+def test_lazy_event_tree(db_engine: sa.engine.Engine) -> None:
+    """Test that relationships are loaded on access, one batch at a time.
+
+    Args:
+        db_engine (sa.engine.Engine): The test database engine.
+    """
+    session = sa.orm.sessionmaker(bind=db_engine)()
+    recording = create_recording(session, num_events=5)
+    recording_id = recording.id
+    session.close()
+
+    session = sa.orm.sessionmaker(bind=db_engine)()
+    recording = session.query(Recording).get(recording_id)
+    tree = LazyEventTree(session, recording, batch_size=2)
+    assert len(tree) == 5
+    assert tree.stats["num_queries"] == 1
+    assert tree.stats["num_rows"] == {"action_event": 5}
+    assert "children" not in tree[0].action_event.__dict__
+
+    children = tree[0].children
+    assert [child.name for child in children] == ["press"]
+    assert [child.name for child in children[0].children] == ["release"]
+    # one query per tree level, plus a final one which finds no further descendants
+    assert tree.stats["num_queries"] == 4
+    assert tree.stats["num_rows"]["action_event"] == 5 + 2 * 2
+    assert "children" in tree[1].action_event.__dict__
+    assert "children" not in tree[2].action_event.__dict__
+
+    # accessing another event in the same batch does not query
+    assert len(tree[1].children) == 1
+    assert tree.stats["num_queries"] == 4
+
+    assert tree[4].screenshot.timestamp == 4
+    assert tree.stats["num_rows"]["screenshot"] == 1
+    assert tree[4].window_event is None
+    assert tree[4].name == "type"
+    assert tree.stats["num_bytes"]["action_event"] > 0
+    session.close()
+
+
+def test_lazy_event_tree__window_events(db_engine: sa.engine.Engine) -> None:
+    """Test that window events are loaded with their action events.
+
+    Args:
+        db_engine (sa.engine.Engine): The test database engine.
+    """
+    session = sa.orm.sessionmaker(bind=db_engine)()
+    recording = create_recording(session, num_events=3)
+    window_event = WindowEvent(
+        recording_id=recording.id, timestamp=0, title="Calculator"
+    )
+    session.add(window_event)
+    session.flush()
+    for action_event in recording.action_events:
+        # all but the last top-level event, and all of their descendants
+        if action_event.timestamp < 2:
+            action_event.window_event_id = window_event.id
+    session.commit()
+    recording_id = recording.id
+    session.close()
+
+    session = sa.orm.sessionmaker(bind=db_engine)()
+    recording = session.query(Recording).get(recording_id)
+    tree = LazyEventTree(session, recording, batch_size=2)
+    num_queries = tree.stats["num_queries"]
+
+    window_event = tree[0].window_event
+    assert window_event.title == "Calculator"
+    assert tree[1].window_event is window_event
+    # one query for the window events, and one for their action events
+    assert tree.stats["num_queries"] == num_queries + 2
+    assert "action_events" in window_event.__dict__
+    assert [action_event.name for action_event in window_event.action_events] == [
+        "type",
+        "press",
+        "release",
+        "type",
+        "press",
+        "release",
+    ]
+    # top-level events are reused from the tree
+    assert window_event.action_events[0] is tree[0].action_event
+    assert tree.stats["num_queries"] == num_queries + 2
+
+    assert tree[2].window_event is None
+    assert tree.stats["num_queries"] == num_queries + 2
+    session.close()
@@ -0,0 +1,69 @@
+"""Tests for openadapt.adapters.local_segmentation."""
+
+import threading
+
+from PIL import Image
+import numpy as np
+
+from openadapt import vision
+from openadapt.adapters import local_segmentation
+
+
+class ThresholdModelPool:
+    """A model pool that segments the bright rectangles of an image."""
+
+    def __init__(self) -> None:
+        """Initialize the pool."""
+        self.batch_sizes = []
+
+    def predict(
+        self, images: list[Image.Image], model_name: str, **kwargs: dict
+    ) -> list[np.ndarray]:
+        """Predict one mask per bright column range of each image.
+
+        Args:
+            images: The images to segment.
+            model_name: The name of the model, which is ignored.
+            **kwargs: Ignored.
+
+        Returns:
+            list[np.ndarray]: The masks of each image.
+        """
+        self.batch_sizes.append(len(images))
+        masks = []
+        for image in images:
+            bright = np.array(image.convert("L")) > 128
+            columns = bright.any(axis=0)
+            starts = np.flatnonzero(columns & ~np.r_[False, columns[:-1]])
+            ends = np.flatnonzero(columns & ~np.r_[columns[1:], False]) + 1
+            image_masks = np.zeros((len(starts),) + bright.shape, dtype=bool)
+            for mask, start, end in zip(image_masks, starts, ends):
+                mask[:, start:end] = bright[:, start:end]
+            masks.append(image_masks)
+        return masks
+
+
+def test_segmentation_service() -> None:
+    """Test that batches are segmented at a reduced size and upscaled."""
+    array = np.zeros((300, 400, 3), dtype=np.uint8)
+    array[40:120, 40:160] = 255
+    array[200:280, 240:360] = 255
+    images = [Image.fromarray(array), Image.fromarray(array[:150, :200])]
+
+    pool = ThresholdModelPool()
+    server = local_segmentation.SegmentationServer(pool, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = local_segmentation.SegmentationClient(
+        port=server.address[1], start_server=False
+    )
+    try:
+        segmented_images = client.segment(images, max_side=200)
+    finally:
+        client.close()
+        server.close()
+
+    assert pool.batch_sizes == [2]
+    assert [image.size for image in segmented_images] == [(400, 300), (200, 150)]
+    assert [len(vision.get_label_map(image)) for image in segmented_images] == [3, 2]
+    assert client.last_latency["num_masks"] == 3
+    assert client.last_latency["round_trip_seconds"] > 0
@@ -1,6 +1,15 @@
 """Tests for openadapt.models."""
 
-from openadapt import models
+from pathlib import Path
+import io
+import threading
+import time
+
+from PIL import Image, ImageChops
+import numpy as np
+import pytest
+
+from openadapt import models, synthetic, utils, video
 
 
 def test_action_from_dict() -> None:
@@ -49,3 +58,193 @@ def test_action_from_dict() -> None:
             print(f"{input_variation=}")
             action_event = models.ActionEvent.from_dict(action_dict)
             assert action_event.text == expected_output, action_event
+
+
+def test_frame_cache(tmp_path: Path) -> None:
+    """Test that the frame cache is bounded in bytes and prefetches frames.
+
+    Args:
+        tmp_path (Path): The temporary directory.
+    """
+    video_file_path = str(tmp_path / "video.mp4")
+    timestamps = synthetic.generate_video(
+        video_file_path, duration=2, fps=10, frame_size=(160, 120), preset="ultrafast"
+    )
+    frame_num_bytes = 160 * 120 * 3
+    frame_cache = models.FrameCache(max_bytes=5 * frame_num_bytes, num_prefetch=2)
+
+    image = frame_cache.get_frame(
+        video_file_path, timestamps[0], next_timestamps=timestamps[1:]
+    )
+    assert image.size == (160, 120)
+    assert frame_cache.stats == {"hits": 0, "misses": 1, "decoded": 3, "evictions": 0}
+    assert frame_cache.num_bytes == 3 * frame_num_bytes
+
+    # prefetched frames are hits
+    for timestamp in timestamps[1:3]:
+        frame_cache.get_frame(video_file_path, timestamp)
+    assert frame_cache.stats["hits"] == 2
+    assert frame_cache.stats["misses"] == 1
+
+    # reduced resolution tiers are downscaled from cached frames without decoding
+    thumbnail = frame_cache.get_frame(video_file_path, timestamps[0], max_side=40)
+    assert thumbnail.size == (40, 30)
+    assert frame_cache.stats["decoded"] == 3
+
+    # the least recently used frames are evicted to stay within max_bytes
+    frame_cache.get_frame(
+        video_file_path, timestamps[3], next_timestamps=timestamps[4:]
+    )
+    assert frame_cache.stats["decoded"] == 6
+    assert frame_cache.num_bytes <= frame_cache.max_bytes
+    assert frame_cache.stats["evictions"] == 2
+    assert (video_file_path, timestamps[0], None) not in frame_cache.frames
+    assert (video_file_path, timestamps[0], 40) in frame_cache.frames
+    assert np.array_equal(
+        np.asarray(frame_cache.get_frame(video_file_path, timestamps[4])),
+        np.asarray(video.extract_frames(video_file_path, [timestamps[4]])[0]),
+    )
+
+
+def test_frame_prefetcher(tmp_path: Path) -> None:
+    """Test that frames are decoded ahead of the consumer, once each.
+
+    Args:
+        tmp_path (Path): The temporary directory.
+    """
+    video_file_path = str(tmp_path / "video.mp4")
+    timestamps = synthetic.generate_video(
+        video_file_path, duration=2, fps=10, frame_size=(160, 120), preset="ultrafast"
+    )
+    expected_frames = video.extract_frames(video_file_path, timestamps)
+    frame_cache = models.FrameCache(num_prefetch=0)
+    with models.FramePrefetcher(
+        video_file_path, timestamps, window=6, cache=frame_cache
+    ) as prefetcher:
+        for timestamp, expected_frame in zip(timestamps, expected_frames):
+            frame = prefetcher.get_frame(timestamp)
+            assert np.array_equal(np.asarray(frame), np.asarray(expected_frame))
+            # simulate the consumer's work
+            time.sleep(0.01)
+    assert prefetcher.stats["num_frames"] == len(timestamps)
+    assert prefetcher.stats["num_stalls"] < len(timestamps)
+    assert prefetcher.stats["decode_seconds"] > 0
+    # the consumer's requests are hits
+    assert frame_cache.stats["decoded"] == len(set(timestamps))
+    assert frame_cache.stats["misses"] == 0
+
+    # stopping early doesn't wait for the remaining frames
+    frame_cache = models.FrameCache()
+    with models.FramePrefetcher(
+        video_file_path, timestamps, window=4, cache=frame_cache
+    ) as prefetcher:
+        prefetcher.get_frame(timestamps[0])
+    assert frame_cache.stats["decoded"] < len(timestamps)
+
+
+def test_screenshot_image_at() -> None:
+    """Test that downscaled images are served from the thumbnail pyramid."""
+    image = Image.fromarray(
+        np.random.default_rng(0).integers(0, 256, (600, 800, 3), dtype=np.uint8)
+    )
+    thumbnails = models.Screenshot.get_thumbnails(image)
+    assert {scale: thumbnail.size for scale, thumbnail in thumbnails.items()} == {
+        2: (400, 300),
+        4: (200, 150),
+        8: (100, 75),
+    }
+
+    screenshot = models.Screenshot(
+        png_data=b"", **models.Screenshot.get_thumbnail_data(image)
+    )
+    assert screenshot.image_at(100).size == (100, 75)
+    assert max(screenshot.image_at(150).size) == 150
+    assert screenshot.image_at(400).size == (400, 300)
+    assert np.array_equal(
+        np.asarray(screenshot.image_at(200)), np.asarray(thumbnails[4])
+    )
+    # served from stored thumbnails without loading the image
+    assert screenshot._image is None
+
+    # generated from the image if thumbnails were not stored
+    screenshot = models.Screenshot(image=image)
+    assert np.array_equal(
+        np.asarray(screenshot.image_at(200)), np.asarray(thumbnails[4])
+    )
+    assert screenshot.image_at(1000) is image
+    assert screenshot.image_at() is image
+
+
+def test_recording_screenshot_timestamps() -> None:
+    """Test that screenshot timestamps are built once per recording."""
+    recording = models.Recording(
+        screenshots=[models.Screenshot(timestamp=timestamp) for timestamp in (1, 2)]
+    )
+    screenshot_timestamps = recording.screenshot_timestamps
+    assert screenshot_timestamps == [1, 2]
+    assert recording.screenshot_timestamps is screenshot_timestamps
+
+    recording.screenshots.append(models.Screenshot(timestamp=3))
+    assert recording.screenshot_timestamps == [1, 2, 3]
+
+
+def test_screenshot_diff(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that diffs are computed once, and batched like individually."""
+    rng = np.random.default_rng(0)
+    arrays = [rng.integers(0, 64, (60, 80, 3), dtype=np.uint8)]
+    for top in range(0, 50, 10):
+        array = arrays[-1].copy()
+        array[top : top + 5, 10:20] = 255
+        # a small change, e.g. from compression, which is not in the mask
+        array[top + 5, 40] += 1
+        arrays.append(array)
+    screenshots = [models.Screenshot(image=Image.fromarray(arrays[0]))]
+    for array in arrays[1:]:
+        buffer = io.BytesIO()
+        Image.fromarray(array).save(buffer, format="PNG")
+        screenshot = models.Screenshot(png_data=buffer.getvalue())
+        screenshot.prev = screenshots[-1]
+        screenshots.append(screenshot)
+    screenshots[0].prev = screenshots[0]
+
+    screenshot = screenshots[2]
+    assert screenshot.diff is screenshot.diff
+    assert np.array_equal(
+        np.asarray(screenshot.diff),
+        np.abs(arrays[2].astype(int) - arrays[1].astype(int)),
+    )
+    assert screenshot.diff_mask is screenshot.diff_mask
+    expected_diff_mask = ImageChops.difference(
+        Image.fromarray(arrays[2]), Image.fromarray(arrays[1])
+    ).convert("1")
+    assert np.array_equal(
+        np.asarray(screenshot.diff_mask), np.asarray(expected_diff_mask)
+    )
+    assert screenshot.diff_bboxes == [[10, 10, 20, 15]]
+    assert screenshots[0].diff_bboxes == []
+
+    # images which are not stored as PNG (e.g. video frames) are loaded lazily,
+    # which is not thread safe, so they must only be loaded on the calling thread
+    image_threads = set()
+    image_property = models.Screenshot.image
+
+    def get_image(screenshot: models.Screenshot) -> Image.Image:
+        image_threads.add(threading.current_thread())
+        return image_property.fget(screenshot)
+
+    monkeypatch.setattr(models.Screenshot, "image", property(get_image))
+    diff_datas = models.Screenshot.get_diff_datas(screenshots, chunk_size=2)
+    assert image_threads == {threading.current_thread()}
+    assert diff_datas == [
+        models.Screenshot.get_diff_data(array, prev_array)
+        for array, prev_array in zip(arrays, arrays[:1] + arrays)
+    ]
+    assert models.Screenshot.get_diff_data(arrays[2], arrays[1]) == {
+        "packed_diff_mask_data": utils.pack_mask(np.asarray(expected_diff_mask)),
+        "diff_bboxes_data": [[10, 10, 20, 15]],
+    }
+    stored_screenshot = models.Screenshot(**diff_datas[2])
+    assert stored_screenshot.diff_bboxes == [[10, 10, 20, 15]]
+    assert np.array_equal(
+        np.asarray(stored_screenshot.diff_mask), np.asarray(screenshot.diff_mask)
+    )
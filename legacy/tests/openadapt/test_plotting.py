@@ -0,0 +1,42 @@
+"""Tests for Set-of-Mark rendering in openadapt.plotting."""
+
+from PIL import Image
+import numpy as np
+
+from openadapt import plotting, vision
+
+
+def test_get_marked_image() -> None:
+    """Test that masks are blended and outlined, and marks drawn at centroids."""
+    image = Image.new("RGB", (200, 100), (128, 128, 128))
+    masks = []
+    for left in (20, 120):
+        mask = np.zeros((100, 200), dtype=np.uint8)
+        mask[20:80, left : left + 60] = 1
+        masks.append(vision.CroppedMask.from_array(mask))
+    colors = plotting.get_mark_colors()
+
+    unmarked_image = plotting.get_marked_image(
+        image, masks, include_masks=False, include_marks=False
+    )
+    assert np.array_equal(np.array(unmarked_image), np.array(image))
+
+    marked_arr = np.array(
+        plotting.get_marked_image(image, masks, include_marks=False)
+    ).astype(int)
+    for label, left in enumerate((20, 120), 1):
+        color = colors[label].astype(int)
+        # interior pixels are blended with the mask color, edges take it
+        expected = 128 + (color - 128) * plotting.MARK_MASK_ALPHA
+        assert np.abs(marked_arr[30, left + 5] - expected).max() <= 1
+        assert np.array_equal(marked_arr[20, left + 5], color)
+    assert np.array_equal(marked_arr[5, 5], [128, 128, 128])
+
+    # labels are drawn on a dark background around each centroid
+    marked_arr = np.array(
+        plotting.get_marked_image(image, masks, include_masks=False)
+    ).astype(int)
+    for x in (50, 150):
+        assert (marked_arr[45:55, x - 10 : x + 10] == 255).any()
+        assert (marked_arr[45:55, x - 10 : x + 10] < 64).any()
+    assert np.array_equal(marked_arr[5, 5], [128, 128, 128])
@@ -0,0 +1,123 @@
+"""Tests for openadapt.segmentation_store."""
+
+from pathlib import Path
+from types import SimpleNamespace
+import io
+
+from PIL import Image
+import numpy as np
+
+from openadapt import segmentation_store, synthetic, vision
+from openadapt.segmentation_store import SegmentationStore
+
+
+def get_segmentation(seed: int) -> SimpleNamespace:
+    """Get a segmentation of a synthetic window.
+
+    Args:
+        seed (int): The random seed of the window and its segments.
+
+    Returns:
+        SimpleNamespace: An object with the attributes of
+            strategies.visual.Segmentation.
+    """
+    (png_data,) = synthetic.get_screenshot_png_datas((320, 240), 1, seed)
+    image = Image.open(io.BytesIO(png_data))
+    segmented_image = synthetic.get_segmented_image((320, 240), 50, seed)
+    masks = vision.refine_masks(vision.get_label_map(segmented_image))
+    bounding_boxes, centroids = vision.calculate_bounding_boxes(masks)
+    return SimpleNamespace(
+        image=image,
+        marked_image=image.convert("L"),
+        masked_images=vision.extract_masked_images(image, masks),
+        descriptions=[f"segment {i}" for i in range(len(masks))],
+        bounding_boxes=bounding_boxes,
+        centroids=centroids,
+        masks=masks,
+    )
+
+
+def test_segmentation_store(tmp_path: Path) -> None:
+    """Test that segmentations are found across store instances and evicted LRU.
+
+    Args:
+        tmp_path (Path): The temporary directory of the store.
+    """
+    segmentations = [get_segmentation(seed) for seed in range(3)]
+    store = SegmentationStore(tmp_path)
+    for segmentation in segmentations:
+        store.add(segmentation)
+    assert len(store) == 3
+
+    # a new store, as in a new replay, finds the segmentations on disk
+    store = SegmentationStore(tmp_path)
+    assert len(store) == 3
+    segmentation = segmentations[0]
+    fields, diff = store.find_similar(segmentation.image, min_ssim=0.9)
+    assert fields is not None
+    assert diff.shape == (240, 320)
+    assert np.array_equal(np.array(fields["image"]), np.array(segmentation.image))
+    assert fields["descriptions"] == segmentation.descriptions
+    assert fields["bounding_boxes"] == segmentation.bounding_boxes
+    assert fields["centroids"] == segmentation.centroids
+    for mask, expected_mask in zip(fields["masks"], segmentation.masks):
+        assert np.array_equal(mask.to_array(), expected_mask.to_array())
+    for image, expected_image in zip(
+        fields["masked_images"], segmentation.masked_images
+    ):
+        assert np.array_equal(np.array(image), np.array(expected_image))
+
+    # recency is only saved with added segmentations, or when flushed (at exit)
+    index_file_path = tmp_path / segmentation_store.INDEX_FILE_NAME
+    index_data = index_file_path.read_bytes()
+    store.find_similar(segmentations[2].image, min_ssim=0.9)
+    assert index_file_path.read_bytes() == index_data
+    store.flush()
+    assert index_file_path.read_bytes() != index_data
+    index_data = index_file_path.read_bytes()
+    store.flush()
+    assert index_file_path.read_bytes() == index_data
+    assert [path.name for path in tmp_path.glob("*.tmp")] == []
+    store.find_similar(segmentation.image, min_ssim=0.9)
+
+    # the segmentation just found is the most recently used, so it is kept
+    store.max_bytes = store.num_bytes - 1
+    store.add(get_segmentation(3))
+    store = SegmentationStore(tmp_path)
+    assert len(store) == 2
+    assert store.find_similar(segmentation.image, min_ssim=0.9)[0] is not None
+    assert store.find_similar(segmentations[1].image, min_ssim=0.9) == (None, None)
+
+
+def test_segmentation_store__concurrent(tmp_path: Path) -> None:
+    """Test that concurrent stores merge their indexes and share the size limit.
+
+    Args:
+        tmp_path (Path): The temporary directory of the stores.
+    """
+    segmentations = [get_segmentation(seed) for seed in range(3)]
+    store_a = SegmentationStore(tmp_path)
+    store_b = SegmentationStore(tmp_path)
+    store_a.add(segmentations[0])
+    store_b.add(segmentations[1])
+    assert len(store_b) == 2
+    assert len(SegmentationStore(tmp_path)) == 2
+
+    # the segmentation found by store_a is kept when store_b exceeds the limit
+    assert store_a.find_similar(segmentations[0].image, min_ssim=0.9)[0] is not None
+    store_a.flush()
+    scratch_store = SegmentationStore(tmp_path / "scratch")
+    scratch_store.add(segmentations[2])
+    store_b.max_bytes = store_b.num_bytes + scratch_store.num_bytes - 1
+    store_b.add(segmentations[2])
+    assert len(store_b) == 2
+    assert len(list(tmp_path.glob("*.npz"))) == 3  # including the index arrays
+    assert store_a.find_similar(segmentations[1].image, min_ssim=0.9) == (None, None)
+    assert len(store_a) == 1
+
+    # files which are not in the index are deleted when it is loaded
+    orphan_file_path = tmp_path / f"{0:016x}.npz"
+    orphan_file_path.write_bytes(b"0" * 100)
+    store = SegmentationStore(tmp_path)
+    assert len(store) == 2
+    assert not orphan_file_path.exists()
@@ -0,0 +1,57 @@
+"""Tests for the synthetic recording generator in openadapt.synthetic."""
+
+import sqlalchemy as sa
+
+from openadapt import browser, events, synthetic
+from openadapt.db import crud
+
+
+def test_generate_recording(db_engine: sa.engine.Engine) -> None:
+    """Test that synthetic recordings are written and processed like real ones.
+
+    Args:
+        db_engine (sa.engine.Engine): The test database engine.
+    """
+    session = sa.orm.sessionmaker(bind=db_engine)()
+    recording = synthetic.generate_recording(
+        session,
+        num_moves=2,
+        num_clicks=3,
+        num_key_bursts=2,
+        key_burst_length=4,
+        num_scrolls=1,
+        num_window_switches=2,
+        browser_event_fraction=1,
+        screenshot_size=(160, 120),
+    )
+
+    action_events = crud.get_action_events(session, recording)
+    window_events = crud.get_window_events(session, recording)
+    screenshots = crud.get_screenshots(session, recording)
+    browser_events = crud.get_browser_events(session, recording)
+    num_clicks = len([event for event in action_events if event.name == "click"]) // 2
+    assert len(action_events) == (
+        2 * synthetic.MOVE_SEGMENT_LENGTH
+        + num_clicks * 2
+        + 2 * 4 * 2
+        + synthetic.SCROLL_SEGMENT_LENGTH
+    )
+    assert len(window_events) == 3
+    assert len(screenshots) == 2 + 3 + 2 + 1
+    assert screenshots[0].image.size == (160, 120)
+    assert all(event.screenshot_id for event in action_events)
+    assert all(event.window_event_id for event in action_events)
+    # one browser event per action, except for mouse button presses
+    assert len(browser_events) == len(action_events) - num_clicks
+
+    browser.assign_browser_events(session, action_events, browser_events)
+    assert all(
+        event.browser_event_id for event in action_events if event.name != "click"
+    )
+    action_events, _, _, _ = events.merge_events(
+        session, action_events, window_events, screenshots, browser_events
+    )
+    names = {event.name for event in action_events}
+    assert "type" in names
+    assert names & {"singleclick", "doubleclick"}
+    session.close()
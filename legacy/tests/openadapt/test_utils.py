@@ -2,8 +2,12 @@
 
 from unittest.mock import patch
 
+from PIL import Image
+import numpy as np
+
 from openadapt import utils
 from openadapt.config import config
+from openadapt.models import ActionEvent
 
 
 def test_get_scale_ratios() -> None:
@@ -35,3 +39,90 @@ def test_posthog_capture() -> None:
                 },
                 distinct_id=config.UNIQUE_USER_ID,
             )
+
+
+def test_row2dict_matches_asdict() -> None:
+    """Tests that utils.row2dict matches ActionEvent.asdict."""
+    event = ActionEvent(
+        name="type",
+        timestamp=0,
+        children=[
+            ActionEvent(name="press", key_char="a", timestamp=0),
+            ActionEvent(name="release", key_char="a", timestamp=1),
+        ],
+    )
+    to_follow = {"children": {}}
+    to_follow["children"]["follow"] = to_follow
+    expected = event.asdict(follow=to_follow, include=utils.ROW_DICT_INCLUDE)
+    assert utils.row2dict(event) == expected
+    del expected["children"]
+    assert utils.row2dict(event, follow=False) == expected
+
+
+def test_rows2dicts() -> None:
+    """Tests that utils.rows2dicts drops empty and constant columns."""
+    events = [
+        ActionEvent(name="click", timestamp=0, mouse_x=1, element_state={"a": 1}),
+        ActionEvent(name="click", timestamp=1, mouse_x=2, element_state={"a": 1}),
+        ActionEvent(name="click", timestamp=2, element_state={"a": 1}),
+    ]
+    event_dicts = utils.rows2dicts(events, drop_cols=["reducer_names"])
+    assert event_dicts == [
+        {"timestamp": 0, "mouse_x": 1},
+        {"timestamp": 1, "mouse_x": 2},
+        {"timestamp": 2},
+    ]
+    event_dicts = utils.rows2dicts(events, drop_constant=False)
+    assert all(event_dict["name"] == "click" for event_dict in event_dicts)
+    assert all(event_dict["element_state"] == {"a": 1} for event_dict in event_dicts)
+
+
+def test_get_mask_bboxes() -> None:
+    """Test that nearby changes are grouped into tight bounding boxes."""
+    mask = np.zeros((100, 130), dtype=bool)
+    # two nearby changes, e.g. characters of a word
+    mask[10:12, 20:25] = True
+    mask[11:14, 30:33] = True
+    # a change at the edge of the mask, whose size is not a multiple of the blocks
+    mask[95:100, 120:130] = True
+    assert utils.get_mask_bboxes(mask) == [[20, 10, 33, 14], [120, 95, 130, 100]]
+    assert utils.get_mask_bboxes(mask, block_size=2) == [
+        [20, 10, 25, 12],
+        [30, 11, 33, 14],
+        [120, 95, 130, 100],
+    ]
+    assert utils.get_mask_bboxes(np.zeros((10, 10), dtype=bool)) == []
+
+    packed_mask = utils.pack_mask(mask)
+    assert len(packed_mask) < mask.size // 8
+    assert np.array_equal(utils.unpack_mask(packed_mask), mask)
+
+
+def test_image2utf8_cache() -> None:
+    """Test that encoded images are cached by contents and encoding parameters."""
+    utils.image_encode_cache.clear()
+    stats = dict(utils.image_encode_cache.stats)
+    image = Image.fromarray(
+        np.random.default_rng(0).integers(0, 256, (60, 80, 3), dtype=np.uint8)
+    )
+    image_utf8 = utils.image2utf8(image)
+    assert utils.image2utf8(image.copy()) == image_utf8
+    assert utils.image2utf8(image, "PNG") != image_utf8
+    small_image_utf8 = utils.image2utf8(image, max_side=40)
+    assert utils.utf82image(small_image_utf8).size == (40, 30)
+    assert utils.image_encode_cache.stats["hits"] == stats["hits"] + 1
+    assert utils.image_encode_cache.stats["misses"] == stats["misses"] + 3
+
+    key = utils.image_encode_cache.get_key(image, "JPEG")
+    image.tobytes = None
+    assert utils.image_encode_cache.get_key(image, "JPEG") == key
+
+    cache = utils.ImageEncodeCache(max_bytes=10)
+    cache.put(("a",), "01234")
+    cache.put(("b",), "56789")
+    assert cache.get(("a",)) == "01234"
+    cache.put(("c",), "abcde")
+    assert cache.get(("b",)) is None
+    assert cache.num_bytes == 10
+    assert cache.stats == {"hits": 1, "misses": 1, "evictions": 1}
+    assert cache.hit_rate == 0.5
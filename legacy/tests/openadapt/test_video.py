@@ -1,6 +1,418 @@
 """Module to test openadapt.video."""
 
-# from openadapt import models, video
+from pathlib import Path
+import io
+import os
+import random
+import shutil
 
+from PIL import Image
+import av
+import numpy as np
+import pytest
+
+from openadapt import synthetic, utils, video
 
 # TODO: compare diff shown in deprecated.visualize(diff_video=True)
+
+
+@pytest.fixture(scope="module")
+def video_file_path(tmp_path_factory: pytest.TempPathFactory) -> str:
+    """Generate a synthetic video with frequent key frames.
+
+    Args:
+        tmp_path_factory (pytest.TempPathFactory): The temporary path factory.
+
+    Returns:
+        str: The path to the video file.
+    """
+    video_file_path = str(tmp_path_factory.mktemp("video") / "video.mp4")
+    synthetic.generate_video(
+        video_file_path,
+        duration=10,
+        fps=10,
+        frame_size=(160, 120),
+        gop_size=10,
+        preset="ultrafast",
+    )
+    return video_file_path
+
+
+@pytest.fixture(scope="module")
+def unindexed_video_file_path(
+    video_file_path: str, tmp_path_factory: pytest.TempPathFactory
+) -> str:
+    """Copy the synthetic video without its frame index.
+
+    Args:
+        video_file_path (str): The path to the video file.
+        tmp_path_factory (pytest.TempPathFactory): The temporary path factory.
+
+    Returns:
+        str: The path to the copied video file.
+    """
+    unindexed_video_file_path = str(tmp_path_factory.mktemp("unindexed") / "video.mp4")
+    shutil.copy(video_file_path, unindexed_video_file_path)
+    return unindexed_video_file_path
+
+
+def decode_frames(video_file_path: str) -> tuple[list[float], list[np.ndarray]]:
+    """Decode every frame of a video.
+
+    Args:
+        video_file_path (str): The path to the video file.
+
+    Returns:
+        tuple: The timestamp and RGB array of each frame.
+    """
+    video_container = av.open(video_file_path)
+    video_stream = video_container.streams.video[0]
+    frame_timestamps = []
+    frame_arrays = []
+    for frame in video_container.decode(video_stream):
+        frame_timestamps.append(float(frame.pts * video_stream.time_base))
+        frame_arrays.append(frame.to_ndarray(format="rgb24"))
+    video_container.close()
+    return frame_timestamps, frame_arrays
+
+
+def get_timestamps_by_access(frame_timestamps: list[float]) -> dict[str, list]:
+    """Get timestamps to extract with different access patterns.
+
+    Args:
+        frame_timestamps (list[float]): The timestamp of each frame.
+
+    Returns:
+        dict[str, list]: Access pattern -> timestamps.
+    """
+    rng = random.Random(0)
+    return {
+        "sequential": frame_timestamps,
+        "sparse": frame_timestamps[::15],
+        "single_frame": frame_timestamps[-5:-4],
+        # unsorted, with duplicates and timestamps between frames
+        "random": [
+            timestamp + rng.uniform(-0.03, 0.03)
+            for timestamp in rng.sample(frame_timestamps, 20) * 2
+        ],
+    }
+
+
+@pytest.mark.parametrize("seek_threshold", [0, video.SEEK_THRESHOLD_SECONDS, np.inf])
+def test_extract_frames(unindexed_video_file_path: str, seek_threshold: float) -> None:
+    """Test that the closest frame is extracted regardless of access pattern.
+
+    Args:
+        unindexed_video_file_path (str): The path to a video file without an index.
+        seek_threshold (float): The seek threshold passed to extract_frames.
+    """
+    frame_timestamps, frame_arrays = decode_frames(unindexed_video_file_path)
+    for access, timestamps in get_timestamps_by_access(frame_timestamps).items():
+        frames = video.extract_frames(
+            unindexed_video_file_path, timestamps, seek_threshold=seek_threshold
+        )
+        assert len(frames) == len(timestamps), access
+        for timestamp, frame in zip(timestamps, frames):
+            frame_idx = np.argmin(np.abs(np.array(frame_timestamps) - timestamp))
+            assert np.array_equal(np.asarray(frame), frame_arrays[frame_idx]), access
+
+
+def test_extract_frames__seeks(unindexed_video_file_path: str) -> None:
+    """Test that videos without an index are only seeked past the next key frame.
+
+    Args:
+        unindexed_video_file_path (str): The path to a video file without an index,
+            with a key frame every second.
+    """
+    # the key frame interval is not known until two key frames were decoded
+    stats = {}
+    video.extract_frames(
+        unindexed_video_file_path, [0, 1.5], seek_threshold=0, stats=stats
+    )
+    assert stats["num_seeks"] == 0
+
+    # the key frame preceding 1.5 is behind the decoder, that preceding 5.5 ahead
+    seek_stats = {}
+    timestamps = [0, 1.05, 1.5, 5.5]
+    video.extract_frames(
+        unindexed_video_file_path, timestamps, seek_threshold=0, stats=seek_stats
+    )
+    assert seek_stats["num_seeks"] == 1
+
+    no_seek_stats = {}
+    video.extract_frames(
+        unindexed_video_file_path, timestamps, seek_threshold=10, stats=no_seek_stats
+    )
+    assert no_seek_stats["num_seeks"] == 0
+    assert seek_stats["num_decoded"] < no_seek_stats["num_decoded"]
+
+
+def test_extract_frames__missing(video_file_path: str) -> None:
+    """Test that timestamps without a frame within tolerance raise.
+
+    Args:
+        video_file_path (str): The path to the video file.
+    """
+    with pytest.raises(Exception, match="No frame within tolerance"):
+        video.extract_frames(video_file_path, [1, 100])
+
+
+def test_frame_index(video_file_path: str) -> None:
+    """Test that the frame index written with the video matches its frames.
+
+    Args:
+        video_file_path (str): The path to the video file.
+    """
+    frame_index = video.FrameIndex.load(video_file_path)
+    assert os.path.exists(video.get_frame_index_file_path(video_file_path))
+    frame_timestamps, _ = decode_frames(video_file_path)
+    assert len(frame_index) == len(frame_timestamps)
+    assert [
+        float(pts * frame_index.time_base) for pts in frame_index.pts
+    ] == frame_timestamps
+    # one screenshot timestamp per frame, including the repeated last frame
+    assert frame_index.timestamps[:3] == [0, 0.1, 0.2]
+    assert frame_index.timestamps[-1] == frame_index.timestamps[-2]
+    assert frame_index.keyframe_numbers[:3] == [0, 10, 20]
+    assert frame_index.find(0.31) == 3
+    assert frame_index.find(0.36) == 4
+    assert frame_index.find(100) == len(frame_index) - 1
+    assert frame_index.get_keyframe_number(15) == 10
+
+    built_frame_index = video.FrameIndex.build(video_file_path)
+    assert built_frame_index.pts == frame_index.pts
+    assert built_frame_index.pos == frame_index.pos
+    assert built_frame_index.is_keyframe == frame_index.is_keyframe
+    assert built_frame_index.screenshot_timestamps is None
+
+
+def test_extract_frames__indexed(video_file_path: str) -> None:
+    """Test that the frame written closest to each timestamp is extracted.
+
+    Args:
+        video_file_path (str): The path to the video file.
+    """
+    frame_index = video.FrameIndex.load(video_file_path)
+    _, frame_arrays = decode_frames(video_file_path)
+    timestamps_by_access = get_timestamps_by_access(frame_index.timestamps)
+    for access, timestamps in timestamps_by_access.items():
+        frames = video.extract_frames(video_file_path, timestamps)
+        assert len(frames) == len(timestamps), access
+        for timestamp, frame in zip(timestamps, frames):
+            frame_idx = np.argmin(np.abs(np.array(frame_index.timestamps) - timestamp))
+            assert np.array_equal(np.asarray(frame), frame_arrays[frame_idx]), access
+
+    with pytest.raises(Exception, match="No frame within tolerance"):
+        video.extract_frames(video_file_path, [1, 100])
+
+
+def test_get_encode_options() -> None:
+    """Test that encode profile options can be overridden."""
+    assert video.get_encode_options("lossless_fast") == {
+        "qp": "0",
+        "preset": "ultrafast",
+    }
+    assert video.get_encode_options("lossless_fast", crf=10, preset="fast") == {
+        "crf": "10",
+        "preset": "fast",
+    }
+    with pytest.raises(AssertionError):
+        video.get_encode_options("unknown")
+
+
+def test_transcode_video(video_file_path: str, tmp_path: Path) -> None:
+    """Test that transcoding to the archival profile is lossless and reindexes.
+
+    Args:
+        video_file_path (str): The path to the video file.
+        tmp_path (Path): The temporary directory.
+    """
+    output_path = video.transcode_video(
+        video_file_path, str(tmp_path / "archival.mp4"), profile="archival"
+    )
+    _, frame_arrays = decode_frames(video_file_path)
+    _, transcoded_frame_arrays = decode_frames(output_path)
+    assert len(transcoded_frame_arrays) == len(frame_arrays)
+    assert all(
+        np.array_equal(frame_array, transcoded_frame_array)
+        for frame_array, transcoded_frame_array in zip(
+            frame_arrays, transcoded_frame_arrays
+        )
+    )
+    frame_index = video.FrameIndex.load(video_file_path)
+    transcoded_frame_index = video.FrameIndex.load(output_path)
+    assert transcoded_frame_index.timestamps == frame_index.timestamps
+    assert len(transcoded_frame_index) == len(frame_index)
+
+
+def test_write_video_frame__bgra(tmp_path: Path) -> None:
+    """Test that BGRA arrays are encoded like the equivalent images.
+
+    Args:
+        tmp_path (Path): The temporary directory.
+    """
+    utils.set_start_time()
+    rng = np.random.default_rng(0)
+    bgras = [rng.integers(0, 256, (120, 160, 4), dtype=np.uint8) for _ in range(3)]
+    frame_arrays_by_path = {}
+    for as_image in (False, True):
+        video_file_path = str(tmp_path / f"{as_image=}.mp4")
+        video_container, video_stream, _ = video.initialize_video_writer(
+            video_file_path, 160, 120, fps=10
+        )
+        last_pts = -1
+        for frame_idx, bgra in enumerate(bgras):
+            screenshot = utils.bgra2image(bgra) if as_image else bgra
+            last_pts = video.write_video_frame(
+                video_container,
+                video_stream,
+                screenshot,
+                frame_idx / 10,
+                0,
+                last_pts,
+            )
+        video.finalize_video_writer(
+            video_container,
+            video_stream,
+            0,
+            screenshot,
+            len(bgras) / 10,
+            last_pts,
+            video_file_path,
+        )
+        _, frame_arrays_by_path[as_image] = decode_frames(video_file_path)
+
+    for bgra_frame_array, image_frame_array, bgra in zip(
+        frame_arrays_by_path[False], frame_arrays_by_path[True], bgras
+    ):
+        assert np.array_equal(bgra_frame_array, image_frame_array)
+        # lossless up to color conversion
+        rgb = bgra[:, :, 2::-1].astype(int)
+        assert np.abs(bgra_frame_array.astype(int) - rgb).max() <= 2
+
+
+def test_segmented_video(video_file_path: str, tmp_path: Path) -> None:
+    """Test that frames are extracted across segments like from a single file.
+
+    Args:
+        video_file_path (str): The path to the single file video.
+        tmp_path (Path): The temporary directory.
+    """
+    segmented_video_file_path = str(tmp_path / "video.mp4")
+    timestamps = synthetic.generate_video(
+        segmented_video_file_path,
+        duration=10,
+        fps=10,
+        frame_size=(160, 120),
+        gop_size=10,
+        preset="ultrafast",
+        segment_duration=3,
+    )
+    assert not os.path.exists(segmented_video_file_path)
+    manifest = video.VideoManifest.load(segmented_video_file_path)
+    assert manifest.complete
+    assert [segment["start_timestamp"] for segment in manifest.segments] == [
+        0,
+        3,
+        6,
+        9,
+    ]
+    # each segment repeats its last frame
+    assert sum(segment["num_frames"] for segment in manifest.segments) == 100 + 4
+    assert manifest.find(2.94) == 0
+    assert manifest.find(2.96) == 1
+    # manifest, segments and their frame indexes
+    assert len(video.get_video_file_paths(segmented_video_file_path)) == 1 + 4 + 4
+
+    timestamps += [2.96, 5.94, 100]
+    with pytest.raises(Exception, match="No frame within tolerance"):
+        video.extract_frames(segmented_video_file_path, timestamps)
+    timestamps.pop()
+    frames = video.extract_frames(segmented_video_file_path, timestamps)
+    expected_frames = video.extract_frames(video_file_path, timestamps)
+    for frame, expected_frame in zip(frames, expected_frames):
+        assert np.array_equal(np.asarray(frame), np.asarray(expected_frame))
+
+
+def test_segmented_video_writer__in_progress(tmp_path: Path) -> None:
+    """Test that frames are extracted from finalized segments while writing.
+
+    Args:
+        tmp_path (Path): The temporary directory.
+    """
+    video_file_path = str(tmp_path / "video.mp4")
+    utils.set_start_time()
+    video_writer = video.SegmentedVideoWriter(
+        video_file_path, 160, 120, segment_duration=1, video_start_timestamp=0
+    )
+    rng = np.random.default_rng(0)
+    for frame_idx in range(15):
+        bgra = rng.integers(0, 256, (120, 160, 4), dtype=np.uint8)
+        video_writer.write_frame(bgra, frame_idx / 10)
+    manifest = video.VideoManifest.load(video_file_path)
+    assert len(manifest) == 1
+    assert not manifest.complete
+    assert len(video.extract_frames(video_file_path, [0, 0.5, 0.9])) == 3
+    with pytest.raises(Exception, match="No frame within tolerance"):
+        video.extract_frames(video_file_path, [1.2])
+
+    video_writer.finalize()
+    manifest = video.VideoManifest.load(video_file_path)
+    assert len(manifest) == 2
+    assert manifest.complete
+    assert len(video.extract_frames(video_file_path, [1.2])) == 1
+
+
+def test_extract_frames__allow_missing(
+    video_file_path: str, unindexed_video_file_path: str
+) -> None:
+    """Test that missing frames are None if allowed, with and without an index.
+
+    Args:
+        video_file_path (str): The path to the video file.
+        unindexed_video_file_path (str): The path to the video file without an index.
+    """
+    for file_path in (video_file_path, unindexed_video_file_path):
+        with pytest.raises(Exception, match="No frame within tolerance"):
+            video.extract_frames(file_path, [0, 100])
+        frames = video.extract_frames(file_path, [0, 100, 0.5], allow_missing=True)
+        assert frames[1] is None
+        assert [frame.size for frame in frames[::2]] == [
+            frame.size for frame in video.extract_frames(file_path, [0, 0.5])
+        ]
+
+
+def test_verify_frames(video_file_path: str) -> None:
+    """Test that video frames are compared to their screenshots.
+
+    Args:
+        video_file_path (str): The path to the video file.
+    """
+    frame_index = video.FrameIndex.load(video_file_path)
+    _, frame_arrays = decode_frames(video_file_path)
+    timestamps = frame_index.timestamps[:-1:7]
+    frame_arrays = frame_arrays[:-1:7]
+    image_arrays = [frame_array.copy() for frame_array in frame_arrays]
+    image_arrays[1][0, 0] += np.array([10, 0, 0], dtype=np.uint8)
+    png_datas = []
+    for image_array in image_arrays:
+        buffer = io.BytesIO()
+        Image.fromarray(image_array).save(buffer, format="PNG")
+        png_datas.append(buffer.getvalue())
+
+    results = video.verify_frames(video_file_path, timestamps, png_datas, chunk_size=4)
+    assert len(results) == len(timestamps)
+    assert results[0] == (float("inf"), 0)
+    psnr, max_abs_diff = results[1]
+    assert max_abs_diff == 10
+    assert psnr == video.get_frame_diff_stats(frame_arrays[1], image_arrays[1])[0]
+    assert all(result == (float("inf"), 0) for result in results[2:])
+
+    # only the missing frame of a chunk is None
+    results = video.verify_frames(
+        video_file_path,
+        timestamps[:2] + [100] + timestamps[3:4],
+        png_datas[:4],
+        chunk_size=4,
+    )
+    assert results == [(float("inf"), 0), (psnr, 10), None, (float("inf"), 0)]
@@ -1,10 +1,14 @@
 """Tests for vision.py."""
 
+import io
+
 import pytest
 from PIL import Image
+from scipy.ndimage import binary_fill_holes
+from skimage.metrics import structural_similarity as ssim
 import numpy as np
 
-from openadapt import vision
+from openadapt import synthetic, vision
 
 
 @pytest.fixture
@@ -123,5 +127,265 @@ def test_size_similarity(
             ), f"Size similarity should be between 0 and 1, got {size_sim}"
 
 
+@pytest.fixture
+def segmented_image() -> Image.Image:
+    """Generate a synthetic segmented image with overlapping and nested segments."""
+    rng = np.random.default_rng(0)
+    image = np.zeros((200, 300, 3), dtype=np.uint8)
+    for _ in range(30):
+        top, left = rng.integers(0, 190), rng.integers(0, 290)
+        height, width = rng.integers(3, 80), rng.integers(3, 100)
+        image[top : top + height, left : left + width] = rng.integers(0, 256, 3)
+    # a segment with a hole, which refinement fills
+    image[20:80, 20:80] = (1, 2, 3)
+    image[40:60, 40:60] = (4, 5, 6)
+    return Image.fromarray(image)
+
+
+def test_label_map(segmented_image: Image.Image) -> None:
+    """Test that the label map matches the per-color masks of the segmented image."""
+    image = np.array(segmented_image)
+    colors = np.unique(image.reshape(-1, 3), axis=0)
+    label_map = vision.get_label_map(segmented_image)
+
+    assert len(label_map) == len(colors)
+    assert (label_map.colors == colors).all()
+    for label, color in enumerate(colors):
+        expected_mask = np.all(image == color, axis=-1)
+        mask = label_map.get_mask(label)
+        assert (mask.to_array() == expected_mask).all()
+        assert mask.area == label_map.areas[label] == expected_mask.sum()
+        assert mask.data.shape == mask.tighten().data.shape
+
+    masks = vision.get_masks_from_segmented_image(segmented_image, sort_by_area=True)
+    areas = [mask.sum() for mask in masks]
+    assert areas == sorted(areas, reverse=True)
+
+
+def test_refine_masks__label_map(segmented_image: Image.Image) -> None:
+    """Test that refining a label map matches refining full-frame masks."""
+    original_image = Image.fromarray(
+        np.random.randint(0, 256, (200, 300, 3), dtype=np.uint8)
+    )
+    masks = vision.get_masks_from_segmented_image(segmented_image)
+    label_map = vision.get_label_map(segmented_image)
+
+    refined_masks = vision.refine_masks(masks)
+    refined_cropped_masks = vision.refine_masks(label_map)
+    assert refined_masks
+    assert len(refined_masks) == len(refined_cropped_masks)
+    for mask, cropped_mask in zip(refined_masks, refined_cropped_masks):
+        assert isinstance(cropped_mask, vision.CroppedMask)
+        assert (mask == cropped_mask.to_array()).all()
+
+    masked_images = vision.extract_masked_images(original_image, refined_masks)
+    cropped_masked_images = vision.extract_masked_images(
+        original_image, refined_cropped_masks
+    )
+    for image, cropped_image in zip(masked_images, cropped_masked_images):
+        assert (np.array(image) == np.array(cropped_image)).all()
+
+    assert vision.calculate_bounding_boxes(
+        refined_masks
+    ) == vision.calculate_bounding_boxes(refined_cropped_masks)
+    assert vision.calculate_bounding_boxes(masks) == vision.calculate_bounding_boxes(
+        label_map
+    )
+
+
+def test_remove_contained_masks() -> None:
+    """Test that pruned containment checks match checking all pairs of masks."""
+    segmented_image = synthetic.get_segmented_image((320, 240), num_segments=100)
+    masks = [
+        binary_fill_holes(mask).astype(np.uint8)
+        for mask in vision.get_masks_from_segmented_image(segmented_image)
+    ]
+    # identical masks are contained in each other
+    masks.append(masks[-1].copy())
+
+    expected_masks = [
+        mask_i
+        for i, mask_i in enumerate(masks)
+        if not any(
+            i != j and np.array_equal(mask_i & mask_j, mask_i)
+            for j, mask_j in enumerate(masks)
+        )
+    ]
+    remaining_masks = vision.remove_contained_masks(masks)
+    assert 0 < len(expected_masks) < len(masks) - 2
+    assert len(remaining_masks) == len(expected_masks)
+    for mask, expected_mask in zip(remaining_masks, expected_masks):
+        assert (mask == expected_mask).all()
+
+
+def test_batch_image_similarity(identical_images: list[Image.Image]) -> None:
+    """Test that batch SSIM matches skimage's SSIM on the same arrays."""
+    images = identical_images[:1] + [
+        Image.fromarray(np.random.randint(0, 256, (100, 100, 3), dtype=np.uint8))
+        for _ in range(3)
+    ]
+    arrays = np.stack([vision.get_ssim_array(image) for image in images])
+    ssims, ssim_images = vision.get_batch_image_similarity(arrays[0], arrays)
+    assert ssim_images.shape == arrays.shape
+    for array, s_ssim in zip(arrays, ssims):
+        assert s_ssim == pytest.approx(
+            ssim(arrays[0], array, win_size=7, data_range=255), abs=1e-5
+        )
+
+
+def test_image_index() -> None:
+    """Test that the image index prunes dissimilar images before computing SSIM."""
+    images = [
+        Image.open(io.BytesIO(png_data))
+        for png_data in synthetic.get_screenshot_png_datas((320, 240))
+    ]
+    index = vision.ImageIndex()
+    for image in images:
+        index.add(image)
+
+    query_image = images[3].resize((300, 220))
+    idxs, ssims, ssim_images = index.query(query_image, min_ssim=0.9)
+    assert list(idxs) == [3]
+    assert ssims[0] > 0.9
+    assert ssim_images.shape == (1, vision.SSIM_SIZE, vision.SSIM_SIZE)
+    assert index.stats["num_queries"] == 1
+    assert index.stats["num_candidates"] == len(images)
+    assert index.stats["num_pruned"] > 0
+    assert index.stats["num_compared"] <= vision.SIMILARITY_TOP_K
+    assert (
+        vision.get_hash_distances(vision.get_phash(query_image), index.phashes).argmin()
+        == 3
+    )
+
+    index.remove(0)
+    assert len(index) == len(images) - 1
+    assert list(index.query(query_image, min_ssim=0.9)[0]) == [2]
+    index.add(images[0])
+    assert list(index.query(images[0], min_ssim=0.9)[0]) == [len(images) - 1]
+
+
+def extract_masked_images_full_frame(
+    original_image: Image.Image, masks: list[np.ndarray]
+) -> list[Image.Image]:
+    """Extract masked images as vision.extract_masked_images did on full frames."""
+    original_image_np = np.array(original_image)
+    masked_images = []
+    for mask in masks:
+        rows = np.any(mask, axis=1)
+        cols = np.any(mask, axis=0)
+        rmin, rmax = np.where(rows)[0][[0, -1]]
+        cmin, cmax = np.where(cols)[0][[0, -1]]
+        cropped_mask = mask[rmin : rmax + 1, cmin : cmax + 1]
+        cropped_image = original_image_np[rmin : rmax + 1, cmin : cmax + 1]
+        masked_image = np.where(cropped_mask[:, :, None], cropped_image, 0)
+        masked_images.append(Image.fromarray(masked_image.astype(np.uint8)))
+    return masked_images
+
+
+def calculate_bounding_boxes_full_frame(
+    masks: list[np.ndarray],
+) -> tuple[list[dict[str, float]], list[tuple[float, float]]]:
+    """Calculate bounding boxes as calculate_bounding_boxes did on full frames."""
+    bounding_boxes = []
+    centroids = []
+    for mask in masks:
+        rows, cols = np.where(mask)
+        if len(rows) == 0:
+            bounding_boxes.append({})
+            centroids.append((float("nan"), float("nan")))
+            continue
+        top, left = rows.min(), cols.min()
+        height, width = rows.max() - top, cols.max() - left
+        bounding_boxes.append(
+            {
+                "top": float(top),
+                "left": float(left),
+                "height": float(height),
+                "width": float(width),
+            }
+        )
+        centroids.append((float(left + width / 2), float(top + height / 2)))
+    return bounding_boxes, centroids
+
+
+@pytest.mark.parametrize("num_workers", [1, 4])
+def test_extract_masked_images__full_frame(
+    segmented_image: Image.Image, num_workers: int
+) -> None:
+    """Test that parallel, cropped extraction matches the full-frame implementation."""
+    original_image = Image.fromarray(
+        np.random.randint(0, 256, (200, 300, 3), dtype=np.uint8)
+    )
+    label_map = vision.get_label_map(segmented_image)
+    refined_masks = vision.refine_masks(label_map)
+    for masks in (label_map, refined_masks):
+        full_frame_masks = [np.asarray(mask) for mask in vision.to_cropped_masks(masks)]
+        expected_images = extract_masked_images_full_frame(
+            original_image, full_frame_masks
+        )
+        for masks_arg in (masks, full_frame_masks):
+            masked_images = vision.extract_masked_images(
+                original_image, masks_arg, chunk_size=3, num_workers=num_workers
+            )
+            assert len(masked_images) == len(expected_images)
+            for image, expected_image in zip(masked_images, expected_images):
+                assert image.size == expected_image.size
+                assert np.array_equal(np.array(image), np.array(expected_image))
+
+
+@pytest.mark.parametrize("num_workers", [1, 4])
+def test_calculate_bounding_boxes__full_frame(
+    segmented_image: Image.Image, num_workers: int
+) -> None:
+    """Test that parallel, cropped bounding boxes match the full-frame version."""
+    label_map = vision.get_label_map(segmented_image)
+    masks = [np.asarray(mask) for mask in vision.to_cropped_masks(label_map)]
+    masks.append(np.zeros_like(masks[0]))
+    expected_bounding_boxes, expected_centroids = calculate_bounding_boxes_full_frame(
+        masks
+    )
+    # the label map has no empty mask
+    for masks_arg, num_masks in ((label_map, len(masks) - 1), (masks, len(masks))):
+        bounding_boxes, centroids = vision.calculate_bounding_boxes(
+            masks_arg, chunk_size=3, num_workers=num_workers
+        )
+        assert bounding_boxes == expected_bounding_boxes[:num_masks]
+        np.testing.assert_array_equal(centroids, expected_centroids[:num_masks])
+
+
+def test_merge_masks() -> None:
+    """Test that only masks in changed tiles are replaced by re-segmented ones."""
+    shape = (256, 256)
+
+    def get_mask(top: int, left: int, bottom: int, right: int) -> vision.CroppedMask:
+        mask = np.zeros(shape, dtype=np.uint8)
+        mask[top:bottom, left:right] = 1
+        return vision.CroppedMask.from_array(mask)
+
+    changed = np.zeros(shape, dtype=bool)
+    changed[150:160, 150:160] = True
+    dirty_tiles = vision.get_dirty_tiles(changed, tile_size=64)
+    assert dirty_tiles.shape == (4, 4)
+    assert np.argwhere(dirty_tiles).tolist() == [[2, 2]]
+    regions = vision.get_dirty_regions(dirty_tiles, shape, tile_size=64)
+    assert regions == [(64, 64, 256, 256)]
+
+    masks = [
+        get_mask(10, 10, 30, 30),  # unchanged
+        get_mask(140, 140, 180, 180),  # changed
+        get_mask(100, 200, 120, 250),  # unchanged, within the region
+    ]
+    new_masks = [
+        get_mask(145, 145, 185, 185),
+        get_mask(100, 200, 120, 250),
+        get_mask(200, 70, 210, 80),
+    ]
+    kept_idxs, kept_new_masks = vision.merge_masks(
+        masks, new_masks, dirty_tiles, regions, tile_size=64
+    )
+    assert kept_idxs == [0, 2]
+    assert [mask.bbox for mask in kept_new_masks] == [(145, 145, 185, 185)]
+
+
 if __name__ == "__main__":
     pytest.main()